@@ -0,0 +1,70 @@
+"""
+Measures recall@k against exact (flat) search and per-query latency for each vector index type.
+
+Uses synthetic, clustered and normalized vectors (log entries embed into tight clusters of near-identical lines), so no
+embedding model is needed.
+
+Usage:
+    python benchmarks/bench_ann_index.py [--num-vectors 200000] [--dimension 384] [--k 10]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from loguru.core.ann_index import build_index
+from loguru.core.models.config import VectorIndex
+
+
+def _synthetic_vectors(num_vectors: int, dimension: int, num_clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, num_clusters, num_vectors)]
+    vectors += 0.3 * rng.standard_normal((num_vectors, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _search(index, queries: np.ndarray, k: int) -> (np.ndarray, list):
+    results, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start_time)
+        results.append(ids[0])
+    return np.array(results), latencies
+
+
+def _recall(results: np.ndarray, ground_truth: np.ndarray) -> float:
+    hits = sum(len(set(r) & set(g)) for r, g in zip(results, ground_truth))
+    return hits / ground_truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector index recall/latency benchmark")
+    parser.add_argument('--num-vectors', type=int, default=200000, help='Number of indexed vectors')
+    parser.add_argument('--dimension', type=int, default=384, help='Vector dimension (384 for all-MiniLM-L6-v2)')
+    parser.add_argument('--num-queries', type=int, default=500, help='Number of queries')
+    parser.add_argument('--num-clusters', type=int, default=2000, help='Number of synthetic clusters')
+    parser.add_argument('--k', type=int, default=10, help='Number of neighbours per query')
+    parser.add_argument('--types', default='flat,ivf,ivfpq,hnsw,hnswpq', help='Comma separated index types')
+    args = parser.parse_args()
+
+    vectors = _synthetic_vectors(args.num_vectors, args.dimension, args.num_clusters)
+    queries = _synthetic_vectors(args.num_queries, args.dimension, args.num_clusters, seed=1)
+    ground_truth = None
+    print(f"{'type':>8} {'build (s)':>10} {'recall@' + str(args.k):>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for index_type in ['flat'] + [t for t in args.types.split(',') if t != 'flat']:
+        start_time = time.time()
+        index = build_index(VectorIndex(type=index_type), vectors)
+        build_time = time.time() - start_time
+        results, latencies = _search(index, queries, args.k)
+        if ground_truth is None:
+            ground_truth = results
+        latencies_ms = np.array(latencies) * 1000
+        print(f"{index_type:>8} {build_time:>10.2f} {_recall(results, ground_truth):>10.3f} "
+              f"{np.percentile(latencies_ms, 50):>10.3f} {np.percentile(latencies_ms, 99):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Measures the ingest-to-searchable lag of follow mode (`loguru scan --follow`) while log lines are written at a steady
+rate, with the log file rotated every --rotate-every lines.
+
+A writer thread appends timestamped log lines, a `LogFollower` indexes them in the background and a separate reader
+engine (memory-mapped, as a `loguru run` session or another process would) checks every --check-interval seconds which
+lines are searchable. The lag of a line is the time from it being written to the reader finding it. The reader also
+times a search against the index while it is updated, to show that queries are not blocked.
+
+Runs against a temporary HOME, so the real index is left alone. Uses deterministic fake embeddings unless
+--embedding-model is given, to measure the indexing pipeline rather than the embedding model.
+
+Usage:
+    python benchmarks/bench_follow.py [--rate 2000] [--duration 30] [--rotate-every 20000] [--no-inotify]
+        [--embedding-model all-MiniLM-L6-v2]
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# LOGURU_DATA_DIR is derived from HOME when loguru is imported
+_HOME = tempfile.mkdtemp(prefix='loguru-bench-home-')
+os.environ['HOME'] = _HOME
+
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+from loguru.core.embeddings import load_embedding_model  # noqa: E402
+from loguru.core.fs_log_rag import LoguruRAG  # noqa: E402
+from loguru.core.log_follower import FollowBatch, LogFollower  # noqa: E402
+from loguru.core.models.config import Config  # noqa: E402
+
+PATTERN = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
+_SEQ = re.compile(r'seq=(\d+) ')
+
+
+def _bench_config(log_dir: str, model: str, use_inotify: bool) -> Config:
+    return Config(**{
+        "service": "ollama",
+        "ollama": {"hosts": ["http://localhost:11434/"], "llm_name": "mistral", "embedding_model_name": model,
+                   "options": {"temperature": 0.1}},
+        "gemini": None, "openai": None, "anthropic": None,
+        "num_chunks_to_return": 10,
+        "embedding_cache": {"enabled": False},
+        "answer_cache": {"enabled": False},
+        "follow": {"use_inotify": use_inotify},
+        "data_sources": [{"type": "filesystem", "ds_params": {
+            "recursion_depth": 0, "file_size_limit": "1GB",
+            "scan_locations": [{"location": log_dir, "pattern": PATTERN}]}}]
+    })
+
+
+def _write_logs(log_dir: str, rate: float, duration: float, rotate_every: int, write_times: list,
+                stopped: threading.Event):
+    """
+    Appends `rate` lines per second in chunks of 10 ms, recording when each line was written.
+    """
+    path = os.path.join(log_dir, 'app.log')
+    log_file = open(path, 'a')
+    start_time = time.time()
+    seq = 0
+    while not stopped.is_set() and time.time() - start_time < duration:
+        due = int((time.time() - start_time) * rate)
+        lines = []
+        while seq < due:
+            lines.append(f"2024-06-14T11:{seq // 60000 % 60:02d}:{seq // 1000 % 60:02d}.{seq % 1000:03d}+05:30  INFO "
+                         f"[app-service] 7331 --- [worker-{seq % 8}] c.i.o.OrderService : seq={seq} processed order "
+                         f"{seq * 7919 % 100000} for customer {seq % 977} in {seq % 250} ms\n")
+            seq += 1
+            if seq % rotate_every == 0:
+                log_file.write(''.join(lines))
+                log_file.close()
+                lines = []
+                rotated = f"{path}.{seq // rotate_every}"
+                os.rename(path, rotated)
+                log_file = open(path, 'a')
+        log_file.write(''.join(lines))
+        log_file.flush()
+        now = time.time()
+        write_times.extend([now] * (seq - len(write_times)))
+        time.sleep(0.01)
+    log_file.close()
+
+
+def _newest_visible(rag: LoguruRAG, checked: set) -> int:
+    """
+    :param checked: IDs of the shards already checked, the shards checked now are added
+    :return: the newest line among the shards not checked before
+    """
+    vectorstore = rag._get_vectorstore()
+    newest = -1
+    # shards are immutable, new lines only ever appear in new shards
+    for entry in vectorstore.shards():
+        if entry.shard_id in checked:
+            continue
+        checked.add(entry.shard_id)
+        docstore = vectorstore.shard(entry).docstore
+        for position in range(len(docstore)):
+            match = _SEQ.search(docstore.text_at(position))
+            if match is not None:
+                newest = max(newest, int(match.group(1)))
+    return newest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow mode lag benchmark")
+    parser.add_argument('--rate', type=float, default=2000.0, help='Log lines written per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to write for')
+    parser.add_argument('--rotate-every', type=int, default=20000, help='Rotate the log file every N lines')
+    parser.add_argument('--check-interval', type=float, default=0.1, help='Seconds between reader checks')
+    parser.add_argument('--no-inotify', action='store_true', help='Poll for changes instead of using inotify')
+    parser.add_argument('--embedding-model', default=None, help='Embedding model, fake embeddings if not set')
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix='loguru-bench-logs-')
+    try:
+        config = _bench_config(log_dir, args.embedding_model or 'fake', use_inotify=not args.no_inotify)
+        embedding_model = load_embedding_model(args.embedding_model) if args.embedding_model else \
+            DeterministicFakeEmbedding(size=384)
+        batches = []
+        follower = LogFollower(config=config, embedding_model=embedding_model, on_batch=batches.append)
+        reader = LoguruRAG(config=config, embedding_model=embedding_model)
+
+        write_times, stopped = [], threading.Event()
+        writer = threading.Thread(target=_write_logs, args=(log_dir, args.rate, args.duration, args.rotate_every,
+                                                            write_times, stopped))
+        follower_thread = threading.Thread(target=follower.run)
+        writer.start()
+        follower_thread.start()
+
+        lags, search_times = [], []
+        newest, checked = -1, set()
+        deadline = time.time() + args.duration + 30
+        try:
+            while time.time() < deadline:
+                time.sleep(args.check_interval)
+                try:
+                    visible = _newest_visible(reader, checked)
+                except (OSError, RuntimeError):
+                    # no index saved yet
+                    continue
+                now = time.time()
+                if visible > newest:
+                    lags.extend(now - t for t in write_times[newest + 1:visible + 1])
+                    newest = visible
+                    start_time = time.time()
+                    reader.search("order processed for customer", k=10)
+                    search_times.append(time.time() - start_time)
+                if not writer.is_alive() and newest >= len(write_times) - 1:
+                    break
+        finally:
+            stopped.set()
+            follower.stop()
+            writer.join()
+            follower_thread.join()
+
+        written = len(write_times)
+        print(f"Wrote {written} lines in {args.duration:.0f} seconds ({args.rate:.0f} lines/sec, rotated every "
+              f"{args.rotate_every}), {'polling' if args.no_inotify else 'inotify'}.")
+        print(f"Searchable: {newest + 1} lines. Lag: median {statistics.median(lags):.2f} s, "
+              f"p95 {sorted(lags)[int(len(lags) * 0.95)]:.2f} s, max {max(lags):.2f} s.")
+        _print_batches(batches)
+        if len(search_times) > 0:
+            print(f"Reader search while following: median {statistics.median(search_times) * 1000:.1f} ms, "
+                  f"max {max(search_times) * 1000:.1f} ms.")
+        sys.exit(0 if newest + 1 == written else 1)
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+        shutil.rmtree(_HOME, ignore_errors=True)
+
+
+def _print_batches(batches: [FollowBatch]):
+    if len(batches) == 0:
+        return
+    entries = [b.entries_added for b in batches]
+    print(f"{len(batches)} batches: median {statistics.median(entries):.0f} entries, median scan "
+          f"{statistics.median(b.scan_time for b in batches):.2f} s, max scan {max(b.scan_time for b in batches):.2f} "
+          f"s, {sum(b.entries_removed for b in batches)} entries removed on rotation.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Measures hit rate and latency of vector, keyword (BM25), hybrid (reciprocal rank fusion) and, with --rerank-model,
+reranked hybrid retrieval on labelled Loghub-style logs.
+
+Loghub (https://github.com/logpai/loghub) structured logs (`*_structured.csv` files, with `Level`, `Component`,
+`Content` and `EventId` columns) can be passed with --loghub. Otherwise HDFS-like logs labelled with their event are
+generated.
+
+Queries either ask about an identifier (a block id, answered by the entries that contain it) or about an event (its
+template with the parameters left out, answered by the entries of that event). hit@k is the share of queries with a
+relevant entry in the top k, MRR the mean reciprocal rank of the first relevant entry.
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py [--loghub HDFS_2k.log_structured.csv] [--num-entries 20000] [--k 10]
+        [--embedding-model all-MiniLM-L6-v2] [--rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2]
+"""
+import argparse
+import csv
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from loguru.core.embeddings import load_embedding_model
+from loguru.core.rerankers import CrossEncoderReranker
+from loguru.core.retrievers import HybridRetriever, LogFilterRetriever
+from loguru.core.vector_store import LogVectorStore
+from log_generator import HDFS_EVENT_WEIGHTS, HDFS_EVENTS
+
+_ID_TOKEN = re.compile(r'\b(?=\S*\d)[\w.$:-]{6,}\b')
+
+
+def _synthetic_logs(num_entries: int, seed: int = 0) -> (list, list, dict):
+    rng = random.Random(seed)
+    blocks = [f"blk_{'-' if rng.random() < 0.5 else ''}{rng.getrandbits(62)}" for _ in range(num_entries // 8 + 1)]
+    texts, events = [], []
+    for i in range(num_entries):
+        event_id, level, component, template = rng.choices(HDFS_EVENTS, weights=HDFS_EVENT_WEIGHTS)[0]
+        content = template.format(blk=rng.choice(blocks), ip=f"10.251.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                                  port=rng.randint(40000, 60000), size=rng.randint(1, 67108864),
+                                  n=rng.randint(0, 63), task=f"200811092030_{rng.randint(1, 9999):04d}_m_{i:06d}_0")
+        texts.append(f"081109 {203615 + i // 100} {rng.randint(1, 999)} {level} {component}: {content}")
+        events.append(event_id)
+    templates = {event_id: template for event_id, _, _, template in HDFS_EVENTS}
+    return texts, events, templates
+
+
+def _loghub_logs(path: str, num_entries: int) -> (list, list, dict):
+    texts, events, templates = [], [], {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            texts.append(f"{row.get('Level', '')} {row.get('Component', '')}: {row['Content']}".strip())
+            events.append(row['EventId'])
+            templates[row['EventId']] = row.get('EventTemplate', '')
+            if len(texts) >= num_entries:
+                break
+    return texts, events, templates
+
+
+def _queries(texts: list, events: list, templates: dict, num_queries: int, seed: int = 0) -> list:
+    """
+    :return: (kind, query, relevant line numbers) triples
+    """
+    rng = random.Random(seed)
+    entries_by_id = defaultdict(set)
+    for line, text in enumerate(texts):
+        for identifier in set(_ID_TOKEN.findall(text)):
+            entries_by_id[identifier].add(line)
+    # identifiers that pin down a handful of entries, like a block or request id
+    identifiers = sorted(i for i, lines in entries_by_id.items() if 1 <= len(lines) <= 20)
+    queries = [('identifier', f"What happened to {identifier}?", entries_by_id[identifier])
+               for identifier in rng.sample(identifiers, min(num_queries, len(identifiers)))]
+
+    lines_by_event = defaultdict(set)
+    for line, event_id in enumerate(events):
+        lines_by_event[event_id].add(line)
+    for event_id in sorted(lines_by_event):
+        description = re.sub(r'\s+', ' ', re.sub(r'\{\w+}|<\*>|[/:]', ' ', templates.get(event_id, ''))).strip()
+        if description != '':
+            queries.append(('event', description, lines_by_event[event_id]))
+    return queries
+
+
+def _build_store(texts: list, embedding_model, directory: str) -> LogVectorStore:
+    start_time = time.time()
+    embeddings = embedding_model.embed_documents(texts)
+    vectorstore = LogVectorStore.from_embeddings(list(zip(texts, embeddings)), embedding_model,
+                                                 metadatas=[{'offset': line} for line in range(len(texts))])
+    vectorstore.save_local(directory)
+    print(f"Indexed {len(texts)} entries in {time.time() - start_time:.1f} seconds.")
+    return LogVectorStore.load_local(directory, embedding_model)
+
+
+def _keyword_lines(vectorstore: LogVectorStore, query: str, k: int) -> list:
+    positions, _ = vectorstore.keyword_search_positions(query, k)
+    return [vectorstore.docstore.document(int(p)).metadata['offset'] for p in positions]
+
+
+def _evaluate(name: str, search, queries: list, k: int):
+    stats = defaultdict(lambda: {'hit@1': [], f"hit@{k}": [], 'mrr': [], 'latency': []})
+    for kind, query, relevant in queries:
+        start_time = time.perf_counter()
+        lines = search(query)
+        latency = time.perf_counter() - start_time
+        ranks = [rank for rank, line in enumerate(lines[:k]) if line in relevant]
+        for group in (kind, 'all'):
+            stats[group]['hit@1'].append(len(ranks) > 0 and ranks[0] == 0)
+            stats[group][f"hit@{k}"].append(len(ranks) > 0)
+            stats[group]['mrr'].append(1 / (ranks[0] + 1) if len(ranks) > 0 else 0)
+            stats[group]['latency'].append(latency)
+    for group in sorted(stats):
+        s = stats[group]
+        latencies = np.array(s['latency']) * 1000
+        print(f"{name:<16} {group:<11} {len(latencies):>7} {np.mean(s['hit@1']):>7.3f} {np.mean(s[f'hit@{k}']):>7.3f} "
+              f"{np.mean(s['mrr']):>7.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid retrieval benchmark")
+    parser.add_argument('--loghub', help='Loghub structured log (CSV) to use instead of generated HDFS-like logs')
+    parser.add_argument('--num-entries', type=int, default=20000, help='Number of log entries')
+    parser.add_argument('--num-queries', type=int, default=200, help='Number of identifier queries')
+    parser.add_argument('--k', type=int, default=10, help='Number of entries to retrieve')
+    parser.add_argument('--candidates', type=int, default=100,
+                        help='Number of vector and keyword candidates fused by the hybrid retriever')
+    parser.add_argument('--embedding-model', default='all-MiniLM-L6-v2', help='Embedding model')
+    parser.add_argument('--rerank-model', help='Cross-encoder model to also benchmark reranking with')
+    parser.add_argument('--rerank-candidates', type=int, default=30, help='Number of fused entries to rerank')
+    args = parser.parse_args()
+
+    if args.loghub:
+        texts, events, templates = _loghub_logs(args.loghub, args.num_entries)
+    else:
+        texts, events, templates = _synthetic_logs(args.num_entries)
+    queries = _queries(texts, events, templates, args.num_queries)
+    embedding_model = load_embedding_model(args.embedding_model)
+
+    with tempfile.TemporaryDirectory() as directory:
+        vectorstore = _build_store(texts, embedding_model, directory)
+        retrievers = {
+            'vector': LogFilterRetriever(vectorstore=vectorstore, k=args.k, infer_filters=False),
+            'hybrid': HybridRetriever(vectorstore=vectorstore, k=args.k, infer_filters=False,
+                                      vector_candidates=args.candidates, keyword_candidates=args.candidates),
+        }
+        if args.rerank_model:
+            retrievers['hybrid+rerank'] = HybridRetriever(
+                vectorstore=vectorstore, k=args.k, infer_filters=False, vector_candidates=args.candidates,
+                keyword_candidates=args.candidates, reranker=CrossEncoderReranker(args.rerank_model),
+                rerank_candidates=args.rerank_candidates)
+
+        print(f"{'Retriever':<16} {'Queries':<11} {'Count':>7} {'hit@1':>7} {f'hit@{args.k}':>7} {'MRR':>7} "
+              f"{'p50 ms':>8} {'p99 ms':>8}")
+        _evaluate('keyword', lambda q: _keyword_lines(vectorstore, q, args.k), queries, args.k)
+        for name, retriever in retrievers.items():
+            _evaluate(name, lambda q: [d.metadata['offset'] for d in retriever.invoke(q)], queries, args.k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Compares the legacy per-file index build (load embedding model, load index, append, save for every file) with the
+single-pass batched build done by `IndexBuilder`.
+
+Usage:
+    python benchmarks/bench_index_build.py --log-dir /path/to/logs [--batch-size 512]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from langchain_community.vectorstores import FAISS
+
+from loguru.core.fs_log_rag import LoguruRAG
+from loguru.core.index_builder import IndexBuilder
+from loguru.core.models.config import Config
+
+DEFAULT_PATTERN = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
+
+
+def _bench_config(log_dir: str, pattern: str, model: str, batch_size: int) -> Config:
+    return Config(**{
+        "service": "ollama",
+        "ollama": {
+            "hosts": ["http://localhost:11434/"],
+            "llm_name": "mistral",
+            "embedding_model_name": model,
+            "options": {"temperature": 0.1}
+        },
+        "gemini": None,
+        "openai": None,
+        "anthropic": None,
+        "num_chunks_to_return": 10,
+        "indexing": {"embedding_batch_size": batch_size},
+        "data_sources": [{
+            "type": "filesystem",
+            "ds_params": {
+                "recursion_depth": 0,
+                "file_size_limit": "1GB",
+                "scan_locations": [{"location": log_dir, "pattern": pattern}]
+            }
+        }]
+    })
+
+
+def _log_files(log_dir: str) -> [str]:
+    return [os.path.join(log_dir, f) for f in sorted(os.listdir(log_dir)) if os.path.isfile(os.path.join(log_dir, f))]
+
+
+def bench_legacy(rag: LoguruRAG, log_dir: str, pattern: str, out_dir: str) -> (int, float):
+    num_docs = 0
+    start_time = time.time()
+    for log_file_path in _log_files(log_dir):
+        embedding_model = rag._load_embedding_model(model_name=rag._embedding_model_name)
+        documents = list(rag._parse_log_file(log_file_path=log_file_path, pattern_to_split_log_lines=pattern))
+        num_docs += len(documents)
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+            vectorstore = FAISS.from_documents(documents, embedding_model)
+        else:
+            vectorstore = FAISS.load_local(out_dir, embedding_model, allow_dangerous_deserialization=True)
+            vectorstore.add_documents(documents)
+        vectorstore.save_local(out_dir)
+    return num_docs, time.time() - start_time
+
+
+def bench_batched(rag: LoguruRAG, log_dir: str, pattern: str, out_dir: str, batch_size: int) -> (int, float):
+    start_time = time.time()
+    builder = IndexBuilder(
+        embedding_model=rag._load_embedding_model(model_name=rag._embedding_model_name),
+        vector_store_directory=out_dir,
+        batch_size=batch_size
+    )
+    for log_file_path in _log_files(log_dir):
+        builder.add_documents(rag._parse_log_file(log_file_path=log_file_path, pattern_to_split_log_lines=pattern))
+    builder.save()
+    return builder.num_documents, time.time() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index build benchmark")
+    parser.add_argument('--log-dir', required=True, help='Directory of log files to index')
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN, help='Pattern to split log entries')
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help='Embedding model name')
+    parser.add_argument('--batch-size', type=int, default=512, help='Embedding batch size')
+    parser.add_argument('--skip-legacy', action='store_true', help='Only run the batched build')
+    args = parser.parse_args()
+
+    rag = LoguruRAG(config=_bench_config(args.log_dir, args.pattern, args.model, args.batch_size))
+    work_dir = tempfile.mkdtemp(prefix='loguru-bench-')
+    try:
+        results = {}
+        if not args.skip_legacy:
+            results['legacy'] = bench_legacy(rag, args.log_dir, args.pattern, os.path.join(work_dir, 'legacy'))
+        results['batched'] = bench_batched(rag, args.log_dir, args.pattern, os.path.join(work_dir, 'batched'),
+                                           args.batch_size)
+        for name, (num_docs, elapsed) in results.items():
+            print(f"{name:>8}: {num_docs} docs in {round(elapsed, 2)}s "
+                  f"({round(num_docs / max(elapsed, 1e-9), 2)} docs/sec)")
+        if 'legacy' in results:
+            print(f" speedup: {round(results['legacy'][1] / max(results['batched'][1], 1e-9), 2)}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares opening a pickled LangChain FAISS store with opening the memory-mapped `LogVectorStore`, and the time of a
+top-k search on each.
+
+Uses synthetic log entries and random vectors, so no embedding model is needed.
+
+Usage:
+    python benchmarks/bench_index_load.py [--num-entries 500000] [--dimension 384]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import FakeEmbeddings
+
+from loguru.core.vector_store import LogVectorStore
+
+
+def _synthetic_entries(num_entries: int, dimension: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_entries, dimension)).astype(np.float32)
+    texts = [f"2024-06-14T11:00:{i % 60:02d}.000+05:30 INFO [svc] c.i.Http : GET /api/orders/{i} 200 in {i % 500} ms"
+             for i in range(num_entries)]
+    metadatas = [{'log_dir': '/var/log/svc', 'file_name': f"svc-{i % 30}.log", 'offset': i * 96}
+                 for i in range(num_entries)]
+    ids = [f"bench:0:{i}" for i in range(num_entries)]
+    return texts, vectors, metadatas, ids
+
+
+def _time_load_and_search(load, query: np.ndarray, k: int) -> (float, float):
+    start_time = time.time()
+    vectorstore = load()
+    load_time = time.time() - start_time
+    start_time = time.time()
+    vectorstore.similarity_search_with_score_by_vector(query.tolist(), k=k)
+    return load_time, time.time() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store load benchmark")
+    parser.add_argument('--num-entries', type=int, default=500000, help='Number of indexed log entries')
+    parser.add_argument('--dimension', type=int, default=384, help='Vector dimension')
+    parser.add_argument('--k', type=int, default=10, help='Number of entries to retrieve')
+    args = parser.parse_args()
+
+    texts, vectors, metadatas, ids = _synthetic_entries(args.num_entries, args.dimension)
+    embeddings = FakeEmbeddings(size=args.dimension)
+    work_dir = tempfile.mkdtemp(prefix='loguru-bench-')
+    try:
+        pickled_dir, columnar_dir = os.path.join(work_dir, 'pickled'), os.path.join(work_dir, 'columnar')
+        text_embeddings = list(zip(texts, vectors.tolist()))
+        FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids).save_local(pickled_dir)
+        LogVectorStore.from_embeddings(text_embeddings, embeddings, metadatas=metadatas,
+                                       ids=ids).save_local(columnar_dir)
+        del text_embeddings
+
+        results = {
+            'pickled': _time_load_and_search(
+                lambda: FAISS.load_local(pickled_dir, embeddings, allow_dangerous_deserialization=True),
+                vectors[0], args.k),
+            'columnar': _time_load_and_search(
+                lambda: LogVectorStore.load_local(columnar_dir, embeddings), vectors[0], args.k)
+        }
+        for name, (load_time, search_time) in results.items():
+            print(f"{name:>9}: load {round(load_time * 1000, 1)} ms, first search {round(search_time * 1000, 1)} ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares answering questions through an Ollama host pool with picking one host at random per session, against local
+stub servers (see ollama_stub.py): a fast host, a slow host, a host that fails half of its requests and a host that is
+down.
+
+Reports for each strategy how many questions were answered, latency percentiles, throughput and how the requests
+were spread over the hosts.
+
+Usage:
+    python benchmarks/bench_ollama_pool.py [--questions 200] [--concurrency 8] [--fast-delay 0.05] [--slow-delay 1]
+"""
+import argparse
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_community.chat_models import ChatOllama
+
+from loguru.core.ollama_pool import OllamaHostPool, PooledChatOllama
+from ollama_stub import OllamaStubServer
+
+
+def _unused_url() -> str:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def _run(name: str, ask, num_questions: int, concurrency: int, servers: dict):
+    for server in servers.values():
+        server.requests = 0
+
+    def _timed(i: int):
+        start_time = time.perf_counter()
+        try:
+            ask(i)
+            return time.perf_counter() - start_time
+        except Exception:
+            return None
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(_timed, range(num_questions)))
+    elapsed = time.perf_counter() - start_time
+    latencies = np.array([r for r in results if r is not None]) * 1000
+    spread = ', '.join(f"{host}={server.requests}" for host, server in servers.items())
+    if len(latencies) == 0:
+        print(f"{name:<8} {0:>8} {'-':>8} {'-':>8} {0:>8.1f}   {spread}")
+        return
+    print(f"{name:<8} {len(latencies):>8} {np.percentile(latencies, 50):>8.0f} {np.percentile(latencies, 99):>8.0f} "
+          f"{len(latencies) / elapsed:>8.1f}   {spread}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama host pool benchmark")
+    parser.add_argument('--questions', type=int, default=200, help='Number of questions to ask')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of questions asked at the same time')
+    parser.add_argument('--fast-delay', type=float, default=0.05, help='Seconds the fast hosts take to answer')
+    parser.add_argument('--slow-delay', type=float, default=1.0, help='Seconds the slow host takes to answer')
+    args = parser.parse_args()
+
+    servers = {
+        'fast': OllamaStubServer(delay=args.fast_delay).start(),
+        'slow': OllamaStubServer(delay=args.slow_delay).start(),
+        'flaky': OllamaStubServer(delay=args.fast_delay, error_rate=0.5).start(),
+    }
+    hosts = [server.url for server in servers.values()] + [_unused_url()]
+    print(f"Hosts: {', '.join(f'{name} {server.url}' for name, server in servers.items())}, down {hosts[-1]}")
+
+    options = dict(model='stub', temperature=0, timeout=30)
+    # what LoguruRAG did before: one random host per session, here a session per question
+    random_clients = [ChatOllama(base_url=random.choice(hosts), **options) for _ in range(args.questions)]
+    pooled_client = PooledChatOllama(pool=OllamaHostPool(hosts, connect_timeout=1.0, retry_delay=5.0),
+                                     base_url=hosts[0], **options)
+
+    print(f"{'Strategy':<8} {'Answered':>8} {'p50 ms':>8} {'p99 ms':>8} {'q/s':>8}   Requests per host")
+    _run('random', lambda i: random_clients[i].invoke("What went wrong?"), args.questions, args.concurrency,
+         servers)
+    _run('pool', lambda i: pooled_client.invoke("What went wrong?"), args.questions, args.concurrency, servers)
+    for stats in pooled_client.pool.stats():
+        latency = f"{stats['latency'] * 1000:.0f} ms" if stats['latency'] is not None else '-'
+        print(f"  {stats['url']}: {'healthy' if stats['healthy'] else 'unhealthy'}, {stats['failures']} failures, "
+              f"moving average latency {latency}")
+    for server in servers.values():
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Measures how the sharded index scales: the cost of an incremental scan as the index grows, and the latency of
+unfiltered, time-filtered and location-filtered searches with shards searched by one thread or in parallel.
+
+Synthetic logs of --locations scan locations, each with one log file per day, are indexed --days at a time. After each
+step a fixed batch of --append-lines lines is appended and the incremental scan that picks it up is timed, which stays
+flat when only the new shard is written. Searches then run against the full index.
+
+Runs against a temporary HOME, so the real index is left alone. Uses deterministic fake embeddings unless
+--embedding-model is given, to measure the index rather than the embedding model.
+
+Usage:
+    python benchmarks/bench_shards.py [--locations 4] [--days 14] [--lines-per-day 5000] [--append-lines 1000]
+        [--query-threads 8] [--embedding-model all-MiniLM-L6-v2]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# LOGURU_DATA_DIR is derived from HOME when loguru is imported
+_HOME = tempfile.mkdtemp(prefix='loguru-bench-home-')
+os.environ['HOME'] = _HOME
+
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+from loguru.core.embeddings import load_embedding_model  # noqa: E402
+from loguru.core.fs_log_rag import LoguruRAG  # noqa: E402
+from loguru.core.models.config import Config  # noqa: E402
+from loguru.core.models.log_filter import LogFilter  # noqa: E402
+
+PATTERN = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
+START = datetime(2024, 6, 1, tzinfo=timezone.utc)
+SEVERITIES = ['INFO'] * 6 + ['DEBUG'] * 2 + ['WARN', 'ERROR']
+QUERIES = ["payment declined for customer", "connection refused to inventory service", "order processed in ms",
+           "timeout waiting for lock", "E4021 retry exhausted"]
+
+
+def _bench_config(locations: list, model: str, query_threads: int) -> Config:
+    return Config(**{
+        "service": "ollama",
+        "ollama": {"hosts": ["http://localhost:11434/"], "llm_name": "mistral", "embedding_model_name": model,
+                   "options": {"temperature": 0.1}},
+        "gemini": None, "openai": None, "anthropic": None,
+        "num_chunks_to_return": 10,
+        "embedding_cache": {"enabled": False},
+        "answer_cache": {"enabled": False},
+        "sharding": {"query_threads": query_threads},
+        "data_sources": [{"type": "filesystem", "ds_params": {
+            "recursion_depth": 0, "file_size_limit": "1GB",
+            "scan_locations": [{"location": location, "pattern": PATTERN} for location in locations]}}]
+    })
+
+
+def _write_day(location: str, day: int, lines: int, first_seq: int = 0):
+    t = START + timedelta(days=day)
+    with open(os.path.join(location, f"app-{t.strftime('%Y-%m-%d')}.log"), 'a') as f:
+        for seq in range(first_seq, first_seq + lines):
+            line_time = t + timedelta(milliseconds=seq * 86400000 // (first_seq + lines + 1))
+            severity = SEVERITIES[seq * 7 % len(SEVERITIES)]
+            f.write(f"{line_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}+00:00 {severity:>5} [app-service] 7331 --- "
+                    f"[worker-{seq % 8}] c.i.o.OrderService : order {seq * 7919 % 100000} for customer {seq % 977} "
+                    f"{'processed in %d ms' % (seq % 250) if severity != 'ERROR' else 'failed: E%d' % (seq % 5000)}\n")
+
+
+def _time_queries(rag: LoguruRAG, log_filter: LogFilter, repeat: int) -> float:
+    """
+    :return: median seconds per vector plus keyword search
+    """
+    vectorstore = rag._get_vectorstore()
+    times = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start_time = time.time()
+            vectorstore.search_positions(rag.embedding_model.embed_query(query), 50, log_filter)
+            vectorstore.keyword_search_positions(query, 50, log_filter)
+            times.append(time.time() - start_time)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded index benchmark")
+    parser.add_argument('--locations', type=int, default=4, help='Number of scan locations')
+    parser.add_argument('--days', type=int, default=14, help='Days of logs per scan location')
+    parser.add_argument('--lines-per-day', type=int, default=5000, help='Log lines per scan location and day')
+    parser.add_argument('--append-lines', type=int, default=1000, help='Lines appended before each timed scan')
+    parser.add_argument('--query-threads', type=int, default=8, help='Threads searching shards in parallel')
+    parser.add_argument('--repeat', type=int, default=5, help='Times each query is repeated')
+    parser.add_argument('--embedding-model', default=None, help='Embedding model, fake embeddings if not set')
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix='loguru-bench-logs-')
+    try:
+        locations = [os.path.join(log_dir, f"service-{i}") for i in range(args.locations)]
+        for location in locations:
+            os.makedirs(location)
+        embedding_model = load_embedding_model(args.embedding_model) if args.embedding_model else \
+            DeterministicFakeEmbedding(size=384)
+        model = args.embedding_model or 'fake'
+        rag = LoguruRAG(config=_bench_config(locations, model, args.query_threads), embedding_model=embedding_model)
+
+        print(f"{'index entries':>14} {'shards':>7} {'append scan (s)':>16}")
+        for day in range(args.days):
+            for location in locations:
+                _write_day(location, day, args.lines_per_day)
+            rag.scan(verbose=False)
+            _write_day(locations[0], day, args.append_lines, first_seq=args.lines_per_day)
+            start_time = time.time()
+            rag.scan(verbose=False)
+            scan_time = time.time() - start_time
+            vectorstore = rag._get_vectorstore()
+            print(f"{len(vectorstore):>14} {len(vectorstore.shards()):>7} {scan_time:>16.3f}")
+
+        last_day = START + timedelta(days=args.days - 1)
+        filters = {
+            'unfiltered': LogFilter(),
+            'last day': LogFilter(since=int(last_day.timestamp() * 1000)),
+            'one location': LogFilter(locations=[locations[0]]),
+            'ERROR, last day': LogFilter(severities=['ERROR'], since=int(last_day.timestamp() * 1000)),
+        }
+        readers = {1: LoguruRAG(config=_bench_config(locations, model, 1), embedding_model=embedding_model),
+                   args.query_threads: LoguruRAG(config=_bench_config(locations, model, args.query_threads),
+                                                 embedding_model=embedding_model)}
+        for reader in readers.values():
+            reader._get_vectorstore().preload()
+        print(f"\n{'search':<16} {'shards':>7} " + ' '.join(f"{f'{t} thread(s) (ms)':>18}" for t in readers))
+        for name, log_filter in filters.items():
+            num_shards = len(rag._get_vectorstore().shards(log_filter))
+            latencies = [_time_queries(reader, log_filter, args.repeat) * 1000 for reader in readers.values()]
+            print(f"{name:<16} {num_shards:>7} " + ' '.join(f"{latency:>18.1f}" for latency in latencies))
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+        shutil.rmtree(_HOME, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Startup time regression check for the commands that do not query the logs (`--help`, `show-config`).
+
+Each command is run --runs times in a fresh interpreter and its median wall time (interpreter startup included) is
+compared with --max-ms. One more run with `python -X importtime` lists the slowest top level imports, and fails the
+check if a heavy library (langchain, the LLM clients, FAISS, torch...) was imported: these commands need none of them.
+
+Exits with status 1 if a command is too slow or imports a heavy library, so it can run in CI.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--max-ms 200] [--top 8]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = [['--help'], ['show-config']]
+# libraries the non-query commands must not import, each costs from tens of milliseconds to seconds
+HEAVY_MODULES = ['langchain', 'langchain_core', 'langchain_community', 'langchain_experimental', 'langchain_anthropic',
+                 'langchain_openai', 'langchain_google_genai', 'langchain_huggingface', 'sentence_transformers',
+                 'torch', 'faiss', 'numpy', 'prompt_toolkit', 'requests', 'aiohttp']
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+SAMPLE_CONFIG = {
+    "service": "ollama",
+    "ollama": {"hosts": ["http://localhost:11434/"], "llm_name": "mistral", "embedding_model_name": "all-MiniLM-L6-v2",
+               "options": {"temperature": 0.1}},
+    "gemini": None, "openai": None, "anthropic": None,
+    "num_chunks_to_return": 100,
+    "data_sources": [{"type": "filesystem", "ds_params": {"recursion_depth": 2, "file_size_limit": "100MB",
+                                                          "scan_locations": [{"location": "/var/log",
+                                                                              "pattern": r"^\d{4}-\d{2}-\d{2}"}]}}]
+}
+
+
+def _run(args: list, env: dict, import_time: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (['-X', 'importtime'] if import_time else []) + ['-m', 'loguru.cli'] + args
+    return subprocess.run(command, env=env, capture_output=True, text=True)
+
+
+def _imports(stderr: str) -> list:
+    """
+    :return: (module, cumulative microseconds, depth) of every import, in the order -X importtime reports them
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match is not None and match.group(4) != 'package':
+            imports.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup time benchmark")
+    parser.add_argument('--runs', type=int, default=10, help='Number of timed runs per command')
+    parser.add_argument('--max-ms', type=float, default=200.0, help='Maximum median wall time per command')
+    parser.add_argument('--top', type=int, default=8, help='Number of slowest top level imports to list')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as home:
+        os.makedirs(os.path.join(home, '.loguru'))
+        with open(os.path.join(home, '.loguru', 'config.json'), 'w') as f:
+            json.dump(SAMPLE_CONFIG, f)
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, 'HOME': home,
+               'PYTHONPATH': os.pathsep.join(p for p in (repo_root, os.environ.get('PYTHONPATH')) if p)}
+
+        for command in COMMANDS:
+            name = ' '.join(command)
+            wall_times = []
+            for _ in range(args.runs):
+                start_time = time.perf_counter()
+                result = _run(command, env)
+                wall_times.append((time.perf_counter() - start_time) * 1000)
+                if result.returncode != 0:
+                    print(f"{name}: exited with status {result.returncode}\n{result.stderr}")
+                    sys.exit(1)
+            median = statistics.median(wall_times)
+            imports = _imports(_run(command, env, import_time=True).stderr)
+            heavy = sorted({module.split('.')[0] for module, _, _ in imports} & set(HEAVY_MODULES))
+
+            status = 'ok' if median <= args.max_ms and len(heavy) == 0 else 'FAIL'
+            failed = failed or status == 'FAIL'
+            print(f"loguru {name}: median {median:.0f} ms, min {min(wall_times):.0f} ms over {args.runs} runs "
+                  f"(limit {args.max_ms:.0f} ms), {len(imports)} modules imported: {status}")
+            if len(heavy) > 0:
+                print(f"  imports heavy libraries: {', '.join(heavy)}")
+            top_level = sorted((i for i in imports if i[2] == 0), key=lambda i: -i[1])[:args.top]
+            for module, microseconds, _ in top_level:
+                print(f"  {microseconds / 1000:>8.1f} ms  {module}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
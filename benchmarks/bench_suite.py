@@ -0,0 +1,282 @@
+"""
+Reproducible end-to-end performance benchmark, to compare releases: parses, embeds, indexes and queries synthetic
+logs from log_generator.py (or the logs in --log-dir) and answers questions through a local Ollama stub (see
+ollama_stub.py), so that the results do not depend on a GPU or on what the LLM has to say.
+
+Measured:
+- parse: log entries split and turned into documents, in MB/s and entries/s
+- embed: documents embedded per second, on a sample of --embed-sample entries
+- index: full build time, incremental scan time after appending to a log file, index size on disk and load time
+- search, ask: p50/p99 latency of searching the index and of answering a question end to end, with time to first token
+- rss: peak resident memory after each stage
+
+The results are written as JSON to --output, with the git commit, Python version, platform and parameters of the run.
+With --compare, they are diffed against an earlier results file and the run fails if a metric got worse by more than
+--threshold percent. Runs against a temporary HOME, so the real index is left alone. Uses deterministic fake embeddings
+unless --embedding-model is given.
+
+Usage:
+    python benchmarks/bench_suite.py [--size 100MB] [--files 4] [--format spring|loghub] [--loghub-sample HDFS_2k.log]
+        [--log-dir /path/to/logs --pattern REGEX] [--queries 200] [--llm-delay 0] [--seed 0]
+        [--embedding-model all-MiniLM-L6-v2] [--output results.json] [--compare baseline.json] [--threshold 10]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# LOGURU_DATA_DIR is derived from HOME when loguru is imported
+_HOME = tempfile.mkdtemp(prefix='loguru-bench-home-')
+os.environ['HOME'] = _HOME
+
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+from log_generator import SPRING_PATTERN, generate, parse_size, spring_entries  # noqa: E402
+from loguru.core.embeddings import load_embedding_model  # noqa: E402
+from loguru.core.fs_log_rag import LoguruRAG  # noqa: E402
+from loguru.core.log_parser import LogDocumentParser  # noqa: E402
+from loguru.core.models.config import Config  # noqa: E402
+from ollama_stub import OllamaStubServer  # noqa: E402
+
+RESULTS_VERSION = 1
+QUESTIONS = ["Why were payments declined?", "Which orders failed with connection refused?",
+             "What caused the lock wait timeouts?", "Are there slow queries on the orders table?",
+             "How many retries to inventory-service were there?", "Which blocks could not be read from stream?",
+             "What exceptions did the DataNode get while serving blocks?", "Was any block deleted?"]
+# the other metrics are better lower, except these informational ones, which are not compared
+HIGHER_IS_BETTER = ('parse.mb_per_s', 'parse.entries_per_s', 'embed.docs_per_s', 'index.docs_per_s')
+NOT_COMPARED = ('parse.entries', 'index.entries', 'input.mb')
+
+
+def _bench_config(log_dir: str, pattern: str, model: str, llm_url: str) -> Config:
+    return Config(**{
+        "service": "ollama",
+        "ollama": {"hosts": [llm_url], "llm_name": "mistral", "embedding_model_name": model,
+                   "options": {"temperature": 0.1}},
+        "gemini": None, "openai": None, "anthropic": None,
+        "num_chunks_to_return": 10,
+        "embedding_cache": {"enabled": False},
+        "answer_cache": {"enabled": False},
+        "data_sources": [{"type": "filesystem", "ds_params": {
+            "recursion_depth": 0, "file_size_limit": "100GB",
+            "scan_locations": [{"location": log_dir, "pattern": pattern}]}}]
+    })
+
+
+def _peak_rss_mb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def _directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def _percentiles(times: list, prefix: str) -> dict:
+    return {f"{prefix}.p50_ms": float(np.percentile(times, 50)) * 1000,
+            f"{prefix}.p99_ms": float(np.percentile(times, 99)) * 1000}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def bench_parse(log_files: list, pattern: str) -> dict:
+    num_bytes = sum(os.path.getsize(p) for p in log_files)
+    num_entries = 0
+    start_time = time.time()
+    for log_file_path in log_files:
+        for _ in LogDocumentParser(log_file_path, pattern):
+            num_entries += 1
+    elapsed = time.time() - start_time
+    return {'input.mb': num_bytes / 1024 / 1024, 'parse.entries': num_entries, 'parse.s': elapsed,
+            'parse.mb_per_s': num_bytes / 1024 / 1024 / elapsed, 'parse.entries_per_s': num_entries / elapsed}
+
+
+def bench_embed(embedding_model, log_files: list, pattern: str, sample: int, batch_size: int) -> dict:
+    texts = []
+    for log_file_path in log_files:
+        for text, _ in LogDocumentParser(log_file_path, pattern):
+            texts.append(text)
+            if len(texts) >= sample:
+                break
+        if len(texts) >= sample:
+            break
+    start_time = time.time()
+    for i in range(0, len(texts), batch_size):
+        embedding_model.embed_documents(texts[i:i + batch_size])
+    return {'embed.docs_per_s': len(texts) / (time.time() - start_time)}
+
+
+def bench_index(rag: LoguruRAG, config: Config, embedding_model, append_to: str, seed: int) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.time()
+        rag.scan(clean_and_rebuild=True, verbose=False)
+        build_time = time.time() - start_time
+    num_entries = len(rag._get_vectorstore())
+    index_size = _directory_size(os.path.join(_HOME, '.loguru', 'cache'))
+    metrics = {'index.entries': num_entries, 'index.build_s': build_time, 'index.docs_per_s': num_entries / build_time,
+               'index.size_mb': index_size / 1024 / 1024, 'index.bytes_per_entry': index_size / max(num_entries, 1),
+               'rss.after_index_mb': _peak_rss_mb()}
+
+    # a different seed, so the appended entries are not copies of the ones indexed
+    with open(append_to, 'a', encoding='utf-8') as f:
+        entries = spring_entries(seed=seed + 1000)
+        f.write(''.join(next(entries) for _ in range(1000)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.time()
+        rag.scan(verbose=False)
+        metrics['index.incremental_scan_s'] = time.time() - start_time
+
+    reader = LoguruRAG(config=config, embedding_model=embedding_model)
+    start_time = time.time()
+    reader._get_vectorstore().preload()
+    metrics['index.load_s'] = time.time() - start_time
+    return metrics
+
+
+def bench_queries(rag: LoguruRAG, num_queries: int) -> dict:
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(num_queries)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag.warm_up()
+        search_times = []
+        for question in questions:
+            start_time = time.time()
+            rag.search(question)
+            search_times.append(time.time() - start_time)
+
+        ask_times, first_token_times = [], []
+        for question in questions:
+            first_token_time = None
+
+            def _on_token(text: str):
+                nonlocal first_token_time
+                if first_token_time is None:
+                    first_token_time = time.time()
+
+            start_time = time.time()
+            rag.ask(question, use_cache=False, on_token=_on_token)
+            ask_times.append(time.time() - start_time)
+            first_token_times.append((first_token_time or time.time()) - start_time)
+    return {**_percentiles(search_times, 'search'), **_percentiles(ask_times, 'ask'),
+            **_percentiles(first_token_times, 'ask.first_token'), 'rss.after_queries_mb': _peak_rss_mb()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """
+    Prints the change of each metric from the baseline.
+
+    :return: number of metrics that got worse by more than `threshold` percent
+    """
+    regressions = 0
+    print(f"\n{'metric':<26} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, value in results['metrics'].items():
+        base = baseline['metrics'].get(name)
+        if base is None or name in NOT_COMPARED:
+            print(f"{name:<26} {'' if base is None else f'{base:.3f}':>12} {value:>12.3f}")
+            continue
+        change = (value - base) / base * 100 if base else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        regressed = worse > threshold
+        regressions += regressed
+        print(f"{name:<26} {base:>12.3f} {value:>12.3f} {change:>+8.1f}%{'  REGRESSION' if regressed else ''}")
+    if baseline.get('params') != results['params']:
+        print("Note: the baseline was run with different parameters")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end performance benchmark suite")
+    parser.add_argument('--size', default='100MB', help='Total size of the generated logs. Ex: 500MB, 4GB')
+    parser.add_argument('--files', type=int, default=4, help='Number of generated log files')
+    parser.add_argument('--format', dest='log_format', choices=['spring', 'loghub'], default='spring',
+                        help='Format of the generated logs')
+    parser.add_argument('--loghub-sample', default=None, help='Loghub raw log sample to replay (loghub format)')
+    parser.add_argument('--log-dir', default=None, help='Benchmark the logs in this directory instead')
+    parser.add_argument('--pattern', default=SPRING_PATTERN, help='Pattern splitting the logs in --log-dir')
+    parser.add_argument('--embed-sample', type=int, default=5000, help='Log entries embedded for embed.docs_per_s')
+    parser.add_argument('--queries', type=int, default=200, help='Number of searches and questions')
+    parser.add_argument('--llm-delay', type=float, default=0.0, help='Seconds the stub LLM waits before answering')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the generated logs')
+    parser.add_argument('--embedding-model', default=None, help='Embedding model, fake embeddings if not set')
+    parser.add_argument('--output', default=None, help='File to write the results to, as JSON')
+    parser.add_argument('--compare', default=None, help='Results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change counted as a regression')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='loguru-bench-logs-')
+    llm = OllamaStubServer(delay=args.llm_delay).start()
+    try:
+        if args.log_dir is not None:
+            # copied, as the incremental scan appends to a log file
+            log_dir = os.path.join(work_dir, 'logs')
+            shutil.copytree(args.log_dir, log_dir)
+            log_files = sorted(os.path.join(log_dir, f) for f in os.listdir(log_dir)
+                               if os.path.isfile(os.path.join(log_dir, f)))
+            pattern = args.pattern
+        else:
+            log_dir = work_dir
+            start_time = time.time()
+            log_files = generate(log_dir, parse_size(args.size), num_files=args.files, log_format=args.log_format,
+                                 loghub_sample=args.loghub_sample, seed=args.seed)
+            pattern = SPRING_PATTERN
+            print(f"Generated {args.size} of {args.log_format} logs in {time.time() - start_time:.1f} s")
+
+        embedding_model = load_embedding_model(args.embedding_model) if args.embedding_model else \
+            DeterministicFakeEmbedding(size=384)
+        config = _bench_config(log_dir, pattern, args.embedding_model or 'fake', llm.url)
+        rag = LoguruRAG(config=config, embedding_model=embedding_model)
+
+        metrics = {}
+        for stage, run in [
+            ('parse', lambda: bench_parse(log_files, pattern)),
+            ('embed', lambda: bench_embed(embedding_model, log_files, pattern, args.embed_sample,
+                                          config.indexing.embedding_batch_size)),
+            ('index', lambda: bench_index(rag, config, embedding_model, log_files[-1], args.seed)),
+            ('queries', lambda: bench_queries(rag, args.queries)),
+        ]:
+            print(f"Running {stage} ...")
+            metrics.update(run())
+        metrics['rss.peak_mb'] = _peak_rss_mb()
+
+        params = {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'threshold')}
+        results = {'version': RESULTS_VERSION, 'created': datetime.now(timezone.utc).isoformat(),
+                   'git_commit': _git_commit(), 'python': platform.python_version(),
+                   'platform': platform.platform(), 'cpus': os.cpu_count(), 'params': params, 'metrics': metrics}
+        print()
+        for name, value in metrics.items():
+            print(f"{name:<26} {value:>12.3f}")
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.output}")
+        if args.compare is not None:
+            with open(args.compare, 'r') as f:
+                regressions = compare(results, json.load(f), args.threshold)
+            if regressions:
+                print(f"\n{regressions} metric(s) regressed by more than {args.threshold}%")
+                sys.exit(1)
+    finally:
+        llm.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(_HOME, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
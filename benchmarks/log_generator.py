@@ -0,0 +1,191 @@
+"""
+Generates synthetic log files for the benchmarks, reproducibly (the same --seed gives the same bytes).
+
+Two formats are produced, both split into entries by `SPRING_PATTERN`:
+
+- spring: Spring Boot style logs as in the `LoguruRAG._parse_log_file` docstring, from a handful of services with
+  request ids, latencies, occasional WARNs and ERRORs followed by multi-line Java stack traces.
+- loghub: Loghub (https://github.com/logpai/loghub) raw sample lines (e.g. HDFS_2k.log) replayed in a loop behind
+  ISO timestamps, or HDFS-style lines generated from the Loghub HDFS event templates if no sample is given.
+
+Files are streamed to disk in chunks, so multi-GB logs can be generated in constant memory.
+
+Usage:
+    python benchmarks/log_generator.py --out-dir /tmp/logs [--size 1GB] [--files 4] [--format spring|loghub]
+        [--loghub-sample HDFS_2k.log] [--seed 0]
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+
+# HDFS event templates from Loghub: (event id, level, component, template)
+HDFS_EVENTS = [
+    ('E1', 'INFO', 'dfs.DataNode$DataXceiver', 'Receiving block {blk} src: /{ip}:{port} dest: /{ip}:{port}'),
+    ('E2', 'INFO', 'dfs.FSNamesystem',
+     'BLOCK* NameSystem.addStoredBlock: blockMap updated: {ip}:{port} is added to {blk} size {size}'),
+    ('E3', 'INFO', 'dfs.DataNode$PacketResponder', 'PacketResponder {n} for block {blk} terminating'),
+    ('E4', 'INFO', 'dfs.DataNode$PacketResponder', 'Received block {blk} of size {size} from /{ip}'),
+    ('E5', 'INFO', 'dfs.FSNamesystem',
+     'BLOCK* NameSystem.allocateBlock: /user/root/rand/_temporary/_task_{task}/part-{n}. {blk}'),
+    ('E6', 'INFO', 'dfs.DataBlockScanner', 'Verification succeeded for {blk}'),
+    ('E7', 'INFO', 'dfs.FSDataset', 'Deleting block {blk} file /mnt/hadoop/dfs/data/current/subdir{n}/{blk}'),
+    ('E8', 'WARN', 'dfs.DataNode', '{ip}:{port}:Got exception while serving {blk} to /{ip}:'),
+    ('E9', 'INFO', 'dfs.DataNode$DataXceiver',
+     'writeBlock {blk} received exception java.io.IOException: Could not read from stream'),
+    ('E10', 'INFO', 'dfs.DataNode$PacketResponder',
+     'PacketResponder {n} for block {blk} Interrupted.'),
+    ('E11', 'WARN', 'dfs.FSNamesystem', 'BLOCK* NameSystem.delete: {blk} is added to invalidSet of {ip}:{port}'),
+    ('E12', 'INFO', 'dfs.DataNode', '{ip}:{port} Starting thread to transfer block {blk} to {ip}:{port}'),
+]
+# how often each event occurs, rare events are the interesting ones
+HDFS_EVENT_WEIGHTS = [30, 30, 30, 30, 10, 10, 10, 2, 2, 2, 1, 1]
+
+SPRING_PATTERN = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
+START = datetime(2024, 6, 14, 11, 5, 48, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+_CHUNK_BYTES = 1024 * 1024
+_SERVICES = ['app-service', 'payment-service', 'order-service', 'inventory-service']
+_CLASSES = ['c.i.o.OrderService', 'c.i.o.PaymentGateway', 'c.i.o.InventoryClient', 'o.h.e.j.s.SqlExceptionHelper',
+            'c.i.o.web.RequestLoggingFilter', 'o.s.w.s.DispatcherServlet', 'c.z.h.pool.HikariPool']
+_INFO_MESSAGES = ['Processed order {order} for customer {customer} in {ms} ms',
+                  'GET /api/orders/{order} completed with status 200 in {ms} ms',
+                  'Reserved {n} items of SKU-{sku} for order {order}',
+                  'Payment {payment} authorized for customer {customer}',
+                  'HikariPool-1 - Pool stats (total={n}, active={m}, idle={k}, waiting=0)']
+_WARN_MESSAGES = ['Slow query detected: {ms} ms for SELECT * FROM orders WHERE customer_id = {customer}',
+                  'Retrying call to inventory-service (attempt {m} of 3) for order {order}',
+                  'Config file not specified. We will try to use the default config file: /app/data/cfg.ini']
+_ERROR_MESSAGES = ['Payment {payment} declined for customer {customer}: E{code} insufficient funds',
+                   'Connection refused to inventory-service at 10.0.{m}.{n}:8080 for order {order}',
+                   'Timeout waiting for lock on table orders after {ms} ms (request {request})']
+_EXCEPTIONS = ['java.net.ConnectException: Connection refused', 'java.sql.SQLTimeoutException: Lock wait timeout',
+               'com.example.PaymentDeclinedException: E{code}']
+_FRAMES = ['com.example.orders.OrderService.placeOrder(OrderService.java:{line})',
+           'com.example.payment.PaymentGateway.charge(PaymentGateway.java:{line})',
+           'org.springframework.web.servlet.FrameworkServlet.service(FrameworkServlet.java:{line})',
+           'java.base/java.lang.Thread.run(Thread.java:{line})']
+
+
+def parse_size(size: str) -> int:
+    units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+    size = size.strip().upper()
+    for unit, factor in units.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def _timestamp(t: datetime) -> str:
+    return t.isoformat(timespec='milliseconds')
+
+
+def spring_entries(seed: int = 0, start: datetime = START) -> Iterator[str]:
+    """
+    Yields Spring Boot style log entries (ending with a newline), about 20 per second of log time.
+    """
+    rng = random.Random(seed)
+    t = start
+    while True:
+        t += timedelta(milliseconds=rng.randint(1, 100))
+        roll = rng.random()
+        severity, messages = ('ERROR', _ERROR_MESSAGES) if roll < 0.02 else ('WARN', _WARN_MESSAGES) if roll < 0.08 \
+            else ('DEBUG', _INFO_MESSAGES) if roll < 0.2 else ('INFO', _INFO_MESSAGES)
+        values = {'order': rng.randint(100000, 999999), 'customer': rng.randint(1, 5000), 'ms': rng.randint(1, 5000),
+                  'n': rng.randint(1, 50), 'm': rng.randint(1, 3), 'k': rng.randint(0, 10), 'sku': rng.randint(1, 999),
+                  'payment': f"pay_{rng.getrandbits(40):010x}", 'code': rng.randint(4000, 4099),
+                  'request': f"{rng.getrandbits(64):016x}"}
+        entry = (f"{_timestamp(t)} {severity:>5} [{rng.choice(_SERVICES)},{values['request']},] "
+                 f"{rng.randint(1000, 9999)} --- [nio-8080-exec-{rng.randint(1, 10)}] {rng.choice(_CLASSES):<40} : "
+                 f"{rng.choice(messages).format(**values)}\n")
+        if severity == 'ERROR':
+            entry += rng.choice(_EXCEPTIONS).format(**values) + '\n'
+            entry += ''.join(f"\tat {frame.format(line=rng.randint(20, 900))}\n"
+                             for frame in rng.sample(_FRAMES, rng.randint(2, len(_FRAMES))))
+        yield entry
+
+
+def loghub_entries(sample_lines: Optional[List[str]] = None, seed: int = 0, start: datetime = START) -> Iterator[str]:
+    """
+    Yields Loghub sample lines in a loop (HDFS-style lines generated from the Loghub event templates if none are given),
+    each behind an ISO timestamp so that `SPRING_PATTERN` splits them.
+    """
+    rng = random.Random(seed)
+    t = start
+    i = 0
+    while True:
+        t += timedelta(milliseconds=rng.randint(1, 50))
+        if sample_lines:
+            line = sample_lines[i % len(sample_lines)]
+        else:
+            _, level, component, template = rng.choices(HDFS_EVENTS, weights=HDFS_EVENT_WEIGHTS)[0]
+            line = f"{level} {component}: " + template.format(
+                blk=f"blk_{rng.getrandbits(62)}", ip=f"10.251.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                port=rng.randint(40000, 60000), size=rng.randint(1, 67108864), n=rng.randint(0, 63),
+                task=f"200811092030_{rng.randint(1, 9999):04d}_m_{i % 1000000:06d}_0")
+        i += 1
+        yield f"{_timestamp(t)} {line}\n"
+
+
+def write_logs(path: str, entries: Iterator[str], size_bytes: int) -> int:
+    """
+    Writes entries to `path` until it holds at least `size_bytes` bytes.
+
+    :return: number of entries written
+    """
+    num_entries, written = 0, 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < size_bytes:
+            chunk = []
+            chunk_bytes = 0
+            while chunk_bytes < _CHUNK_BYTES and written + chunk_bytes < size_bytes:
+                entry = next(entries)
+                chunk.append(entry)
+                chunk_bytes += len(entry.encode('utf-8'))
+            f.write(''.join(chunk))
+            written += chunk_bytes
+            num_entries += len(chunk)
+    return num_entries
+
+
+def generate(out_dir: str, size_bytes: int, num_files: int = 1, log_format: str = 'spring',
+             loghub_sample: Optional[str] = None, seed: int = 0) -> List[str]:
+    """
+    Generates `num_files` log files of `size_bytes` in total in `out_dir`.
+
+    :return: paths of the files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sample_lines = None
+    if loghub_sample is not None:
+        with open(loghub_sample, 'r', encoding='utf-8', errors='replace') as f:
+            sample_lines = [line.rstrip('\n') for line in f if line.strip() != '']
+    paths = []
+    for i in range(num_files):
+        path = os.path.join(out_dir, f"{log_format}-{i}.log")
+        entries = spring_entries(seed=seed + i) if log_format == 'spring' else \
+            loghub_entries(sample_lines, seed=seed + i)
+        write_logs(path, entries, size_bytes // num_files)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic log generator")
+    parser.add_argument('--out-dir', required=True, help='Directory to write the log files to')
+    parser.add_argument('--size', default='100MB', help='Total size of the log files. Ex: 500MB, 4GB')
+    parser.add_argument('--files', type=int, default=1, help='Number of log files')
+    parser.add_argument('--format', dest='log_format', choices=['spring', 'loghub'], default='spring',
+                        help='Log format')
+    parser.add_argument('--loghub-sample', default=None, help='Loghub raw log sample to replay (loghub format)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    paths = generate(args.out_dir, parse_size(args.size), num_files=args.files, log_format=args.log_format,
+                     loghub_sample=args.loghub_sample, seed=args.seed)
+    print(f"Wrote {len(paths)} file(s), {sum(os.path.getsize(p) for p in paths)} bytes, to {args.out_dir}. Split "
+          f"entries with the pattern: {SPRING_PATTERN}")
+
+
+if __name__ == "__main__":
+    main()
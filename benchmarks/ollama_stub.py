@@ -0,0 +1,138 @@
+"""
+Local HTTP server that imitates the parts of the Ollama API Loguru uses (`GET /api/version`, `GET /api/tags`,
+`POST /api/chat` and `POST /api/generate`, streamed as newline delimited JSON), to try out and benchmark Ollama host
+pools without GPUs.
+
+Each response waits --delay seconds before the first chunk and --token-delay seconds between chunks. With
+--error-rate, that share of requests fails with a 500 error.
+
+Usage:
+    python benchmarks/ollama_stub.py [--port 11500] [--delay 0.2] [--token-delay 0.01] [--error-rate 0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "The logs show repeated connection timeouts to the database before the service restarted."
+
+
+class OllamaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0.0, token_delay: float = 0.0, error_rate: float = 0.0,
+                 answer: str = ANSWER):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.delay = delay
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.answer = answer
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> 'OllamaStubServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: OllamaStubServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json({'version': '0.0.0-stub'})
+        elif self.path == '/api/tags':
+            self._send_json({'models': [{'name': 'stub:latest', 'model': 'stub:latest'}]})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path not in ('/api/chat', '/api/generate'):
+            self._send_json({'error': 'not found'}, status=404)
+            return
+        self.server.count_request()
+        time.sleep(self.server.delay)
+        if random.random() < self.server.error_rate:
+            self._send_json({'error': 'stub failure'}, status=500)
+            return
+        model = request.get('model', 'stub')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            self._stream_answer(request, model)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading the answer
+            self.close_connection = True
+
+    def _stream_answer(self, request: dict, model: str):
+        words = self.server.answer.split(' ')
+        for i, word in enumerate(words):
+            text = word if i == 0 else f" {word}"
+            if self.path == '/api/chat':
+                chunk = {'model': model, 'message': {'role': 'assistant', 'content': text}, 'done': False}
+            else:
+                chunk = {'model': model, 'response': text, 'done': False}
+            self._send_chunk(chunk)
+            time.sleep(self.server.token_delay)
+        final = {'model': model, 'done': True, 'done_reason': 'stop', 'eval_count': len(words),
+                 'prompt_eval_count': len(json.dumps(request)) // 4}
+        if self.path == '/api/chat':
+            final['message'] = {'role': 'assistant', 'content': ''}
+        else:
+            final['response'] = ''
+        self._send_chunk(final)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send_chunk(self, chunk: dict):
+        data = json.dumps(chunk).encode() + b'\n'
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, body: dict, status: int = 200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama API stub server")
+    parser.add_argument('--port', type=int, default=11500, help='Port to listen on')
+    parser.add_argument('--delay', type=float, default=0.2, help='Seconds before the first chunk of an answer')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='Seconds between chunks of an answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail with a 500 error')
+    args = parser.parse_args()
+
+    server = OllamaStubServer(args.port, delay=args.delay, token_delay=args.token_delay, error_rate=args.error_rate)
+    print(f"Ollama stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,20 @@
 import argparse
+import contextlib
 import os.path
+import sys
+from typing import TYPE_CHECKING
 
 from loguru import LOGURU_DATA_DIR
-from loguru.core.cli_app import CLIApp
-from loguru.core.models.config import Config
-from loguru.core.tool_impls import LogSearchTool
+from loguru.core.daemon_client import DaemonClient
+
+if TYPE_CHECKING:
+    from loguru.core.models.config import Config
 
 default_config = {
+    "service": "ollama",
+    "gemini": None,
+    "openai": None,
+    "anthropic": None,
     "num_chunks_to_return": 100,
     "ollama": {
         "hosts": [
@@ -34,18 +42,17 @@ default_config = {
     ]
 }
 
-tool_implementations = [
-    LogSearchTool,
-]
-
 
-def _init_cfg(cfg_file_path: str) -> Config:
+def _init_cfg(cfg_file_path: str) -> 'Config':
+    # pydantic and the config models take a good part of the startup time, commands that do not need them skip them
+    from loguru.core.models.config import Config
     if not os.path.exists(cfg_file_path):
         print(f'Config file not found: {cfg_file_path}, creating default config...')
         cfg = Config(**default_config)
         os.makedirs(os.path.dirname(cfg_file_path), exist_ok=True)
         with open(cfg_file_path, 'w') as f:
             f.write(cfg.model_dump_json(indent=4))
+        return cfg
     else:
         print(f'Using config: {cfg_file_path}')
         with open(cfg_file_path, 'r') as f:
@@ -63,37 +70,185 @@ def main():
         required=False,
         default=None
     )
-    op_choices = ['run', 'scan', 'show-config']
+    parser.add_argument(
+        '--rebuild',
+        dest='rebuild',
+        help='Discard the existing index and rebuild it from scratch (scan only)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--no-cache',
+        dest='no_cache',
+        help='Always ask the LLM instead of reusing cached answers to questions asked before (run, ask, query)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--follow',
+        dest='follow',
+        help='Keep indexing log lines as they are written, until interrupted (scan, run)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='Profile answering the question with cProfile and show where the time went, without a running daemon or '
+             'cached answer (ask only)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--socket',
+        dest='socket_path',
+        help='Unix socket the daemon listens on (serve) or is reached at (ask, scan). Default: ~/.loguru/loguru.sock',
+        default=None
+    )
+    parser.add_argument(
+        '--port',
+        dest='port',
+        help='Serve on / connect to this localhost TCP port instead of the Unix socket',
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--scan-interval',
+        dest='scan_interval',
+        help='Seconds between the scans the daemon runs to keep its index up to date, 0 to only scan on request '
+             '(serve only)',
+        type=float,
+        default=60.0
+    )
+    parser.add_argument(
+        '-f',
+        '--file',
+        dest='questions_file',
+        help='Read the questions from this file, one per line, - for stdin (query only)',
+        default=None
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output_file',
+        help='Write the JSON lines results to this file instead of stdout (query only)',
+        default=None
+    )
+    parser.add_argument(
+        '--parallel',
+        dest='parallel',
+        help='Number of questions answered at the same time, query.concurrency of the config by default (query only)',
+        type=int,
+        default=None
+    )
+    op_choices = ['run', 'ask', 'query', 'scan', 'serve', 'show-config']
     parser.add_argument(
         dest='operation',
         help=f'Operation to perform. i.e, {" / ".join(op_choices)}',
         choices=op_choices,
         metavar='operation'
     )
+    parser.add_argument(
+        dest='question',
+        help='Question to ask (ask), or questions to answer, one per argument (query)',
+        nargs='*'
+    )
 
     args: argparse.Namespace = parser.parse_args()
 
     operation = args.operation
+    if operation == 'ask' and len(args.question) == 0:
+        parser.error("ask needs a question, e.g. loguru ask why did the payment service restart")
+    if args.parallel is not None and args.parallel < 1:
+        parser.error("--parallel must be at least 1")
+    questions = _read_questions(args) if operation == 'query' else []
+    if operation == 'query' and len(questions) == 0:
+        parser.error("query needs questions, e.g. loguru query 'any errors today?' 'why did the payment service "
+                     "restart?' or loguru query --file questions.txt")
+    client = DaemonClient(socket_path=args.socket_path, port=args.port)
+    # a running daemon answers with its warm engine, without loading the config, models and index here
+    if operation == 'ask' and not args.profile and client.is_running():
+        client.ask(' '.join(args.question), use_cache=not args.no_cache)
+        return
+    if operation == 'scan' and not args.follow and client.is_running():
+        if client.scan(rebuild=args.rebuild) == 0:
+            print("Index is up to date.")
+        return
+
     cfg_path = None
 
     if 'config_file_path' not in args or args.config_file_path is None or args.config_file_path == "":
         cfg_path = os.path.join(LOGURU_DATA_DIR, 'config.json')
     else:
         cfg_path = args.config_file_path
+    if operation == 'show-config':
+        # shown as it is, without validating it
+        if not os.path.exists(cfg_path):
+            _init_cfg(cfg_path)
+        show_config(config_file_path=cfg_path)
+        return
+    if operation == 'query':
+        sys.exit(1 if _query(args, cfg_path, questions) > 0 else 0)
     loaded_config: Config = _init_cfg(cfg_path)
+    if operation == 'serve':
+        from loguru.core.daemon import LoguruDaemon
+        LoguruDaemon(config=loaded_config, socket_path=args.socket_path, port=args.port,
+                     scan_interval=args.scan_interval or None).serve()
+        return
+
+    # langchain and the models are only imported once it is clear that this process needs them
+    from loguru.core.cli_app import CLIApp
+    from loguru.core.tool_impls import LogSearchTool
+    tool_implementations = [
+        LogSearchTool,
+    ]
 
     if operation == 'run':
-        CLIApp(config=loaded_config, with_tools=False, tool_registry=tool_implementations).start()
+        CLIApp(config=loaded_config, with_tools=False, tool_registry=tool_implementations,
+               use_answer_cache=not args.no_cache, follow=args.follow).start()
+    elif operation == 'ask':
+        CLIApp(config=loaded_config, with_tools=False, tool_registry=tool_implementations,
+               use_answer_cache=not args.no_cache).ask(' '.join(args.question), profile=args.profile)
     elif operation == 'scan':
-        # reload log files and their metadata and rebuild the vectorstore
-        CLIApp(config=loaded_config, with_tools=False, tool_registry=tool_implementations).scan_and_rebuild_cache()
-    elif operation == 'show-config':
-        show_config(config_file_path=cfg_path)
+        app = CLIApp(config=loaded_config, with_tools=False, tool_registry=tool_implementations)
+        if args.rebuild:
+            # reload log files and their metadata and rebuild the vectorstore
+            app.scan_and_rebuild_cache()
+        else:
+            # index only new/appended log files and drop the deleted ones
+            app.scan_and_update_cache()
+        if args.follow:
+            # then keep indexing log lines as they are written
+            app.follow()
     else:
         print('Unknown operation!')
         parser.print_help()
 
 
+def _read_questions(args: argparse.Namespace) -> list[str]:
+    from loguru.core.batch_query import read_questions
+    questions = list(args.question)
+    if args.questions_file == '-' or (args.questions_file is None and len(questions) == 0 and not sys.stdin.isatty()):
+        questions.extend(read_questions(sys.stdin))
+    elif args.questions_file is not None:
+        with open(args.questions_file, 'r') as f:
+            questions.extend(read_questions(f))
+    return questions
+
+
+def _query(args: argparse.Namespace, cfg_path: str, questions: list[str]) -> int:
+    """
+    :return: number of questions that could not be answered
+    """
+    output = open(args.output_file, 'w') if args.output_file else sys.stdout
+    try:
+        # stdout only carries the results, progress goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            loaded_config = _init_cfg(cfg_path)
+            from loguru.core.cli_app import CLIApp
+            return CLIApp(config=loaded_config, with_tools=False,
+                          use_answer_cache=not args.no_cache).query(questions, output, concurrency=args.parallel)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
 def show_config(config_file_path: str):
     print('Config file contents:')
     with open(config_file_path, 'r') as f:
@@ -0,0 +1,204 @@
+import json
+import math
+import os
+from typing import Collection, Optional
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from loguru.core.models.config import VectorIndex
+
+ANN_META_FILE_NAME = 'ann_index.json'
+# k-means wants roughly this many training points per centroid
+TRAINING_POINTS_PER_CENTROID = 64
+
+
+def factory_string(config: VectorIndex, num_vectors: int, dimension: int) -> str:
+    """
+    Returns the FAISS index factory string for the configured index type.
+    """
+    nlist = config.nlist if config.nlist is not None else _auto_nlist(num_vectors)
+    if config.type in ('ivfpq', 'hnswpq') and dimension % config.pq_m != 0:
+        raise ValueError(f"vector_index.pq_m ({config.pq_m}) must divide the embedding dimension ({dimension})")
+    if config.type == 'flat':
+        return 'Flat'
+    if config.type == 'ivf':
+        return f"IVF{nlist},Flat"
+    if config.type == 'ivfpq':
+        return f"IVF{nlist},PQ{config.pq_m}x{config.pq_nbits}"
+    if config.type == 'hnsw':
+        return f"HNSW{config.hnsw_m}"
+    if config.type == 'hnswpq':
+        return f"HNSW{config.hnsw_m}_PQ{config.pq_m}x{config.pq_nbits}"
+    raise ValueError(f"Unknown vector index type: {config.type}")
+
+
+def _auto_nlist(num_vectors: int) -> int:
+    return int(min(65536, max(16, 4 * math.sqrt(max(num_vectors, 1)))))
+
+
+def is_flat(index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def reconstruct_all(index) -> np.ndarray:
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstructs_exactly(index) -> bool:
+    """
+    :return: False for PQ-compressed indexes, which only keep codes of the vectors: their reconstructed vectors are
+        approximations
+    """
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        return isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+    if isinstance(index, faiss.IndexHNSW):
+        return isinstance(faiss.downcast_index(index.storage), faiss.IndexFlat)
+    return is_flat(index)
+
+
+def original_vectors(vectorstore: FAISS) -> np.ndarray:
+    """
+    :return: the vectors of `vectorstore` as they were embedded. PQ-compressed indexes do not keep them, the log entries
+        are embedded again then (mostly served by the embedding cache), so that retraining or merging does not quantize
+        already quantized vectors and lose recall every time
+    """
+    index = vectorstore.index
+    if reconstructs_exactly(index):
+        return reconstruct_all(index)
+    docstore = vectorstore.docstore
+    print(f"Embedding {index.ntotal} log entries again, the PQ vector index does not keep the original vectors...")
+    texts = [docstore.text_at(p) for p in range(len(docstore))]
+    return np.asarray(vectorstore.embeddings.embed_documents(texts), dtype=np.float32).reshape(len(texts), index.d)
+
+
+def _extract_ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def build_index(config: VectorIndex, vectors: np.ndarray, factory: Optional[str] = None):
+    """
+    Creates an index of the configured type, trains it on (a sample of) `vectors` if needed and adds all `vectors`.
+    """
+    factory = factory or factory_string(config, len(vectors), vectors.shape[1])
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = config.ef_construction
+    if not index.is_trained:
+        ivf = _extract_ivf(index)
+        num_centroids = ivf.nlist if ivf is not None else 2 ** config.pq_nbits
+        max_training_points = num_centroids * TRAINING_POINTS_PER_CENTROID
+        training_vectors = vectors
+        if len(vectors) > max_training_points:
+            rng = np.random.default_rng(0)
+            training_vectors = vectors[rng.choice(len(vectors), max_training_points, replace=False)]
+        index.train(training_vectors)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index, config: VectorIndex):
+    params = faiss.ParameterSpace()
+    if _extract_ivf(index) is not None:
+        params.set_index_parameter(index, 'nprobe', config.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, 'efSearch', config.ef_search)
+
+
+def search_parameters(index, selector):
+    """
+    Returns search parameters that restrict a search of `index` to the ids accepted by `selector`, keeping the
+    nprobe/efSearch the index is set up with.
+    """
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def remove_positions(index, positions: Collection[int]):
+    """
+    Removes vectors by position from an index that does not support (or does not compact on) `remove_ids`, such as
+    IVF and HNSW, by re-adding the remaining vectors to an empty copy of the trained index.
+
+    :return: the new index, remaining vectors keep their relative order
+    """
+    vectors = np.delete(reconstruct_all(index), np.fromiter(positions, dtype=np.int64), axis=0)
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    if len(vectors) > 0:
+        new_index.add(vectors)
+    return new_index
+
+
+class AnnIndexManager:
+    """
+    Keeps the vector store index in the configured type.
+
+    Indexes start out flat while they are built. On save, the index is converted to the configured type once it holds
+    `min_train_size` vectors, and IVF/PQ indexes are retrained on the current corpus once it grows by
+    `retrain_growth_factor` since the last training. The type and size at the last training are kept next to the index.
+    PQ indexes are retrained on the original vectors, embedded again, rather than on their lossy reconstructions.
+    """
+
+    def __init__(self, config: VectorIndex, vector_store_directory: str):
+        self._config = config
+        self._meta_file_path = os.path.join(vector_store_directory, ANN_META_FILE_NAME)
+
+    def _load_meta(self) -> dict:
+        if not os.path.exists(self._meta_file_path):
+            return {'factory': 'Flat', 'trained_on': 0}
+        with open(self._meta_file_path, 'r') as f:
+            return json.load(f)
+
+    def _save_meta(self, meta: dict):
+        os.makedirs(os.path.dirname(self._meta_file_path), exist_ok=True)
+        with open(self._meta_file_path, 'w') as f:
+            json.dump(meta, f)
+
+    def ensure_index_type(self, vectorstore: FAISS) -> bool:
+        """
+        :return: True if the index was converted or retrained
+        """
+        index = vectorstore.index
+        num_vectors = index.ntotal
+        meta = self._load_meta()
+        if self._config.type == 'flat' or num_vectors < self._config.min_train_size:
+            if self._config.type == 'flat' and not is_flat(index):
+                print("Converting vector index to flat...")
+                vectorstore.index = build_index(self._config, original_vectors(vectorstore))
+                self._save_meta({'factory': 'Flat', 'trained_on': 0})
+                return True
+            return False
+
+        factory = factory_string(self._config, num_vectors, index.d)
+        current_factory = 'Flat' if is_flat(index) else meta['factory']
+        needs_training = not faiss.index_factory(index.d, factory).is_trained
+        grown = needs_training and num_vectors > meta['trained_on'] * self._config.retrain_growth_factor
+        if self._same_structure(current_factory, factory) and not grown:
+            apply_search_params(index, self._config)
+            return False
+
+        print(f"Building {factory} vector index over {num_vectors} vectors...")
+        vectorstore.index = build_index(self._config, original_vectors(vectorstore), factory=factory)
+        self._save_meta({'factory': factory, 'trained_on': num_vectors})
+        return True
+
+    def _same_structure(self, current_factory: str, factory: str) -> bool:
+        # nlist is derived from the corpus size when not configured, it only changes when retraining
+        if self._config.nlist is None and current_factory.startswith('IVF') and factory.startswith('IVF'):
+            return current_factory.split(',')[1:] == factory.split(',')[1:]
+        return current_factory == factory
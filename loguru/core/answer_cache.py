@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from loguru import LOGURU_DATA_DIR
+
+ANSWER_CACHE_FILE = os.path.join(LOGURU_DATA_DIR, 'answer_cache.sqlite')
+
+
+class CachedAnswer(NamedTuple):
+    question: str
+    answer: str
+    source_documents: List[Document]
+    created: float
+    similarity: float
+
+
+class AnswerCache:
+    """
+    Persistent cache of answers keyed by the embedding of the question, the LLM that answered it and the version of the
+    index it was answered from.
+
+    A question is answered from the cache when a question asked before against the same LLM and index version is at
+    least `similarity_threshold` similar (cosine similarity of the question embeddings). Entries expire `ttl_seconds`
+    after they were created and the least recently used ones are evicted beyond `max_entries`. Answers from other index
+    versions are dropped by `invalidate` once a scan changed the index.
+    """
+
+    def __init__(self, cache_file_path: str = ANSWER_CACHE_FILE, max_entries: int = 1000,
+                 ttl_seconds: Optional[float] = 3600.0, similarity_threshold: float = 0.95):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+        self._conn = sqlite3.connect(cache_file_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS answers '
+                           '(id INTEGER PRIMARY KEY, llm TEXT NOT NULL, index_version TEXT NOT NULL, '
+                           'question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, '
+                           'sources TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS answers_scope ON answers (llm, index_version)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)')
+        self._conn.commit()
+
+    def get(self, embedding: List[float], llm: str, index_version: str) -> Optional[CachedAnswer]:
+        """
+        :return: the answer to the most similar question asked before, if it is similar enough
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute('SELECT id, embedding FROM answers WHERE llm = ? AND index_version = ? AND '
+                                      'created > ?', (llm, index_version, self._oldest(now))).fetchall()
+            if len(rows) == 0:
+                return None
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows])
+            # stored embeddings are normalized
+            similarities = vectors @ _normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self._similarity_threshold:
+                return None
+            entry_id = rows[best][0]
+            question, answer, sources, created = self._conn.execute(
+                'SELECT question, answer, sources, created FROM answers WHERE id = ?', (entry_id,)).fetchone()
+            self._conn.execute('UPDATE answers SET last_used = ? WHERE id = ?', (now, entry_id))
+            self._conn.commit()
+        return CachedAnswer(question=question, answer=answer, source_documents=_load_documents(sources),
+                            created=created, similarity=float(similarities[best]))
+
+    def put(self, embedding: List[float], llm: str, index_version: str, question: str, answer: str,
+            source_documents: List[Document]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO answers (llm, index_version, question, embedding, answer, sources, created, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (llm, index_version, question, _normalize(embedding).tobytes(), answer,
+                 _dump_documents(source_documents), now, now))
+            self._conn.execute('DELETE FROM answers WHERE created <= ?', (self._oldest(now),))
+            overflow = self._conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - self._max_entries
+            if overflow > 0:
+                self._conn.execute('DELETE FROM answers WHERE id IN '
+                                   '(SELECT id FROM answers ORDER BY last_used LIMIT ?)', (overflow,))
+            self._conn.commit()
+
+    def invalidate(self, index_version: str) -> int:
+        """
+        Drops the answers given from any other version of the index.
+
+        :return: number of answers dropped
+        """
+        with self._lock:
+            count = self._conn.execute('DELETE FROM answers WHERE index_version != ?', (index_version,)).rowcount
+            self._conn.commit()
+        return count
+
+    def _oldest(self, now: float) -> float:
+        return now - self._ttl_seconds if self._ttl_seconds is not None else float('-inf')
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _dump_documents(documents: List[Document]) -> str:
+    # metadata values are plain JSON types, except numpy scalars that may come from the docstore columns
+    return json.dumps([{'page_content': d.page_content, 'metadata': d.metadata} for d in documents],
+                      default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+
+def _load_documents(sources: str) -> List[Document]:
+    return [Document(page_content=d['page_content'], metadata=d['metadata']) for d in json.loads(sources)]
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, List, Optional, TextIO
+
+if TYPE_CHECKING:
+    from loguru.core.fs_log_rag import LoguruRAG
+
+
+def read_questions(lines: Iterable[str]) -> List[str]:
+    """
+    :return: the questions in `lines`, one per line. Blank lines and lines starting with # are skipped
+    """
+    questions = []
+    for line in lines:
+        line = line.strip()
+        if line != '' and not line.startswith('#'):
+            questions.append(line)
+    return questions
+
+
+class _RateLimiter:
+    """
+    Spaces out calls evenly, so that at most `per_minute` start in any minute.
+    """
+
+    def __init__(self, per_minute: int):
+        self._interval = 60.0 / per_minute
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.time()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class BatchQueryRunner:
+    """
+    Answers a batch of questions with one warm engine, `concurrency` at a time, without the interactive session.
+
+    Questions are scheduled by asyncio and answered in a thread pool, as the daemon does: most of the time goes to
+    waiting for the LLM, which the pool overlaps, while the embedding model, index and LLM client are shared. With
+    `questions_per_minute`, questions are also spaced out to stay within the rate limit of the LLM service.
+
+    One JSON line is written per question, in the order of the questions, as soon as it and the questions before it
+    are answered: the question, the answer (or the error), the log entries it is based on and its timings.
+    """
+
+    def __init__(self, rag: 'LoguruRAG', concurrency: int = 4, questions_per_minute: Optional[int] = None,
+                 use_cache: bool = True):
+        self._rag = rag
+        self._concurrency = concurrency
+        self._questions_per_minute = questions_per_minute
+        self._use_cache = use_cache
+
+    def run(self, questions: List[str], output: TextIO) -> int:
+        """
+        :return: number of questions that could not be answered
+        """
+        return asyncio.run(self._run(questions, output))
+
+    async def _run(self, questions: List[str], output: TextIO) -> int:
+        semaphore = asyncio.Semaphore(self._concurrency)
+        rate_limiter = _RateLimiter(self._questions_per_minute) if self._questions_per_minute else None
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(self._concurrency, thread_name_prefix='loguru-query') as executor:
+            async def _answer(index: int, question: str) -> dict:
+                submitted = time.time()
+                async with semaphore:
+                    if rate_limiter is not None:
+                        await rate_limiter.wait()
+                    return await loop.run_in_executor(executor, self._answer, index, question, submitted)
+
+            tasks = [asyncio.ensure_future(_answer(i, q)) for i, q in enumerate(questions)]
+            failed = 0
+            for task in tasks:
+                result = await task
+                failed += result['error'] is not None
+                output.write(json.dumps(result, default=_json_default) + '\n')
+                output.flush()
+        return failed
+
+    def _answer(self, index: int, question: str, submitted: float) -> dict:
+        start_time = time.time()
+        first_token_time = None
+
+        def _on_token(text: str):
+            nonlocal first_token_time
+            if first_token_time is None:
+                first_token_time = time.time()
+
+        result = {'index': index, 'question': question, 'answer': None, 'sources': [], 'error': None}
+        try:
+            answer, source_docs = self._rag.ask(question, use_cache=self._use_cache, on_token=_on_token)
+            result['answer'] = answer
+            result['sources'] = [{'page_content': d.page_content, 'metadata': d.metadata} for d in source_docs]
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        end_time = time.time()
+        result['timings'] = {'queued': start_time - submitted, 'total': end_time - start_time,
+                             'time_to_first_token': first_token_time - start_time if first_token_time else None}
+        return result
+
+
+def _json_default(value):
+    # numpy scalars may come from the docstore columns
+    return value.item() if hasattr(value, 'item') else str(value)
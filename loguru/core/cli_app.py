@@ -1,10 +1,11 @@
 import os.path
-import random
 import sys
+import threading
+import time
 import traceback
+from typing import List, Optional, TextIO
 
 from langchain_core.messages import AIMessage
-from langchain_experimental.llms.ollama_functions import OllamaFunctions
 from prettytable import PrettyTable
 from prompt_toolkit import PromptSession
 from prompt_toolkit.application import run_in_terminal
@@ -13,9 +14,15 @@ from prompt_toolkit.key_binding import KeyBindings
 
 from loguru import LOGURU_DATA_DIR
 from loguru.core.fs_log_rag import LoguruRAG
+from loguru.core.log_search import GREP_USAGE, PAGE_SIZE, parse_grep_args, print_paginated
+from loguru.core.metrics import METRICS, metrics_delta
+from loguru.core.models.log_filter import LogFilter
 from loguru.core.models.config import Config
 
 bindings = KeyBindings()
+PROFILES_DIR = os.path.join(LOGURU_DATA_DIR, 'profiles')
+# functions listed after a profiled question, by cumulative time
+PROFILE_TOP_FUNCTIONS = 25
 
 
 def _help_for_app_exit():
@@ -33,10 +40,20 @@ def confirm_quit_cd(event):
 
 
 class CLIApp:
-    def __init__(self, config: Config, with_tools=False, tool_registry: [] = None):
+    def __init__(self, config: Config, with_tools=False, tool_registry: [] = None, use_answer_cache: bool = True,
+                 follow: bool = False):
+        """
+        :param follow: keep indexing log lines as they are written while the session runs, instead of scanning before
+            each question
+        """
         self._config = config
+        self._use_answer_cache = use_answer_cache
+        self._follow = follow
+        self._follower = None
         self._with_tools = with_tools
         self._tool_registry = tool_registry
+        self._rag = None
+        self._last_scan_time: Optional[float] = None
         if with_tools:
             # print("Using tools...")
             pass
@@ -55,6 +72,7 @@ class CLIApp:
         :param stream:
         :return:
         """
+        from langchain_experimental.llms.ollama_functions import OllamaFunctions
         llm = OllamaFunctions(model=model, base_url=base_url, format="json", temperature=0)
         llm_with_tools = llm.bind_tools(self._tool_registry)
         try:
@@ -82,19 +100,24 @@ class CLIApp:
 
     # noinspection PyMethodMayBeStatic
 
-    def _llm_interact(self, input_text: str, with_tools: bool = False, stream: bool = False):
+    def _llm_interact(self, input_text: str, with_tools: bool = False, stream: bool = False, use_cache: bool = True):
         try:
             if with_tools:
+                from loguru.core.ollama_pool import get_pool
+                ollama = self._config.ollama
                 self._call_tools(
                     query=input_text,
-                    model=self._config.ollama.llm_name,
-                    base_url=str(random.choice(self._config.ollama.hosts)),
+                    model=ollama.llm_name,
+                    base_url=get_pool(ollama.hosts, connect_timeout=ollama.connect_timeout,
+                                      request_timeout=ollama.request_timeout,
+                                      retry_delay=ollama.retry_delay).best_url(),
                     stream=False
                 )
             else:
                 self._ask_llm_raw(
                     query=input_text,
-                    stream=False
+                    stream=stream,
+                    use_cache=use_cache and self._use_answer_cache
                 )
         except Exception as e:
             print("Oops, we hit a snag!")
@@ -102,14 +125,192 @@ class CLIApp:
             print(f"Error: {e}")
             traceback.print_exc(file=sys.stdout)
 
-    def _ask_llm_raw(self, query: str, stream: bool = True):
-        lg = LoguruRAG(config=self._config)
+    def _get_rag(self) -> LoguruRAG:
+        # one engine per session so that the embedding model, index and LLM client stay warm between questions
+        if self._rag is None:
+            self._rag = LoguruRAG(config=self._config, on_progress=print)
+        return self._rag
+
+    def _scan(self):
+        self._get_rag().scan()
+        self._last_scan_time = time.time()
+
+    def _scan_if_due(self):
+        """
+        Scans the logs if they were not scanned yet, or `session.rescan_interval` seconds ago. Scanning walks all the
+        scan locations and waits for other scans, too slow to do before every question. The engine picks up the index
+        changed by other scans (e.g. `loguru scan --follow`) by itself.
+        """
+        if self._follower is not None:
+            return
+        rescan_interval = self._config.session.rescan_interval
+        if self._last_scan_time is None or \
+                (rescan_interval > 0 and time.time() - self._last_scan_time >= rescan_interval):
+            self._scan()
+
+    def _ask_llm_raw(self, query: str, stream: bool = True, use_cache: bool = True):
+        lg = self._get_rag()
+        lg.reset_timings()
+        self._scan_if_due()
+        resp = lg.ask(question=query, stream=stream, use_cache=use_cache)
+
+    def _show_timings(self):
+        timings = {} if self._rag is None else self._rag.timings
+        if len(timings) == 0:
+            print("No timings recorded yet. Ask a question first.")
+            return
+        cols = ["Stage", "Time (seconds)"]
+        t = PrettyTable(cols)
+        t.align[cols[0]] = "l"
+        t.align[cols[1]] = "r"
+        for stage, seconds in timings.items():
+            t.add_row([stage, round(seconds, 3)])
+        print(t)
+        stats = self._rag.generation_stats
+        if len(stats) > 0:
+            print(f"Generated {stats['output_tokens']} tokens at {stats['tokens_per_second']:.1f} tokens/second.")
+
+    def _show_stats(self):
+        snapshot = METRICS.snapshot()
+        if len(snapshot['timers']) == 0 and len(snapshot['counters']) == 0:
+            print("No metrics recorded yet. Ask a question first.")
+            return
+        cols = ["Stage", "Count", "Total (s)", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"]
+        t = PrettyTable(cols)
+        t.align = "r"
+        t.align[cols[0]] = "l"
+        for stage, timer in sorted(snapshot['timers'].items()):
+            t.add_row([stage, timer['count'], round(timer['total'], 3)] +
+                      [round(timer[k] * 1000, 1) for k in ('mean', 'p50', 'p95', 'p99', 'max')])
+        print(t)
+        if len(snapshot['histograms']) > 0:
+            cols = ["Histogram", "Count", "Mean", "p50", "p95", "p99", "Max"]
+            t = PrettyTable(cols)
+            t.align = "r"
+            t.align[cols[0]] = "l"
+            for name, histogram in sorted(snapshot['histograms'].items()):
+                t.add_row([name, histogram['count']] +
+                          [round(histogram[k], 1) for k in ('mean', 'p50', 'p95', 'p99', 'max')])
+            print(t)
+        self._print_counters(snapshot['counters'])
+
+    @staticmethod
+    def _print_counters(counters: dict):
+        if len(counters) == 0:
+            return
+        cols = ["Counter", "Value"]
+        t = PrettyTable(cols)
+        t.align[cols[0]] = "l"
+        t.align[cols[1]] = "r"
+        for name, value in sorted(counters.items()):
+            t.add_row([name, round(value, 3)])
+        print(t)
+
+    def _profile(self, question: str):
+        """
+        Answers a question under cProfile, then lists the functions it spent the most time in and the stages it went
+        through. The profile is saved for a closer look, e.g. with `python -m pstats` or snakeviz.
+        """
+        import cProfile
+        import pstats
+        before = METRICS.snapshot()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self._llm_interact(input_text=question, with_tools=self._with_tools, stream=True, use_cache=False)
+        finally:
+            profiler.disable()
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILES_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(profile_path)
+        # shards searched on other threads show up as time waiting for them
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+        delta = metrics_delta(before, METRICS.snapshot())
+        cols = ["Stage", "Count", "Total (ms)"]
+        t = PrettyTable(cols)
+        t.align = "r"
+        t.align[cols[0]] = "l"
+        for stage, timer in sorted(delta['timers'].items(), key=lambda item: -item[1]['total']):
+            t.add_row([stage, timer['count'], round(timer['total'] * 1000, 1)])
+        print(t)
+        self._print_counters(delta['counters'])
+        print(f"Profile saved to {profile_path}")
+
+    def _grep(self, args: str):
+        try:
+            pattern, regex, ignore_case, severity = parse_grep_args(args)
+            log_filter = LogFilter(severities=[severity]) if severity is not None else None
+            lg = self._get_rag()
+            self._scan_if_due()
+            if print_paginated(lg.grep(pattern, regex=regex, ignore_case=ignore_case, log_filter=log_filter),
+                               PAGE_SIZE, interactive=sys.stdout.isatty()) == 0:
+                print("No matching log entries found.")
+        except Exception as e:
+            print(f"Error: {e}")
+
+    def ask(self, question: str, profile: bool = False):
+        """
+        Answers a single question, without starting the interactive session.
+
+        :param profile: profile answering the question with cProfile, see `_profile`
+        """
+        if profile:
+            self._profile(question)
+        else:
+            self._llm_interact(input_text=question, with_tools=self._with_tools, stream=True)
+
+    def query(self, questions: List[str], output: TextIO, concurrency: Optional[int] = None) -> int:
+        """
+        Answers questions without the interactive session, writing one JSON line per question to `output`.
+
+        :param concurrency: number of questions answered at the same time, `query.concurrency` of the config if not set
+        :return: number of questions that could not be answered
+        """
+        from loguru.core.batch_query import BatchQueryRunner
+        lg = self._get_rag()
         lg.scan()
-        resp = lg.ask(question=query, stream=stream)
+        lg.warm_up()
+        query_config = self._config.query
+        runner = BatchQueryRunner(lg, concurrency=concurrency or query_config.concurrency,
+                                  questions_per_minute=query_config.questions_per_minute.get(self._config.service),
+                                  use_cache=self._use_answer_cache)
+        return runner.run(questions, output)
 
     def scan_and_rebuild_cache(self):
         LoguruRAG(config=self._config).scan(clean_and_rebuild=True)
 
+    def scan_and_update_cache(self):
+        if LoguruRAG(config=self._config).scan() == 0:
+            print("Index is up to date.")
+
+    def follow(self):
+        """
+        Indexes log lines as they are written, until interrupted.
+        """
+        from loguru.core.log_follower import FollowBatch, LogFollower
+
+        def _print_batch(batch: FollowBatch):
+            removed = f", removed {batch.entries_removed}" if batch.entries_removed > 0 else ""
+            print(f"Indexed {batch.entries_added} new log entries from {batch.files} file(s){removed}, searchable "
+                  f"{round(batch.lag, 2)} seconds after they were written (scan took {round(batch.scan_time, 2)} "
+                  f"seconds).")
+
+        print("Following the scan locations for new log lines. Press Ctrl+C to stop.")
+        follower = LogFollower(config=self._config, on_batch=_print_batch)
+        try:
+            follower.run()
+        except KeyboardInterrupt:
+            follower.stop()
+
+    def _start_follower(self):
+        from loguru.core.log_follower import LogFollower
+        lg = self._get_rag()
+        # index what was written since the last scan before the first question, then keep up in the background
+        lg.scan()
+        self._follower = LogFollower(config=self._config, embedding_model=lg.embedding_model)
+        threading.Thread(target=self._follower.run, name='loguru-follower', daemon=True).start()
+
     def start(self):
         from prompt_toolkit.styles import Style
         from prompt_toolkit.shortcuts import CompleteStyle
@@ -150,6 +351,13 @@ class CLIApp:
             _cmd_help_dict = {
                 '/?': 'Show this help',
                 '/history': 'Show history',
+                '/timings': 'Show the latency of each stage of the last query',
+                '/stats': 'Show the latency distribution of each stage, token, cache and host counters of the session. '
+                          'Usage: /stats [reset]',
+                '/profile': 'Answer a question under cProfile and show where the time went. Usage: /profile <question>',
+                '/grep': f'Search the logs for text, without the LLM. Usage: {GREP_USAGE}',
+                '/scan': 'Index the log lines written since the last scan now',
+                '/fresh': 'Ask a question without reusing a cached answer. Usage: /fresh <question>',
                 '/bye': 'Exit'
             }
             cols = ["Command", "Description"]
@@ -160,10 +368,16 @@ class CLIApp:
                 t.add_row([k, _cmd_help_dict[k]])
             print(t)
 
+        if self._follow:
+            self._start_follower()
+        else:
+            self._scan()
         while True:
             user_input = _get_user_input()
             if user_input == '/bye':
                 clear_last()
+                if self._follower is not None:
+                    self._follower.stop()
                 break
             elif user_input == '/?':
                 clear_last()
@@ -172,10 +386,44 @@ class CLIApp:
                 clear_last()
                 for c in history.get_strings():
                     print(c)
+            elif user_input == '/timings':
+                clear_last()
+                self._show_timings()
+            elif user_input == '/stats':
+                clear_last()
+                self._show_stats()
+            elif user_input == '/stats reset':
+                clear_last()
+                METRICS.reset()
+                print("Metrics reset.")
+            elif user_input.startswith('/profile '):
+                clear_last()
+                self._profile(user_input[len('/profile '):])
+            elif user_input == '/scan':
+                clear_last()
+                try:
+                    if self._follower is not None:
+                        print("The logs are followed, the index is already up to date.")
+                    else:
+                        self._scan()
+                except Exception as e:
+                    print(f"Error: {e}")
+            elif user_input == '/grep' or user_input.startswith('/grep '):
+                clear_last()
+                self._grep(user_input[len('/grep'):])
+            elif user_input.startswith('/fresh '):
+                clear_last()
+                self._llm_interact(
+                    input_text=user_input[len('/fresh '):],
+                    with_tools=self._with_tools,
+                    stream=True,
+                    use_cache=False
+                )
             elif user_input.strip() == '':
                 continue
             else:
                 self._llm_interact(
                     input_text=user_input,
-                    with_tools=self._with_tools  # Change to False for raw LLM response
+                    with_tools=self._with_tools,  # Change to False for raw LLM response
+                    stream=True
                 )
@@ -0,0 +1,110 @@
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import zlib
+from typing import BinaryIO, Iterator, Optional
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+XZ = 'xz'
+ZSTD = 'zstd'
+
+# magic bytes of the compressed formats, rotated logs are recognized by their content rather than their file name
+_MAGIC = [(b'\x1f\x8b\x08', GZIP), (b'BZh', BZIP2), (b'\xfd7zXZ\x00', XZ), (b'\x28\xb5\x2f\xfd', ZSTD)]
+MAGIC_BYTES = 6
+READ_SIZE = 1024 * 1024
+# typical compression ratio of text logs, to weigh archives against plain files before decompressing them
+ARCHIVE_EXPANSION_ESTIMATE = 10
+
+# raised by the decompressors on corrupt or truncated archives
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError)
+
+
+def detect_compression(file: BinaryIO) -> Optional[str]:
+    """
+    :param file: file opened in binary mode at its first byte, left there
+    :return: compression format of the file, None for a plain text file
+    """
+    magic = file.read(MAGIC_BYTES)
+    file.seek(0)
+    for prefix, compression in _MAGIC:
+        if magic.startswith(prefix):
+            if compression == BZIP2 and magic[3:4] not in b'123456789':
+                continue
+            return compression
+    return None
+
+
+def compression_of(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        return detect_compression(f)
+
+
+def can_decompress(compression: Optional[str]) -> bool:
+    """
+    :return: False for zstd archives if the optional zstandard package is not installed
+    """
+    if compression != ZSTD:
+        return True
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def decompressing_reader(file: BinaryIO, compression: str) -> BinaryIO:
+    """
+    Streams the decompressed bytes of an archive opened in binary mode, a buffer at a time. Closing the reader leaves
+    `file` open.
+    """
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if compression == BZIP2:
+        return bz2.BZ2File(file, mode='rb')
+    if compression == XZ:
+        return lzma.LZMAFile(file, mode='rb')
+    if compression == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading zstd compressed log files requires the zstandard package: "
+                             "pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True, closefd=False)
+        return io.BufferedReader(reader, buffer_size=READ_SIZE)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+@contextlib.contextmanager
+def open_log_file(path: str) -> Iterator[BinaryIO]:
+    """
+    Opens a log file in binary mode, decompressing it on the fly if it is a .gz, .bz2, .xz or .zst archive. Offsets
+    in an archive are offsets in its decompressed bytes.
+    """
+    with open(path, 'rb') as f:
+        compression = detect_compression(f)
+        if compression is None:
+            yield f
+        else:
+            with decompressing_reader(f, compression) as reader:
+                yield reader
+
+
+def seek_log_file(file: BinaryIO, offset: int):
+    """
+    Moves to `offset` in a log file opened with `open_log_file`, reading forward through archive streams that cannot
+    seek (zstd).
+    """
+    if file.seekable():
+        file.seek(offset)
+        return
+    remaining = offset - file.tell()
+    if remaining < 0:
+        raise io.UnsupportedOperation("Cannot seek backwards in a compressed stream")
+    while remaining > 0:
+        skipped = len(file.read(min(remaining, READ_SIZE)))
+        if skipped == 0:
+            break
+        remaining -= skipped
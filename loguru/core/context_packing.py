@@ -0,0 +1,90 @@
+import math
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from loguru.core.log_fields import format_timestamp
+from loguru.core.templates import mask_variables
+
+# log entries hold more tokens per character than prose (numbers, IDs, punctuation), so estimates err on the high side
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens `text` takes up in a prompt, without depending on the tokenizer of each model.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def dedupe(documents: List[Document]) -> List[Document]:
+    """
+    Collapses log entries that only differ in variables (IDs, numbers, timestamps) into the best ranked one, noting how
+    many entries were left out and when they occurred.
+
+    :param documents: entries, best ranked first
+    """
+    groups: Dict[str, List[Document]] = {}
+    for document in documents:
+        groups.setdefault(mask_variables(document.page_content), []).append(document)
+    deduped = []
+    for group in groups.values():
+        first = group[0]
+        if len(group) == 1:
+            deduped.append(first)
+            continue
+        note = f"[{len(group) - 1} similar entries left out"
+        timestamps = [d.metadata['timestamp'] for d in group if 'timestamp' in d.metadata]
+        if len(timestamps) > 0:
+            note += f", from {format_timestamp(min(timestamps))} to {format_timestamp(max(timestamps))}"
+        deduped.append(Document(page_content=f"{first.page_content}\n{note}]",
+                                metadata={**first.metadata, 'duplicates': len(group) - 1}))
+    return deduped
+
+
+def pack(documents: List[Document], max_tokens: int) -> Tuple[List[Document], List[Document]]:
+    """
+    Keeps the best ranked log entries that fit in `max_tokens`.
+
+    :param documents: entries, best ranked first
+    :return: the kept entries in chronological order, and the entries left out
+    """
+    packed, left_out, used = [], [], 0
+    for document in documents:
+        tokens = estimate_tokens(document.page_content)
+        if used + tokens <= max_tokens:
+            packed.append(document)
+            used += tokens
+        elif len(packed) == 0:
+            # an entry larger than the whole budget (e.g. a long stack trace) is cut rather than dropped
+            packed.append(Document(page_content=document.page_content[:max_tokens * CHARS_PER_TOKEN],
+                                   metadata=document.metadata))
+            used = max_tokens
+        else:
+            left_out.append(document)
+    return sorted(packed, key=_chronological_order), left_out
+
+
+def split_into_batches(documents: List[Document], max_tokens: int) -> List[List[Document]]:
+    """
+    Splits log entries into consecutive batches of up to `max_tokens` each.
+    """
+    batches, used = [], 0
+    for document in documents:
+        tokens = min(estimate_tokens(document.page_content), max_tokens)
+        if len(batches) == 0 or used + tokens > max_tokens:
+            batches.append([])
+            used = 0
+        batches[-1].append(document)
+        used += tokens
+    return batches
+
+
+def total_tokens(documents: List[Document]) -> int:
+    return sum(estimate_tokens(d.page_content) for d in documents)
+
+
+def _chronological_order(document: Document) -> tuple:
+    metadata = document.metadata
+    return (metadata.get('timestamp', -1), metadata.get('log_dir', ''), metadata.get('file_name', ''),
+            metadata.get('offset', 0))
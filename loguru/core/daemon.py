@@ -0,0 +1,251 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from loguru.core.daemon_client import DEFAULT_SOCKET_PATH, DaemonClient
+from loguru.core.fs_log_rag import LoguruRAG
+from loguru.core.models.config import Config
+
+Emit = Callable[[dict], None]
+Send = Callable[[dict], Awaitable[None]]
+
+
+class _ReadWriteLock:
+    """
+    Lets any number of questions be answered at the same time, while scans, which change the index, run alone.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer)
+            self._writer = True
+            await self._condition.wait_for(lambda: self._readers == 0)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class _LineEmitter(io.TextIOBase):
+    # forwards what a scan prints to the client, line by line
+    def __init__(self, emit: Emit):
+        self._emit = emit
+        self._buffer = ''
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self._emit({'type': 'output', 'text': line})
+        return len(text)
+
+    def flush(self):
+        if self._buffer != '':
+            self._emit({'type': 'output', 'text': self._buffer})
+            self._buffer = ''
+
+
+class LoguruDaemon:
+    """
+    Keeps a warm engine (embedding model, index, LLM clients) in memory and answers questions from `DaemonClient`s.
+
+    Clients are served concurrently by asyncio, the engine runs in a thread pool: questions are answered in parallel
+    (mostly waiting for the LLM) and streamed back as they are generated, scans wait for the questions being answered
+    and hold back new ones until the index is updated.
+    """
+
+    def __init__(self, config: Config, socket_path: Optional[str] = None, port: Optional[int] = None,
+                 max_concurrent_questions: int = 8, scan_interval: Optional[float] = 60.0):
+        self._rag = LoguruRAG(config=config)
+        self._socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self._port = port
+        self._scan_interval = scan_interval
+        # one more thread for scans
+        self._executor = ThreadPoolExecutor(max_concurrent_questions + 1, thread_name_prefix='loguru-daemon')
+        self._lock = None
+
+    def serve(self):
+        """
+        Serves clients until interrupted.
+        """
+        if self._port is None:
+            self._remove_stale_socket()
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self._port is None and os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self._socket_path):
+            return
+        if DaemonClient(socket_path=self._socket_path).is_running():
+            raise RuntimeError(f"A daemon is already listening on {self._socket_path}")
+        os.remove(self._socket_path)
+
+    async def _serve(self):
+        self._lock = _ReadWriteLock()
+        loop = asyncio.get_running_loop()
+        print("Loading models and index...")
+        start_time = time.time()
+        await self._scan(_print_output)
+        await loop.run_in_executor(self._executor, self._rag.warm_up)
+        print(f"Ready in {round(time.time() - start_time, 2)} seconds.")
+
+        if self._port is not None:
+            server = await asyncio.start_server(self._handle, host='127.0.0.1', port=self._port)
+            address = f"127.0.0.1:{self._port}"
+        else:
+            # the daemon answers from the logs of the user running it, only that user may connect: the socket is
+            # created without permissions for others, rather than restricted once others could already connect
+            umask = os.umask(0o077)
+            try:
+                server = await asyncio.start_unix_server(self._handle, path=self._socket_path)
+            finally:
+                os.umask(umask)
+            os.chmod(self._socket_path, 0o600)
+            address = self._socket_path
+        print(f"Listening on {address}. Press Ctrl+C to stop.")
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+        scan_task = asyncio.ensure_future(self._scan_periodically()) if self._scan_interval else None
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if scan_task is not None:
+                scan_task.cancel()
+        print("Stopped.")
+
+    async def _scan_periodically(self):
+        while True:
+            await asyncio.sleep(self._scan_interval)
+            try:
+                await self._scan(_discard)
+            except Exception as e:
+                print(f"Scan failed: {e}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                await self._dispatch(line, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes, writer: asyncio.StreamWriter):
+        async def _send(message: dict):
+            writer.write(json.dumps(message, default=_json_default).encode('utf-8') + b'\n')
+            await writer.drain()
+
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'ping':
+                await _send({'type': 'done'})
+            elif op == 'ask':
+                answer, source_docs = await self._stream(
+                    self._lock.read(), lambda emit: self._rag.ask(
+                        request['question'], use_cache=request.get('use_cache', True),
+                        on_token=lambda text: emit({'type': 'token', 'text': text})), _send)
+                await _send({'type': 'done', 'answer': answer,
+                             'sources': [{'page_content': d.page_content, 'metadata': d.metadata}
+                                         for d in source_docs]})
+            elif op == 'scan':
+                changes = await self._scan(_send, rebuild=request.get('rebuild', False))
+                await _send({'type': 'done', 'changes': changes})
+            else:
+                await _send({'type': 'error', 'message': f"Unknown operation: {op}"})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            await _send({'type': 'error', 'message': f"{type(e).__name__}: {e}"})
+
+    async def _scan(self, send: Send, rebuild: bool = False) -> int:
+        def _scan(emit: Emit) -> int:
+            # scans run alone, so nothing else prints while stdout is redirected
+            output = _LineEmitter(emit)
+            with contextlib.redirect_stdout(output):
+                try:
+                    return self._rag.scan(clean_and_rebuild=rebuild)
+                finally:
+                    output.flush()
+
+        return await self._stream(self._lock.write(), _scan, send)
+
+    async def _stream(self, lock, work: Callable[[Emit], object], send: Send) -> object:
+        """
+        Runs `work` in the thread pool while holding `lock`, sending the messages it emits as they come.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def _work():
+            try:
+                return work(lambda message: loop.call_soon_threadsafe(queue.put_nowait, message))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        async with lock:
+            future = loop.run_in_executor(self._executor, _work)
+            connected = True
+            while (message := await queue.get()) is not None:
+                if not connected:
+                    continue
+                try:
+                    await send(message)
+                except ConnectionError:
+                    # the client went away, let the work finish so the engine stays consistent
+                    connected = False
+            result = await future
+        if not connected:
+            raise ConnectionResetError("Client disconnected")
+        return result
+
+
+def _json_default(value):
+    # numpy scalars may come from the docstore columns
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+async def _print_output(message: dict):
+    if message['type'] == 'output':
+        print(message['text'])
+
+
+async def _discard(message: dict):
+    pass
@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+from typing import Iterator, Optional
+
+from loguru import LOGURU_DATA_DIR
+
+# only the standard library is imported here, so that talking to a running daemon starts fast
+DEFAULT_SOCKET_PATH = os.path.join(LOGURU_DATA_DIR, 'loguru.sock')
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class DaemonClient:
+    """
+    Talks to a `loguru serve` daemon over its Unix socket, or over localhost TCP if `port` is set.
+
+    Requests and responses are JSON objects, one per line. A request is answered by any number of `token` (part of an
+    answer) and `output` (a line printed while scanning) messages, then a `done` or an `error` message.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, port: Optional[int] = None,
+                 connect_timeout: float = 1.0):
+        self._socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self._port = port
+        self._connect_timeout = connect_timeout
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self._port}" if self._port is not None else self._socket_path
+
+    def _connect(self) -> socket.socket:
+        if self._port is not None:
+            sock = socket.create_connection(('127.0.0.1', self._port), timeout=self._connect_timeout)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._connect_timeout)
+            try:
+                sock.connect(self._socket_path)
+            except OSError:
+                sock.close()
+                raise
+        # answers can take minutes to start
+        sock.settimeout(None)
+        return sock
+
+    def is_running(self) -> bool:
+        try:
+            for _ in self.request('ping'):
+                pass
+            return True
+        except (OSError, DaemonError):
+            return False
+
+    def request(self, op: str, **params) -> Iterator[dict]:
+        """
+        Sends a request and yields the messages answering it, up to and including the `done` message.
+
+        :raises DaemonError: if the daemon answered with an error or closed the connection
+        """
+        with self._connect() as sock, sock.makefile('rwb') as stream:
+            stream.write(json.dumps({'op': op, **params}).encode('utf-8') + b'\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if message['type'] == 'error':
+                    raise DaemonError(message['message'])
+                yield message
+                if message['type'] == 'done':
+                    return
+        raise DaemonError(f"Connection to the daemon at {self.address} closed unexpectedly")
+
+    def ask(self, question: str, use_cache: bool = True) -> str:
+        """
+        Prints the answer to `question` while it is generated.
+
+        :return: the answer
+        """
+        from loguru.core.rendering import MarkdownStreamPrinter
+        printer = MarkdownStreamPrinter()
+        answer = ''
+        for message in self.request('ask', question=question, use_cache=use_cache):
+            if message['type'] == 'token':
+                printer.write(message['text'])
+            elif message['type'] == 'done':
+                answer = message['answer']
+        printer.close()
+        return answer
+
+    def scan(self, rebuild: bool = False) -> int:
+        """
+        Has the daemon bring its index up to date, printing its progress.
+
+        :return: number of files that were (re-)indexed or removed
+        """
+        changes = 0
+        for message in self.request('scan', rebuild=rebuild):
+            if message['type'] == 'output':
+                print(message['text'])
+            elif message['type'] == 'done':
+                changes = message['changes']
+        return changes
@@ -0,0 +1,367 @@
+import fnmatch
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from typing import Collection, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from loguru.core.lexical_index import LexicalIndex
+from loguru.core.log_fields import SEVERITIES
+from loguru.core.metadata_index import NO_SEVERITY, NO_TIMESTAMP, MetadataIndex, to_bitmap
+from loguru.core.models.log_filter import LogFilter
+
+HEADER_FILE_NAME = 'header.json'
+LEXICAL_DIR_NAME = 'lexical'
+FORMAT_VERSION = 3
+# variable length columns are stored as a bytes file plus an array of row start offsets
+_VAR_COLUMNS = ('id', 'text', 'extra')
+# low cardinality string columns are stored as codes into a dictionary kept in the header
+_DICT_COLUMNS = ('file', 'logger', 'thread')
+_FIXED_COLUMNS = {'offset': (np.int64, -1), 'timestamp': (np.int64, NO_TIMESTAMP), 'severity': (np.int8, NO_SEVERITY)}
+_WRITE_CHUNK_ROWS = 65536
+
+
+def saved_format_version(directory: str) -> Optional[int]:
+    try:
+        with open(os.path.join(directory, HEADER_FILE_NAME), 'r') as f:
+            return json.load(f)['version']
+    except FileNotFoundError:
+        return None
+
+
+class _Columns:
+    """
+    Read-only, memory-mapped columns of a saved docstore.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.num_rows = 0
+        self.dictionaries: Dict[str, list] = {name: [] for name in _DICT_COLUMNS}
+        self.var = {name: (np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64)) for name in _VAR_COLUMNS}
+        self.fixed = {name: np.zeros(0, dtype=np.int32) for name in _DICT_COLUMNS}
+        self.fixed.update({name: np.zeros(0, dtype=dtype) for name, (dtype, _) in _FIXED_COLUMNS.items()})
+        self.metadata_index: Optional[MetadataIndex] = None
+        self.lexical_index = LexicalIndex()
+        if directory is None or saved_format_version(directory) is None:
+            return
+        with open(os.path.join(directory, HEADER_FILE_NAME), 'r') as f:
+            header = json.load(f)
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported docstore format version {header['version']}")
+        self.num_rows = header['num_rows']
+        self.dictionaries = header['dictionaries']
+        for name in _VAR_COLUMNS:
+            self.var[name] = (_memmap_bytes(os.path.join(directory, f"{name}.bin")),
+                              np.load(os.path.join(directory, f"{name}.idx.npy"), mmap_mode='r'))
+        for name in self.fixed:
+            self.fixed[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        self.metadata_index = MetadataIndex.load(directory, self.num_rows)
+        self.lexical_index = LexicalIndex(os.path.join(directory, LEXICAL_DIR_NAME))
+
+    def get(self, name: str, row: int) -> bytes:
+        data, starts = self.var[name]
+        return data[starts[row]:starts[row + 1]].tobytes()
+
+
+def _memmap_bytes(path: str) -> np.ndarray:
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """
+    Docstore of log entries whose rows are aligned with the positions of the vector index.
+
+    Saved docstores keep the entry ids, texts and metadata in compact, memory-mapped columns (file, logger and thread
+    dictionary encoded, offset, timestamp and severity as fixed width columns, anything else as JSON), so opening one
+    does not deserialize anything and only the rows that are looked up are ever turned into `Document`s. A
+    `MetadataIndex` over the timestamp and severity columns and a `LexicalIndex` over the texts are saved alongside.
+    Added and deleted rows are kept in memory until the next `save`.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._load(directory)
+
+    def _load(self, directory: Optional[str]):
+        self._base = _Columns(directory)
+        self._dictionaries = {name: list(values) for name, values in self._base.dictionaries.items()}
+        self._dictionary_codes: Optional[Dict[str, dict]] = None
+        # position -> storage row, None while positions and rows of the saved columns still line up
+        self._rows: Optional[np.ndarray] = None
+        self._num_positions = self._base.num_rows
+        self._new: Dict[str, list] = {name: [] for name in _VAR_COLUMNS + _DICT_COLUMNS + tuple(_FIXED_COLUMNS)}
+        self._id_positions: Optional[Dict[str, int]] = None
+        self._metadata_index = self._base.metadata_index
+
+    def __len__(self) -> int:
+        return self._num_positions
+
+    def _row(self, position: int) -> int:
+        if position < 0 or position >= self._num_positions:
+            raise IndexError(f"Docstore position {position} out of range")
+        return int(self._rows[position]) if self._rows is not None else position
+
+    def _value(self, name: str, row: int):
+        if row >= self._base.num_rows:
+            return self._new[name][row - self._base.num_rows]
+        if name in self._base.var:
+            value = self._base.get(name, row)
+            return value if name == 'extra' else value.decode('utf-8')
+        return int(self._base.fixed[name][row])
+
+    def id_at(self, position: int) -> str:
+        return self._value('id', self._row(position))
+
+    def metadata_at(self, position: int) -> dict:
+        row = self._row(position)
+        metadata = {}
+        file = self._value('file', row)
+        if file >= 0:
+            metadata['log_dir'], metadata['file_name'] = self._dictionaries['file'][file]
+        for name, (_, missing) in _FIXED_COLUMNS.items():
+            value = self._value(name, row)
+            if value != missing:
+                metadata[name] = SEVERITIES[value] if name == 'severity' else value
+        for name in ('logger', 'thread'):
+            code = self._value(name, row)
+            if code >= 0:
+                metadata[name] = self._dictionaries[name][code]
+        extra = self._value('extra', row)
+        if len(extra) > 0:
+            metadata.update(json.loads(extra))
+        return metadata
+
+    def text_at(self, position: int) -> str:
+        return self._value('text', self._row(position))
+
+    def document(self, position: int) -> Document:
+        return Document(page_content=self._value('text', self._row(position)), metadata=self.metadata_at(position))
+
+    def _positions_by_id(self) -> Dict[str, int]:
+        # only needed to look documents up by id (updates and deletes), built on first use
+        if self._id_positions is None:
+            self._id_positions = {self.id_at(p): p for p in range(self._num_positions)}
+        return self._id_positions
+
+    def positions(self, ids: Collection[str]) -> List[int]:
+        """
+        :return: the positions of the given ids, ids that are not in the docstore are ignored
+        """
+        positions_by_id = self._positions_by_id()
+        return [positions_by_id[i] for i in ids if i in positions_by_id]
+
+    def search(self, search: str) -> Union[str, Document]:
+        position = self._positions_by_id().get(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document(position)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self.append(list(texts.keys()), [d.page_content for d in texts.values()],
+                    [d.metadata for d in texts.values()])
+
+    def _encode(self, name: str, value) -> int:
+        if self._dictionary_codes is None:
+            self._dictionary_codes = {n: {_hashable(v): i for i, v in enumerate(values)}
+                                      for n, values in self._dictionaries.items()}
+        codes = self._dictionary_codes[name]
+        code = codes.get(_hashable(value))
+        if code is None:
+            code = codes[_hashable(value)] = len(self._dictionaries[name])
+            self._dictionaries[name].append(value)
+        return code
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        first_row = self._base.num_rows + len(self._new['id'])
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            extra = dict(metadata)
+            file = -1
+            if 'log_dir' in extra and 'file_name' in extra:
+                file = self._encode('file', [extra.pop('log_dir'), extra.pop('file_name')])
+            self._new['file'].append(file)
+            for name in ('logger', 'thread'):
+                self._new[name].append(self._encode(name, extra.pop(name)) if isinstance(extra.get(name), str) else -1)
+            for name in ('offset', 'timestamp'):
+                self._new[name].append(extra.pop(name) if isinstance(extra.get(name), int) else _FIXED_COLUMNS[name][1])
+            severity = extra.pop('severity') if extra.get('severity') in SEVERITIES else None
+            self._new['severity'].append(SEVERITIES.index(severity) if severity is not None else NO_SEVERITY)
+            self._new['id'].append(doc_id)
+            self._new['text'].append(text)
+            self._new['extra'].append(json.dumps(extra).encode('utf-8') if len(extra) > 0 else b'')
+            if self._id_positions is not None:
+                self._id_positions[doc_id] = self._num_positions
+            self._num_positions += 1
+        if self._rows is not None:
+            new_rows = np.arange(first_row, self._base.num_rows + len(self._new['id']), dtype=np.int64)
+            self._rows = np.concatenate([self._rows, new_rows])
+        self._metadata_index = None
+
+    def rename_files(self, renames: Dict[str, str]):
+        """
+        Relabels the entries of log files that were moved (e.g. rotated from app.log to app.log.1), by old path.
+        Entries added for a new file at an old path afterwards are told apart from them.
+        """
+        files = self._dictionaries['file']
+        # codes are resolved before any is relabelled, a path may be both renamed and the new name of another file
+        new_files = {code: [os.path.dirname(renames[path]), os.path.basename(renames[path])]
+                     for code, path in enumerate(os.path.join(*file) for file in files) if path in renames}
+        for code, file in new_files.items():
+            # a file name may now appear twice in the dictionary (e.g. app.log.1 indexed before), which is harmless:
+            # filters match all its codes and new entries get the last one
+            files[code] = file
+        self._dictionary_codes = None
+
+    def delete(self, ids: List) -> None:
+        self.delete_positions(self.positions(ids))
+
+    def delete_positions(self, positions: Collection[int]):
+        """
+        Removes rows by position. Later rows move up, like the vectors of a flat FAISS index do on `remove_ids`.
+        """
+        if len(positions) == 0:
+            return
+        rows = self._rows if self._rows is not None else np.arange(self._num_positions, dtype=np.int64)
+        self._rows = np.delete(rows, np.fromiter(positions, dtype=np.int64))
+        self._num_positions = len(self._rows)
+        self._id_positions = None
+        self._metadata_index = None
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        :return: the values of a fixed width or dictionary encoded column, by position
+        """
+        dtype = _FIXED_COLUMNS[name][0] if name in _FIXED_COLUMNS else np.int32
+        base = self._base.fixed[name]
+        if len(self._new[name]) > 0:
+            base = np.concatenate([np.asarray(base, dtype=dtype), np.array(self._new[name], dtype=dtype)])
+        return base[self._rows] if self._rows is not None else base
+
+    def metadata_index(self) -> MetadataIndex:
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex.build(self.column('timestamp'), self.column('severity'))
+        return self._metadata_index
+
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        """
+        :return: the lexical index of the saved docstore, None if rows were added or deleted since it was saved
+        """
+        if self._rows is not None or len(self._new['id']) > 0:
+            return None
+        return self._base.lexical_index
+
+    def select(self, log_filter: LogFilter) -> Optional[np.ndarray]:
+        """
+        :return: bitmap (see `to_bitmap`) of the positions matching `log_filter`, None if it does not restrict anything
+        """
+        bitmap = self.metadata_index().select(severities=log_filter.severities, since=log_filter.since,
+                                              until=log_filter.until)
+        for name, patterns in (('logger', log_filter.loggers), ('thread', log_filter.threads)):
+            if not patterns:
+                continue
+            codes = [code for code, value in enumerate(self._dictionaries[name])
+                     if any(fnmatch.fnmatch(value, p) for p in patterns)]
+            matching = to_bitmap(np.isin(self.column(name), codes))
+            bitmap = matching if bitmap is None else bitmap & matching
+        return bitmap
+
+    def save(self, directory: str):
+        """
+        Writes the docstore to `directory` and reopens it from there.
+        """
+        tmp_directory = directory + '.tmp'
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        for name in _VAR_COLUMNS:
+            self._write_var_column(tmp_directory, name)
+        for name in self._base.fixed:
+            np.save(os.path.join(tmp_directory, f"{name}.npy"), self.column(name))
+        self.metadata_index().save(tmp_directory)
+        self._save_lexical_index(os.path.join(tmp_directory, LEXICAL_DIR_NAME))
+        with open(os.path.join(tmp_directory, HEADER_FILE_NAME), 'w') as f:
+            json.dump({'version': FORMAT_VERSION, 'num_rows': self._num_positions,
+                       'dictionaries': self._dictionaries}, f)
+
+        old_directory = directory + '.old'
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.exists(directory):
+            os.rename(directory, old_directory)
+        os.rename(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        self._load(directory)
+
+    def _save_lexical_index(self, directory: str):
+        num_base_rows = self._base.num_rows
+        if self._rows is None:
+            remap = None
+            new_positions = np.arange(num_base_rows, self._num_positions, dtype=np.int64)
+            new_texts = self._new['text']
+        else:
+            is_base = self._rows < num_base_rows
+            remap = np.full(num_base_rows, -1, dtype=np.int64)
+            remap[self._rows[is_base]] = np.flatnonzero(is_base)
+            new_positions = np.flatnonzero(~is_base)
+            new_texts = [self._new['text'][row - num_base_rows] for row in self._rows[~is_base]]
+        self._base.lexical_index.save(directory, self._num_positions, remap, new_positions, new_texts)
+
+    def _new_values(self, name: str) -> List[bytes]:
+        if name == 'extra':
+            return self._new[name]
+        return [v.encode('utf-8') for v in self._new[name]]
+
+    def _write_var_column(self, directory: str, name: str):
+        data, starts = self._base.var[name]
+        new_values = self._new_values(name)
+        with open(os.path.join(directory, f"{name}.bin"), 'wb') as f:
+            if self._rows is None:
+                # nothing was deleted: copy the saved column as is and append the new rows
+                f.write(memoryview(data))
+                new_lengths = np.fromiter((len(v) for v in new_values), dtype=np.int64, count=len(new_values))
+                new_starts = int(starts[-1]) + np.cumsum(new_lengths)
+                offsets = np.concatenate([np.asarray(starts, dtype=np.int64), new_starts])
+                for value in new_values:
+                    f.write(value)
+            else:
+                offsets = np.zeros(len(self._rows) + 1, dtype=np.int64)
+                written = 0
+                for chunk_start in range(0, len(self._rows), _WRITE_CHUNK_ROWS):
+                    chunk = []
+                    for row in self._rows[chunk_start:chunk_start + _WRITE_CHUNK_ROWS]:
+                        if row < self._base.num_rows:
+                            chunk.append(data[starts[row]:starts[row + 1]].tobytes())
+                        else:
+                            chunk.append(new_values[row - self._base.num_rows])
+                    for i, value in enumerate(chunk):
+                        written += len(value)
+                        offsets[chunk_start + i + 1] = written
+                    f.write(b''.join(chunk))
+        np.save(os.path.join(directory, f"{name}.idx.npy"), offsets)
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class PositionIds(Mapping):
+    """
+    Read-only `index_to_docstore_id` view over a `ColumnarDocstore`, so the ids are never loaded all at once.
+    """
+
+    def __init__(self, docstore: ColumnarDocstore):
+        self._docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        try:
+            return self._docstore.id_at(int(position))
+        except IndexError:
+            raise KeyError(position)
+
+    def __len__(self) -> int:
+        return len(self._docstore)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._docstore)))
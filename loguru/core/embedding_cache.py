@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from loguru import LOGURU_DATA_DIR
+from loguru.core.metrics import METRICS
+from loguru.core.templates import WILDCARD, mask_variables
+
+EMBEDDING_CACHE_FILE = os.path.join(LOGURU_DATA_DIR, 'embedding_cache.sqlite')
+
+_WHITESPACE = re.compile(r'\s+')
+# digits (and the hex digits around them) within tokens, e.g. in thread names, request IDs or error codes
+_DIGITS = re.compile(r'[0-9a-fA-F]*\d[0-9a-fA-F]*')
+# batches inserted between two exact counts of the cached embeddings, which other processes sharing the cache change too
+RECOUNT_EVERY_N_BATCHES = 100
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    entries: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def cache_key_text(text: str, split_patterns: Sequence[re.Pattern] = ()) -> str:
+    """
+    :return: the text a log entry is cached under: without the leading match of a split pattern (usually the
+        timestamp) and with its variables masked, so that repeated entries (heartbeats, health checks, retries...)
+        share one embedding
+    """
+    for split_pattern in split_patterns:
+        m = split_pattern.match(text)
+        if m is not None:
+            text = text[m.end():]
+            break
+    return _DIGITS.sub(WILDCARD, mask_variables(text))
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded LRU cache of embedding vectors keyed by a hash of (embedding model name, text).
+
+    Backed by SQLite so it can be shared by the embedding worker processes of a scan. Cumulative hit/miss counters are
+    kept in the same database.
+    """
+
+    def __init__(self, cache_file_path: str = EMBEDDING_CACHE_FILE, max_entries: int = 1000000):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+        self._conn = sqlite3.connect(cache_file_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings '
+                           '(key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._conn.commit()
+        # kept up to date with the rows inserted and evicted, as counting them takes a scan of the whole table. Rows
+        # replaced are counted as inserted, which only evicts a little early until the next count
+        self._num_entries = self._count()
+        self._batches_since_count = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        return hashlib.sha1(f"{model_name}\0{text}".encode('utf-8')).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if len(found) > 0:
+                now = time.time_ns()
+                self._conn.executemany('UPDATE embeddings SET last_used = ? WHERE key = ?',
+                                       [(now, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[bytes, List[float]]):
+        if len(items) == 0:
+            return
+        now = time.time_ns()
+        with self._lock:
+            cursor = self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)',
+                [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()]
+            )
+            self._num_entries += cursor.rowcount
+            self._batches_since_count += 1
+            if self._batches_since_count >= RECOUNT_EVERY_N_BATCHES:
+                self._num_entries = self._count()
+                self._batches_since_count = 0
+            overflow = self._num_entries - self._max_entries
+            if overflow > 0:
+                cursor = self._conn.execute('DELETE FROM embeddings WHERE key IN '
+                                            '(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)', (overflow,))
+                self._num_entries -= cursor.rowcount
+            self._conn.commit()
+
+    def _count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def record(self, hits: int, misses: int):
+        METRICS.incr('embedding_cache_hits', hits)
+        METRICS.incr('embedding_cache_misses', misses)
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?',
+                [('hits', hits, hits), ('misses', misses, misses)]
+            )
+            self._conn.commit()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            counters = dict(self._conn.execute('SELECT name, value FROM stats').fetchall())
+            entries = self._count()
+        return CacheStats(hits=counters.get('hits', 0), misses=counters.get('misses', 0), entries=entries)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so that repeated texts (heartbeats, health checks, retries...) are embedded only once.
+
+    Log entries that only differ in their timestamp, IDs or numbers are cached under the same key (see
+    `cache_key_text`) and get the embedding of the first of them that was embedded.
+    """
+
+    def __init__(self, embedding_model: Embeddings, model_name: str, cache: EmbeddingCache,
+                 split_patterns: Sequence[str] = ()):
+        """
+        :param split_patterns: patterns splitting the log entries of the scan locations, their match at the start of
+            an entry is left out of its key
+        """
+        self._embedding_model = embedding_model
+        self._model_name = model_name
+        self._cache = cache
+        self._split_patterns = [re.compile(p) for p in dict.fromkeys(split_patterns)]
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self._model_name, cache_key_text(t, self._split_patterns)) for t in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        vectors = self._cache.get_many(unique_keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = normalize_text(text)
+        if len(missing) > 0:
+            embedded = self._embedding_model.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            self._cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+        self._cache.record(hits=len(texts) - len(missing), misses=len(missing))
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized = normalize_text(text)
+        # queries may be embedded differently from documents, keep them apart in the cache
+        key = EmbeddingCache.key(f"{self._model_name}:query", normalized)
+        vector: Optional[List[float]] = self._cache.get_many([key]).get(key)
+        if vector is not None:
+            self._cache.record(hits=1, misses=0)
+            return vector
+        vector = self._embedding_model.embed_query(normalized)
+        self._cache.put_many({key: vector})
+        self._cache.record(hits=0, misses=1)
+        return vector
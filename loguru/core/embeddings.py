@@ -0,0 +1,43 @@
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from loguru import HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE
+from loguru.core.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+def load_embedding_model(model_name: str, normalize_embedding: bool = True,
+                         cache_max_entries: Optional[int] = None, split_patterns: Sequence[str] = ()) -> Embeddings:
+    """
+    :param cache_max_entries: wrap the model with the persistent embedding cache bounded to this many entries,
+        no caching if not set
+    :param split_patterns: patterns splitting the log entries, their timestamps are left out of the cache keys
+    """
+    embedding_model = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE},  # here we will run the model with CPU only
+        encode_kwargs={
+            'normalize_embeddings': normalize_embedding  # keep True to compute cosine similarity
+        }
+    )
+    if cache_max_entries is None:
+        return embedding_model
+    return CachedEmbeddings(embedding_model, model_name=model_name, cache=EmbeddingCache(max_entries=cache_max_entries),
+                            split_patterns=split_patterns)
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Gets the embedding model from `load` on the first text to embed, so that the index can be opened and grepped without
+    loading the model.
+    """
+
+    def __init__(self, load: Callable[[], Embeddings]):
+        self._load = load
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._load().embed_query(text)
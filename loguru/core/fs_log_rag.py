@@ -1,82 +1,376 @@
+import contextlib
+import functools
+import itertools
 import os
-import random
-import re
 import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Collection, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chains import RetrievalQA
-from langchain_anthropic import ChatAnthropic
-from langchain_community.chat_models import ChatOllama
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import OpenAI
 
-from loguru import LOGURU_DATA_DIR, HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE
+from loguru import LOGURU_DATA_DIR
+from loguru.core.answer_cache import AnswerCache
+from loguru.core.compression import ARCHIVE_EXPANSION_ESTIMATE, compression_of, open_log_file
+from loguru.core.context_packing import estimate_tokens
+from loguru.core.embedding_cache import CacheStats
+from loguru.core.embeddings import LazyEmbeddings, load_embedding_model
+from loguru.core.fs_walker import LogFileWalker, parse_size
+from loguru.core.index_builder import IndexBuilder, ShardedIndexBuilder
+from loguru.core.log_search import LogSearchEngine
+from loguru.core.log_parser import LogDocumentParser, LogEntry, iter_log_entries, log_entry_metadata
+from loguru.core.metrics import METRICS
+from loguru.core.models.manifest import doc_id, file_id
+from loguru.core.pipeline import FileResult, FileTask, ScanPipeline
+from loguru.core.rendering import MarkdownStreamPrinter, render_markdown
+from loguru.core.rerankers import CrossEncoderReranker
+from loguru.core.retrievers import (ContextPackingRetriever, HybridRetriever, LogFilterRetriever,
+                                    TemplateExpandingRetriever)
+from loguru.core.scan_manifest import MANIFEST_FILE_NAME, FileChange, ScanManifest, file_key
+from loguru.core.shard_catalog import CATALOG_FILE_NAME, ShardCatalog, ShardKey, time_bucket
+from loguru.core.sharded_store import ShardedVectorStore
+from loguru.core.templates import miner_from_config
 from loguru.core.models.config import Config, DataSource, Params
+from loguru.core.models.log_filter import LogFilter
+
+PIPELINE_MIN_BYTES = 64 * 1024 * 1024
+SCAN_LOCK_FILE = os.path.join(LOGURU_DATA_DIR, 'scan.lock')
+
+PROMPT_TEMPLATE = """
+        ### System:
+        You are an honest assistant.
+        You will accept contents of a log file and you will answer the question asked by the user appropriately.
+        If you don't know the answer, just say you don't know. Don't try to make up an answer.
+        If you find time, date or timestamps in the logs, 
+        make sure to convert the timestamp to more human-readable format in your response as DD/MM/YYYY HH:SS
+
+        ### Context:
+        {context}
+
+        ### User:
+        {question}
+
+        ### Response:
+        """
+
+MAP_PROMPT_TEMPLATE = """
+        ### System:
+        You are an honest assistant.
+        You will accept a part of the log entries relevant to a question. List the facts in these log entries that help
+        answer the question, such as errors, components, identifiers, timestamps and counts. Be brief.
+        If nothing in them is relevant, answer "Nothing relevant."
+
+        ### Context:
+        {context}
+
+        ### User:
+        {question}
+
+        ### Response:
+        """
+
+# context window sizes assumed for services whose model is not known to run with a bigger one
+CONTEXT_WINDOWS = {'gemini': 32768, 'openai': 4096, 'anthropic': 32768}
+# tokens of the context window kept free for the question
+QUESTION_TOKENS = 256
+
+
+@contextlib.contextmanager
+def _scan_lock():
+    """
+    Lets one scan at a time write the index, across processes (e.g. `loguru scan --follow` and a `loguru run` session).
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(SCAN_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+def _pending_bytes(task: FileTask) -> int:
+    size = os.path.getsize(task.path)
+    if compression_of(task.path) is not None:
+        # the decompressed size of an archive is only known once it is read
+        size *= ARCHIVE_EXPANSION_ESTIMATE
+    return max(0, size - task.start_offset)
 
 
 class LoguruRAG:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, embedding_model: Optional[Embeddings] = None,
+                 on_progress: Optional[Callable[[str], None]] = None):
+        """
+        :param embedding_model: already loaded embedding model to share, e.g. with the engine a follower indexes for
+        :param on_progress: called with what is being done while a question is answered (entries searched or
+            summarized), e.g. to show it in the CLI
+        """
         self._config = config
         self._vector_store_directory = None
-        self._ollama_api_base_url = random.choice(config.ollama.hosts)
         self._model_name = config.ollama.llm_name
         self._embedding_model_name = config.ollama.embedding_model_name
         self._vector_store_directory = os.path.join(LOGURU_DATA_DIR, 'cache')
+        self._embedding_model = embedding_model
+        self._on_progress = on_progress
+        self._vectorstore = None
+        self._vectorstore_signature = None
+        self._shard_executor = None
+        self._llm = None
+        self._reranker = None
+        self._qa_chain = None
+        self._answer_cache = None
+        self._index_version = None
+        self._index_version_signature = None
+        self._timings = {}
+        self._generation_stats = {}
+        self._scan_stats = {}
+        self._walk_notes = []
 
-    def scan(self, clean_and_rebuild: bool = False):
-        if clean_and_rebuild or not os.path.exists(self._vector_store_directory):
-            print("Scanning log locations to rebuild index. Please be patient. This may take a while.")
+    def scan(self, clean_and_rebuild: bool = False, verbose: bool = True) -> int:
+        """
+        Brings the index up to date with the scan locations.
+
+        Only new files and bytes appended since the last scan are embedded. Rotated/truncated files are re-indexed and
+        vectors of deleted files are removed. A full rebuild happens if `clean_and_rebuild` is set or if there is no
+        usable index yet.
+
+        :param verbose: print the progress, otherwise only `scan_stats` tells what changed
+        :return: number of files that were (re-)indexed or removed
+        """
+        start_time = time.time()
+        self._scan_stats = {}
+        try:
+            with _scan_lock():
+                return self._scan(clean_and_rebuild=clean_and_rebuild, verbose=verbose)
+        finally:
+            self._record_timing('scan', time.time() - start_time)
+            self._write_metrics()
+
+    def _scan(self, clean_and_rebuild: bool, verbose: bool) -> int:
+        say = print if verbose else _quiet
+        manifest_file_path = os.path.join(self._vector_store_directory, MANIFEST_FILE_NAME)
+        # also rebuilds indexes saved before the index was sharded
+        index_exists = ShardedVectorStore.exists(self._vector_store_directory)
+        rebuild = clean_and_rebuild or not index_exists or not os.path.exists(manifest_file_path)
+        template_mining = self._config.template_mining
+        manifest = None
+        if not rebuild:
+            manifest = ScanManifest.load(manifest_file_path)
+            # entries indexed with and without template mining cannot be mixed
+            rebuild = manifest.template_mining != template_mining.enabled
+        if rebuild:
+            say("Scanning log locations to rebuild index. Please be patient. This may take a while.")
             shutil.rmtree(self._vector_store_directory, ignore_errors=True)
-            for ds in self._config.data_sources:
-                ds: DataSource
-                for sl in ds.ds_params.scan_locations:
-                    print(f"Scanning directory: {sl.location}...")
-                    for fl in os.listdir(sl.location):
-                        if '.DS_Store' in fl:
-                            continue
-                        self._load_log_file(
-                            log_file_path=os.path.join(sl.location, fl),
-                            pattern_to_split_log_lines=sl.pattern
-                        )
-            print("Scanning complete.")
-        # else use existing vectorstore/cache
-        # print("Skipping log location scanning and loading the previous index...")
-
-    def _load_log_file(self, log_file_path, pattern_to_split_log_lines):
-        if log_file_path is None:
-            raise ValueError("Log file path not provided.")
-        # print(f"Using vector store: {self._vector_store_directory}")
-        # Load the Embedding Model
-        embedding_model = self._load_embedding_model(model_name=self._embedding_model_name)
-        # load and split the documents
-        documents = self._parse_log_file(
-            log_file_path=log_file_path,
-            pattern_to_split_log_lines=pattern_to_split_log_lines
+            self._vectorstore = None
+            self._qa_chain = None
+            manifest = ScanManifest(manifest_file_path)
+            manifest.template_mining = template_mining.enabled
+        catalog = ShardCatalog(self._vector_store_directory) if rebuild else \
+            ShardCatalog.load(self._vector_store_directory)
+
+        self._walk_notes = []
+        changes = manifest.plan(self._list_scan_locations(known_files=manifest.indexed_files()))
+        if len(changes) == 0:
+            return 0
+        for note in self._walk_notes:
+            say(note)
+
+        if not rebuild:
+            say(f"Updating index with {len(changes)} changed log file(s)...")
+        cache_stats_before = self._embedding_cache_stats()
+        sharding = self._config.sharding
+        sources = {sl.location: f"{ds.type}-{i}" for i, ds in enumerate(self._config.data_sources)
+                   for sl in ds.ds_params.scan_locations}
+        changes_by_path = {}
+
+        def _shard_key(metadata: dict) -> ShardKey:
+            location = changes_by_path[os.path.join(metadata['log_dir'], metadata['file_name'])].location
+            return ShardKey(source=sources.get(location, ''), location=location,
+                            bucket=time_bucket(metadata.get('timestamp'), sharding.time_bucket))
+
+        builder = ShardedIndexBuilder(
+            embedding_model=self._get_embedding_model(),
+            catalog=catalog,
+            shard_key=_shard_key,
+            vector_index=self._config.vector_index,
+            batch_size=self._config.indexing.embedding_batch_size,
+            checkpoint_every_n_batches=self._config.indexing.checkpoint_every_n_batches,
+            max_shards_per_bucket=sharding.max_shards_per_bucket
         )
-        print(f"Processing {log_file_path}...")
-
-        if not os.path.exists(self._vector_store_directory):
-            # print(f"Creating new vector store with logs of {log_file_path}...")
-            print(f"Creating new vector stor...")
-            os.makedirs(self._vector_store_directory, exist_ok=True)
-            vectorstore = FAISS.from_documents(documents, embedding_model)
-            vectorstore.save_local(self._vector_store_directory)
+
+        stale_ids = []
+        for change in changes:
+            if change.kind in (FileChange.REPLACED, FileChange.DELETED):
+                stale_ids.extend(change.entry.doc_ids())
+            if change.kind == FileChange.DELETED:
+                manifest.forget(change)
+        builder.delete(stale_ids)
+        # rotated files keep their entries, relabelled before entries of the new files at their old paths are added
+        moves = [change for change in changes if change.kind == FileChange.MOVED]
+        if len(moves) > 0:
+            manifest.move(moves)
+            builder.rename_files((change.old_path, change.path, file_id(change.entry.file_key, change.entry.generation))
+                                 for change in moves)
+
+        tasks = []
+        for change in changes:
+            if change.kind == FileChange.DELETED:
+                continue
+            if change.kind == FileChange.MOVED and change.entry.compression is not None:
+                # an archive renamed by a rotation has nothing new to read
+                manifest.record(change, offset=change.entry.offset, generation=change.entry.generation,
+                                num_entries=change.entry.num_entries)
+                continue
+            if change.kind in (FileChange.APPENDED, FileChange.MOVED):
+                # picks up what was appended before the file was moved
+                task = FileTask(path=change.path, pattern=change.pattern, start_offset=change.entry.offset,
+                                file_key=change.entry.file_key, generation=change.entry.generation,
+                                first_seq=change.entry.num_entries)
+            else:
+                key = file_key(change.path)
+                task = FileTask(path=change.path, pattern=change.pattern, start_offset=0, file_key=key,
+                                generation=manifest.next_generation(key), first_seq=0)
+            tasks.append(task)
+            changes_by_path[change.path] = change
+
+        def _on_file_done(result: FileResult):
+            manifest.record(changes_by_path[result.task.path], offset=result.end_offset,
+                            generation=result.task.generation, num_entries=result.num_entries)
+
+        indexing = self._config.indexing
+        pending_bytes = sum(_pending_bytes(task) for task in tasks)
+        # starting worker processes costs seconds, not worth it for small incremental updates. Each parse worker
+        # decompresses and splits whole archives, so that archives are decompressed in parallel
+        if (indexing.parse_workers > 1 or indexing.embed_workers > 1) and pending_bytes >= PIPELINE_MIN_BYTES:
+            say(f"Indexing {len(tasks)} log file(s) with {indexing.parse_workers} parse worker(s) and "
+                f"{indexing.embed_workers} embedding worker(s)...")
+            pipeline = ScanPipeline(
+                embedding_factory=functools.partial(load_embedding_model, self._embedding_model_name,
+                                                    cache_max_entries=self._embedding_cache_max_entries(),
+                                                    split_patterns=self._split_patterns()),
+                parse_workers=indexing.parse_workers,
+                embed_workers=indexing.embed_workers,
+                batch_size=indexing.embedding_batch_size,
+                queue_size=indexing.pipeline_queue_size,
+                template_mining=template_mining
+            )
+            pipeline.run(tasks, builder, on_file_done=_on_file_done)
         else:
-            # print(f"Updating vector store with logs of {log_file_path}...")
-            print(f"Updating vector store...")
-            vectorstore = FAISS.load_local(self._vector_store_directory, embedding_model,
-                                           allow_dangerous_deserialization=True)
-            vectorstore.add_documents(documents)
-            vectorstore.save_local(self._vector_store_directory)
-
-    def _parse_log_file(self, log_file_path: str, pattern_to_split_log_lines: str) -> [Document]:
+            for task in tasks:
+                say(f"Processing {task.path}...")
+                _on_file_done(self._index_file(task, builder))
+
+        with METRICS.timer('index_save'):
+            builder.save()
+        manifest.bump_index_generation()
+        manifest.save()
+        # the next question reloads the catalog only, the shards it already searched stay open
+        self._index_version = manifest.index_version
+        self._index_version_signature = self._index_signature()
+        if self._config.answer_cache.enabled:
+            self._get_answer_cache().invalidate(self._index_version)
+        self._scan_stats = {'files': len(changes), 'entries_added': builder.num_documents,
+                            'entries_removed': builder.num_deleted}
+        for name, value in self._scan_stats.items():
+            METRICS.incr(f"scan_{name}", value)
+        if verbose:
+            builder.print_stats()
+        cache_stats = self._embedding_cache_stats()
+        if cache_stats is not None:
+            hits = cache_stats.hits - cache_stats_before.hits
+            lookups = hits + cache_stats.misses - cache_stats_before.misses
+            if lookups > 0:
+                say(f"Embedding cache: {hits} of {lookups} log entries served from cache "
+                    f"({round(100 * hits / lookups, 2)}% hit rate), {cache_stats.entries} embeddings cached.")
+        say("Scanning complete.")
+        return len(changes)
+
+    def _index_file(self, task: FileTask, builder: IndexBuilder) -> FileResult:
+        template_mining = self._config.template_mining
+        parser = LogDocumentParser(task.path, task.pattern, start_offset=task.start_offset,
+                                   miner=miner_from_config(template_mining),
+                                   max_clusters=template_mining.max_clusters)
+        seq = task.first_seq
+        # the time spent embedding the batches the entries fill up is recorded apart
+        for text, metadata in METRICS.timed(parser, 'parse'):
+            builder.add_document(Document(page_content=text, metadata=metadata),
+                                 doc_id(task.file_key, task.generation, seq))
+            seq += 1
+        METRICS.incr('parsed_entries', seq - task.first_seq)
+        METRICS.incr('parsed_bytes', parser.end_offset - task.start_offset)
+        return FileResult(task=task, end_offset=parser.end_offset, num_entries=seq)
+
+    def _pattern_for_path(self, log_file_path: str) -> Optional[str]:
+        best_location, best_pattern = None, None
+        for ds in self._config.data_sources:
+            for sl in ds.ds_params.scan_locations:
+                location = os.path.join(sl.location, '')
+                if log_file_path.startswith(location) and (best_location is None or len(location) > len(best_location)):
+                    best_location, best_pattern = location, sl.pattern
+        return best_pattern
+
+    def _list_scan_locations(self, known_files: Collection[str] = ()) -> dict[str, tuple[str, dict]]:
+        scan_locations = {}
+        for ds in self._config.data_sources:
+            ds: DataSource
+            params: Params = ds.ds_params
+            for sl in params.scan_locations:
+                walker = LogFileWalker(
+                    recursion_depth=params.recursion_depth,
+                    file_size_limit=parse_size(params.file_size_limit),
+                    include_paths=sl.include_paths,
+                    exclude_paths=sl.exclude_paths,
+                    include_patterns=sl.include_patterns,
+                    exclude_patterns=sl.exclude_patterns,
+                    max_workers=self._config.indexing.walker_threads
+                )
+                result = walker.walk(sl.location, known_files=known_files)
+                if result.skipped_too_large > 0 or result.skipped_binary > 0:
+                    self._walk_notes.append(
+                        f"Skipped {result.skipped_too_large} file(s) larger than {params.file_size_limit} and "
+                        f"{result.skipped_binary} binary file(s) in {sl.location}."
+                    )
+                if result.skipped_unsupported > 0:
+                    self._walk_notes.append(
+                        f"Skipped {result.skipped_unsupported} zstd compressed file(s) in {sl.location}, install the "
+                        f"zstandard package to index them."
+                    )
+                scan_locations[sl.location] = (sl.pattern, result.files)
+        return scan_locations
+
+    @property
+    def embedding_model(self) -> Embeddings:
+        """
+        The embedding model, loaded on first use.
         """
-        Reads a log file and split the log file into an array of log entries by specified pattern.
+        return self._get_embedding_model()
+
+    def _get_embedding_model(self):
+        if self._embedding_model is None:
+            start_time = time.time()
+            self._embedding_model = self._load_embedding_model(model_name=self._embedding_model_name)
+            self._record_timing('embedding_model_load', time.time() - start_time)
+        return self._embedding_model
+
+    def _parse_log_file(self, log_file_path: str, pattern_to_split_log_lines: str,
+                        start_offset: int = 0) -> Iterator[Document]:
+        """
+        Lazily reads a log file and splits it into log entries by specified pattern. The file is streamed in fixed-size
+        buffers, so memory use does not grow with the file size.
 
         For example: if the log file contents looks like this:
 
@@ -88,64 +382,48 @@ class LoguruRAG:
 
         You would want to split the logs by the date pattern to identify each log entry.
         So you would provide a pattern: '(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
+        Each entry starts at a match of the pattern, so the timestamp stays part of the entry it belongs to.
 
         :param log_file_path:
         :param pattern_to_split_log_lines: r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}[+-]\d{2}:\d{2})'
-        :return: []
+        :param start_offset: byte offset to start reading from, used to pick up lines appended since the last scan
+        :return: iterator of log entries as documents
         """
-        with open(log_file_path, 'r') as file:
-            log_content = file.read()
-        raw_entries = re.split(pattern_to_split_log_lines, log_content)
-        _log_entries = []
-        for entry in raw_entries:
-            log_entry = entry
-            _log_entries.append(
-                Document(
-                    page_content=log_entry.strip(),
-                    metadata={
-                        'log_dir': os.path.dirname(log_file_path),
-                        'file_name': os.path.basename(log_file_path)
-                    }
-                )
-            )
-        return _log_entries
+        with open_log_file(log_file_path) as log_file:
+            for entry in iter_log_entries(log_file, pattern_to_split_log_lines, start_offset=start_offset):
+                yield self._to_document(entry, log_file_path)
+
+    # noinspection PyMethodMayBeStatic
+    def _to_document(self, entry: LogEntry, log_file_path: str) -> Document:
+        return Document(page_content=entry.text, metadata=log_entry_metadata(entry, log_file_path))
+
+    def _embedding_cache_max_entries(self) -> Optional[int]:
+        cache_config = self._config.embedding_cache
+        return cache_config.max_entries if cache_config.enabled else None
+
+    def _embedding_cache_stats(self) -> Optional[CacheStats]:
+        cache = getattr(self._get_embedding_model(), 'cache', None)
+        return cache.stats() if cache is not None else None
 
     def _load_embedding_model(self, model_name, normalize_embedding=True):
-        # print("Loading embedding model...")
-        start_time = time.time()
-        hugging_face_embeddings = HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE},  # here we will run the model with CPU only
-            encode_kwargs={
-                'normalize_embeddings': normalize_embedding  # keep True to compute cosine similarity
-            }
-        )
-        end_time = time.time()
-        time_taken = round(end_time - start_time, 2)
-        return hugging_face_embeddings
+        # timed by the callers, as embedding_model_load
+        return load_embedding_model(model_name=model_name, normalize_embedding=normalize_embedding,
+                                    cache_max_entries=self._embedding_cache_max_entries(),
+                                    split_patterns=self._split_patterns())
 
     def _load_qa_chain(self, retriever, llm, prompt):
-        start_time = time.time()
-        qa_chain = RetrievalQA.from_chain_type(
+        # timed by the caller, as chain_load
+        return RetrievalQA.from_chain_type(
             llm=llm,
             retriever=retriever,
             chain_type="stuff",
             return_source_documents=True,
             chain_type_kwargs={'prompt': prompt},
         )
-        end_time = time.time()
-        time_taken = round(end_time - start_time, 2)
-        # print(f"QA chain load time: {time_taken} seconds.\n")
-        return qa_chain
-
-    def _get_response(self, query, chain, stream: bool = False) -> tuple[str, list[Document]]:
-        if stream:
-            # TODO: fix the streaming code and return the response and source docs to the caller function
-            for chunks in chain.stream({"query": query}):
-                print('', end='', flush=True)
-            print('')
-            return '', []
-        else:
+
+    def _get_response(self, query, chain, stream: bool = False,
+                      on_token: Optional[Callable[[str], None]] = None) -> tuple[str, list[Document]]:
+        if not stream and on_token is None:
             response = chain.invoke({"query": query})
             res = response['result']
             src_docs = response['source_documents']
@@ -153,59 +431,213 @@ class LoguruRAG:
             self._markdown_print(response)
             return res, src_docs
 
+        # the same retrieval and prompt as the chain, with the answer streamed from the LLM as it is generated
+        start_time = time.time()
+        src_docs = chain.retriever.invoke(query)
+        self._record_timing('retrieval', time.time() - start_time)
+        METRICS.observe('retrieved_entries', len(src_docs))
+        start_time = time.time()
+        prompt = chain.combine_documents_chain.llm_chain.prompt.format(
+            context='\n\n'.join(d.page_content for d in src_docs), question=query)
+        self._record_timing('prompt_build', time.time() - start_time)
+        METRICS.observe('prompt_tokens', estimate_tokens(prompt))
+        printer = MarkdownStreamPrinter() if on_token is None else None
+        parts, output_tokens = [], None
+        start_time = time.time()
+        first_token_time = None
+        for chunk in self._get_llm().stream(prompt):
+            text = _chunk_text(chunk)
+            if text != '' and first_token_time is None:
+                first_token_time = time.time()
+                self._record_timing('time_to_first_token', first_token_time - start_time)
+            parts.append(text)
+            if printer is not None:
+                printer.write(text)
+            elif text != '':
+                on_token(text)
+            usage = getattr(chunk, 'usage_metadata', None)
+            if usage:
+                output_tokens = (output_tokens or 0) + usage.get('output_tokens', 0)
+        if printer is not None:
+            printer.close()
+            print('')
+        res = ''.join(parts)
+        if first_token_time is not None:
+            generation_time = time.time() - first_token_time
+            tokens = output_tokens if output_tokens else estimate_tokens(res)
+            self._generation_stats = {'output_tokens': tokens,
+                                      'tokens_per_second': tokens / generation_time if generation_time > 0 else 0.0}
+            self._record_timing('generation', generation_time)
+            METRICS.incr('output_tokens', tokens)
+            METRICS.observe('tokens_per_second', self._generation_stats['tokens_per_second'])
+        return res, src_docs
+
     def _normal_print(self, text: str):
         print(text, flush=True)
         print('\n')
 
     def _markdown_print(self, text: str):
-        import mdv
-        mdv.term_columns = 60
-        formatted = mdv.main(text, c_theme=...)
-        print(formatted, flush=True)
+        print(render_markdown(text), flush=True)
         print('\n')
 
-    def ask(self, question: str, stream: bool = False) -> tuple[str, list[Document]]:
-        embedding_model = self._load_embedding_model(model_name=self._embedding_model_name)
-        vectorstore = FAISS.load_local(
-            self._vector_store_directory,
-            embeddings=embedding_model,
-            allow_dangerous_deserialization=True
-        )
-        retriever = vectorstore.as_retriever(
-            # search_type="similarity_score_threshold",
-            search_kwargs={
-                'k': self._config.num_chunks_to_return,
-                'fetch_k': self._config.num_chunks_to_return,
-                # 'score_threshold': 0.5
-            }
-        )
+    def _index_signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(os.path.join(self._vector_store_directory, CATALOG_FILE_NAME))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
 
-        template = """
-        ### System:
-        You are an honest assistant.
-        You will accept contents of a log file and you will answer the question asked by the user appropriately.
-        If you don't know the answer, just say you don't know. Don't try to make up an answer.
-        If you find time, date or timestamps in the logs, 
-        make sure to convert the timestamp to more human-readable format in your response as DD/MM/YYYY HH:SS
+    def _get_vectorstore(self) -> ShardedVectorStore:
+        """
+        Returns the cached vector store, reloading the shard catalog only if a scan changed the index since it was
+        loaded. Shards that are still part of the index stay open.
+        """
+        signature = self._index_signature()
+        if self._vectorstore is None or signature != self._vectorstore_signature:
+            start_time = time.time()
+            # the model is loaded once a question is embedded, not for a /grep
+            self._vectorstore = ShardedVectorStore.load_local(self._vector_store_directory,
+                                                              embeddings=LazyEmbeddings(self._get_embedding_model),
+                                                              vector_index=self._config.vector_index,
+                                                              executor=self._get_shard_executor(),
+                                                              previous=self._vectorstore)
+            self._vectorstore_signature = signature
+            self._qa_chain = None
+            self._record_timing('index_load', time.time() - start_time)
+        return self._vectorstore
 
-        ### Context:
-        {context}
+    def _get_shard_executor(self) -> Optional[ThreadPoolExecutor]:
+        query_threads = self._config.sharding.query_threads
+        if self._shard_executor is None and query_threads > 1:
+            self._shard_executor = ThreadPoolExecutor(max_workers=query_threads, thread_name_prefix='loguru-shard')
+        return self._shard_executor
 
-        ### User:
-        {question}
+    def _split_patterns(self) -> List[str]:
+        return [sl.pattern for ds in self._config.data_sources for sl in ds.ds_params.scan_locations]
 
-        ### Response:
+    def _scan_locations(self) -> List[str]:
+        return [sl.location for ds in self._config.data_sources for sl in ds.ds_params.scan_locations]
+
+    def _current_index_version(self) -> Optional[str]:
+        signature = self._index_signature()
+        if signature is None:
+            return None
+        if signature != self._index_version_signature:
+            try:
+                manifest = ScanManifest.load(os.path.join(self._vector_store_directory, MANIFEST_FILE_NAME))
+            except FileNotFoundError:
+                return None
+            self._index_version = manifest.index_version
+            self._index_version_signature = signature
+        return self._index_version
+
+    def _get_answer_cache(self) -> AnswerCache:
+        if self._answer_cache is None:
+            cache_config = self._config.answer_cache
+            self._answer_cache = AnswerCache(max_entries=cache_config.max_entries,
+                                             ttl_seconds=cache_config.ttl_seconds,
+                                             similarity_threshold=cache_config.similarity_threshold)
+        return self._answer_cache
+
+    def _answer_cache_key(self, question: str) -> Optional[tuple]:
         """
+        :return: the question embedding, LLM and index version answers to `question` are cached under, None if the
+            answer cannot be cached
+        """
+        index_version = self._current_index_version()
+        if index_version is None:
+            return None
+        service = self._config.service
+        service_config = getattr(self._config, service, None)
+        llm = f"{service}:{getattr(service_config, 'llm_name', '')}"
+        return self._get_embedding_model().embed_query(question), llm, index_version
 
-        prompt = PromptTemplate.from_template(template)
+    def _get_llm(self):
+        if self._llm is None:
+            start_time = time.time()
+            self._llm = self._load_llm()
+            self._record_timing('llm_init', time.time() - start_time)
+        return self._llm
 
+    def _get_qa_chain(self):
+        # drops the chain if another process saved a new index since it was built
+        vectorstore = self._get_vectorstore()
+        if self._qa_chain is None:
+            retrieval = self._config.retrieval
+            if retrieval.hybrid:
+                retriever = HybridRetriever(vectorstore=vectorstore, k=self._config.num_chunks_to_return,
+                                            infer_filters=retrieval.infer_filters,
+                                            vector_candidates=retrieval.vector_candidates,
+                                            keyword_candidates=retrieval.keyword_candidates, rrf_k=retrieval.rrf_k,
+                                            reranker=self._get_reranker(),
+                                            rerank_candidates=retrieval.rerank_candidates,
+                                            scan_locations=self._scan_locations(), on_progress=self._on_progress)
+            else:
+                retriever = LogFilterRetriever(vectorstore=vectorstore, k=self._config.num_chunks_to_return,
+                                               infer_filters=retrieval.infer_filters,
+                                               scan_locations=self._scan_locations(), on_progress=self._on_progress)
+            expand_occurrences = self._config.template_mining.expand_occurrences
+            if self._config.template_mining.enabled and expand_occurrences > 0:
+                retriever = TemplateExpandingRetriever(base_retriever=retriever, max_occurrences=expand_occurrences,
+                                                       pattern_for_path=self._pattern_for_path)
+            context = self._config.context
+            retriever = ContextPackingRetriever(base_retriever=retriever, max_tokens=self._context_budget(),
+                                                dedupe=context.dedupe, summarize=self._summarize_batches,
+                                                map_reduce_below_coverage=context.map_reduce_below_coverage,
+                                                max_map_batches=context.map_reduce_max_batches,
+                                                on_progress=self._on_progress)
+            prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
+            llm = self._get_llm()
+            start_time = time.time()
+            self._qa_chain = self._load_qa_chain(retriever, llm, prompt)
+            self._record_timing('chain_load', time.time() - start_time)
+        return self._qa_chain
+
+    def _context_budget(self) -> int:
+        """
+        :return: number of tokens of log entries that fit in a prompt
+        """
+        context = self._config.context
+        if context.max_tokens is not None:
+            return context.max_tokens
+        context_window = context.context_window
+        if context_window is None:
+            context_window = self._config.ollama.num_ctx if self._config.service == 'ollama' else \
+                CONTEXT_WINDOWS.get(self._config.service, self._config.ollama.num_ctx)
+        return max(128, context_window - estimate_tokens(PROMPT_TEMPLATE) - QUESTION_TOKENS - context.answer_tokens)
+
+    def _summarize_batches(self, question: str, batches: list[list[Document]]) -> list[str]:
+        prompt = PromptTemplate.from_template(MAP_PROMPT_TEMPLATE)
+        prompts = [prompt.format(context='\n\n'.join(d.page_content for d in batch), question=question)
+                   for batch in batches]
+        start_time = time.time()
+        responses = self._get_llm().batch(prompts,
+                                          config={'max_concurrency': self._config.context.map_reduce_concurrency})
+        self._record_timing('map_summaries', time.time() - start_time)
+        return [getattr(response, 'content', response).strip() for response in responses]
+
+    def _get_reranker(self) -> Optional[CrossEncoderReranker]:
+        model_name = self._config.retrieval.rerank_model_name
+        if model_name is not None and self._reranker is None:
+            start_time = time.time()
+            self._reranker = CrossEncoderReranker(model_name)
+            self._record_timing('reranker_load', time.time() - start_time)
+        return self._reranker
+
+    def _load_llm(self):
         service = self._config.service
 
+        # only the client library of the configured service is imported, each takes up to a second to import
         llm = None
         if service == 'ollama':
-            llm = ChatOllama(
+            from loguru.core.ollama_pool import PooledChatOllama, get_pool
+            hosts = self._config.ollama.hosts
+            llm = PooledChatOllama(
+                pool=get_pool(hosts, connect_timeout=self._config.ollama.connect_timeout,
+                              request_timeout=self._config.ollama.request_timeout,
+                              retry_delay=self._config.ollama.retry_delay),
                 temperature=0,
-                base_url=self._ollama_api_base_url,
+                base_url=str(hosts[0]),
                 model=self._model_name,
                 streaming=True,
                 # seed=2,
@@ -214,7 +646,8 @@ class LoguruRAG:
                 top_p=0.3,
                 # Higher value (0.95) will lead to more diverse text, while a lower value (0.5) will generate more
                 # focused text.
-                num_ctx=3072,  # Sets the size of the context window used to generate the next token.
+                # Sets the size of the context window used to generate the next token.
+                num_ctx=self._config.ollama.num_ctx,
                 verbose=False
             )
         elif service == 'gemini':
@@ -222,6 +655,7 @@ class LoguruRAG:
             os.environ["GRPC_VERBOSITY"] = "ERROR"
             os.environ["GLOG_minloglevel"] = "2"
             os.environ['TOKENIZERS_PARALLELISM'] = 'true'
+            from langchain_google_genai import ChatGoogleGenerativeAI
             llm = ChatGoogleGenerativeAI(
                 model=self._config.gemini.llm_name,
                 temperature=0,
@@ -232,6 +666,7 @@ class LoguruRAG:
             )
         elif service == 'openai':
             os.environ['TOKENIZERS_PARALLELISM'] = 'true'
+            from langchain_openai import OpenAI
             llm = OpenAI(
                 openai_api_key=self._config.openai.api_key,
                 openai_organization=self._config.openai.org_id,
@@ -239,23 +674,131 @@ class LoguruRAG:
             )
         elif service == 'anthropic':
             os.environ['TOKENIZERS_PARALLELISM'] = 'true'
+            from langchain_anthropic import ChatAnthropic
             llm = ChatAnthropic(
                 anthropic_api_key=self._config.anthropic.api_key,
                 model=self._config.anthropic.llm_name,
             )
         else:
-            services = ['ollama', 'gemini', 'openai']
+            services = ['ollama', 'gemini', 'openai', 'anthropic']
             print(f"Invalid service: {service}. Available services are {','.join(services)}")
+        return llm
+
+    @property
+    def timings(self) -> dict[str, float]:
+        """
+        Latency (in seconds) of each stage of the last scan/ask. Stages that were served from the warm caches are left
+        out.
+        """
+        return dict(self._timings)
+
+    @property
+    def generation_stats(self) -> dict[str, float]:
+        """
+        Number of tokens generated and generation speed (tokens per second, from the first token on) of the last
+        streamed answer.
+        """
+        return dict(self._generation_stats)
+
+    @property
+    def scan_stats(self) -> dict[str, int]:
+        """
+        Number of files (re-)indexed or removed and of log entries added and removed by the last scan, empty if it
+        changed nothing.
+        """
+        return dict(self._scan_stats)
+
+    def _record_timing(self, stage: str, seconds: float):
+        # the last time of each stage for `timings`, all of them for the metrics
+        self._timings[stage] = seconds
+        METRICS.record_time(stage, seconds)
+
+    def _write_metrics(self):
+        metrics_file = self._config.metrics.file
+        if metrics_file is None:
+            return
+        try:
+            METRICS.write_json(os.path.expanduser(metrics_file))
+        except OSError as e:
+            print(f"Could not write the metrics to {metrics_file}: {e}")
+
+    def reset_timings(self):
+        self._timings = {}
+        self._generation_stats = {}
 
-        if stream:
-            llm.callbacks = [StreamingStdOutCallbackHandler()]
+    def search(self, query: str, log_filter: Optional[LogFilter] = None, k: Optional[int] = None) -> list[Document]:
+        """
+        Returns the log entries most similar to `query`, restricted to the entries matching `log_filter`.
+        """
+        start_time = time.time()
+        documents = self._get_vectorstore().similarity_search(query, k=k or self._config.num_chunks_to_return,
+                                                              log_filter=log_filter)
+        self._record_timing('search', time.time() - start_time)
+        return documents
+
+    def grep(self, pattern: str, regex: bool = False, ignore_case: bool = False,
+             log_filter: Optional[LogFilter] = None) -> Iterator[Document]:
+        """
+        Yields the log entries containing `pattern` (a regular expression if `regex`), without involving any model.
+        """
+        vectorstore = self._get_vectorstore()
+        return itertools.chain.from_iterable(
+            LogSearchEngine(vectorstore.shard(entry).docstore).search(pattern, regex=regex, ignore_case=ignore_case,
+                                                                      log_filter=log_filter)
+            for entry in vectorstore.shards(log_filter))
+
+    def warm_up(self):
+        """
+        Loads the embedding model, index, LLM client and reranker up front, so that the first question does not wait
+        for them.
+        """
+        self._get_embedding_model()
+        if ShardedVectorStore.exists(self._vector_store_directory):
+            self._get_vectorstore().preload()
+            self._get_qa_chain()
+
+    def ask(self, question: str, stream: bool = False, use_cache: bool = True,
+            on_token: Optional[Callable[[str], None]] = None) -> tuple[str, list[Document]]:
+        """
+        Answers a question from the indexed logs. With `stream`, the answer is printed while it is generated.
+
+        :param use_cache: reuse the answer to the same or a very similar question asked before against the same index
+            and LLM. The new answer is cached either way
+        :param on_token: called with each part of the answer as it is generated, instead of printing the answer
+        :return: the answer and the log entries it is based on
+        """
+        METRICS.incr('questions')
+        try:
+            return self._ask(question, stream=stream, use_cache=use_cache, on_token=on_token)
+        finally:
+            self._write_metrics()
+
+    def _ask(self, question: str, stream: bool, use_cache: bool,
+             on_token: Optional[Callable[[str], None]]) -> tuple[str, list[Document]]:
+        cache_key = None
+        if self._config.answer_cache.enabled:
+            start_time = time.time()
+            cache_key = self._answer_cache_key(question)
+            cached = self._get_answer_cache().get(*cache_key) if use_cache and cache_key is not None else None
+            self._record_timing('answer_cache_lookup', time.time() - start_time)
+            if use_cache and cache_key is not None:
+                METRICS.incr('answer_cache_misses' if cached is None else 'answer_cache_hits')
+            if cached is not None and on_token is not None:
+                on_token(cached.answer)
+                return cached.answer, cached.source_documents
+            if cached is not None:
+                self._markdown_print(cached.answer)
+                print(f"(Cached answer, given {round(time.time() - cached.created)} seconds ago to: {cached.question})")
+                return cached.answer, cached.source_documents
+
+        chain = self._get_qa_chain()
 
-        chain = self._load_qa_chain(retriever, llm, prompt)
         start_time = time.time()
-        response, source_docs = self._get_response(question, chain, stream=stream)
+        response, source_docs = self._get_response(question, chain, stream=stream, on_token=on_token)
         end_time = time.time()
-        time_taken = round(end_time - start_time, 2)
-        # print(f"Response time: {time_taken} seconds.\n")
+        self._record_timing('response', end_time - start_time)
+        if cache_key is not None and response.strip() != '':
+            self._get_answer_cache().put(*cache_key, question=question, answer=response, source_documents=source_docs)
         # print(response)
         # print("-------------------------------------------")
         # print("--------------   Source Docs   ------------")
@@ -264,3 +807,13 @@ class LoguruRAG:
         #     print(d.page_content)
         #     print("-------------------------------------------")
         return response, source_docs
+
+
+def _chunk_text(chunk) -> str:
+    # completion models stream strings, chat models message chunks whose content may be a list of content blocks
+    if isinstance(chunk, str):
+        return chunk
+    content = chunk.content
+    if isinstance(content, list):
+        return ''.join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+    return content
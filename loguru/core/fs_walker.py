@@ -0,0 +1,141 @@
+import fnmatch
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, Dict, List, Optional
+
+from loguru.core.compression import (DECOMPRESSION_ERRORS, can_decompress, compression_of, decompressing_reader,
+                                      detect_compression)
+
+SNIFF_BYTES = 8192
+IGNORED_FILE_NAMES = {'.DS_Store'}
+
+
+class WalkResult:
+    def __init__(self):
+        self.files: Dict[str, os.stat_result] = {}
+        self.skipped_too_large = 0
+        self.skipped_binary = 0
+        self.skipped_errors = 0
+        # zstd archives without the zstandard package
+        self.skipped_unsupported = 0
+
+
+def parse_size(size: str) -> int:
+    """
+    Converts a size with unit (e.g., 100MB, 1GB, 512KB) to bytes.
+    """
+    units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+    return int(size[:-2]) * units[size[-2:]]
+
+
+def is_binary_file(path: str) -> bool:
+    """
+    Cheap sniff: a file is considered binary if its first few KB contain a NUL byte. The first few KB of compressed
+    log archives are decompressed, so that e.g. tar.gz archives are skipped.
+    """
+    with open(path, 'rb') as f:
+        compression = detect_compression(f)
+        if compression is None:
+            return b'\0' in f.read(SNIFF_BYTES)
+        with decompressing_reader(f, compression) as reader:
+            return b'\0' in reader.read(SNIFF_BYTES)
+
+
+def _matches_any(value: str, patterns: Optional[List[str]]) -> bool:
+    return any(fnmatch.fnmatch(value, p) for p in patterns)
+
+
+class LogFileWalker:
+    """
+    Walks a scan location with `os.scandir`, honouring the recursion depth, file size limit and include/exclude globs,
+    and skipping binary files. Compressed log archives (.gz, .bz2, .xz, .zst) are log files too.
+
+    Directory listing, stat and binary sniffing are fanned out over a thread pool so that slow (e.g. NFS-mounted)
+    trees are not walked one syscall at a time.
+    """
+
+    def __init__(self, recursion_depth: Optional[int] = None, file_size_limit: Optional[int] = None,
+                 include_paths: Optional[List[str]] = None, exclude_paths: Optional[List[str]] = None,
+                 include_patterns: Optional[List[str]] = None, exclude_patterns: Optional[List[str]] = None,
+                 max_workers: int = 16):
+        self._recursion_depth = recursion_depth
+        self._file_size_limit = file_size_limit
+        self._include_paths = include_paths
+        self._exclude_paths = exclude_paths
+        self._include_patterns = include_patterns
+        self._exclude_patterns = exclude_patterns
+        self._max_workers = max_workers
+
+    def walk(self, location: str, known_files: Collection[str] = ()) -> WalkResult:
+        """
+        :param location: directory to walk
+        :param known_files: paths already known to be text log files, these are not sniffed again
+        :return: the log files found with their stat results
+        """
+        result = WalkResult()
+        candidates = []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            directories = [location]
+            depth = 0
+            while len(directories) > 0:
+                sub_directories = []
+                for files, dirs in executor.map(lambda d: self._scan_dir(location, d), directories):
+                    candidates.extend(files)
+                    sub_directories.extend(dirs)
+                depth += 1
+                if self._recursion_depth is not None and depth > self._recursion_depth:
+                    break
+                directories = sub_directories
+
+            for path, st, error in executor.map(lambda p: self._check_file(p, known_files), candidates):
+                if error == 'too_large':
+                    result.skipped_too_large += 1
+                elif error == 'binary':
+                    result.skipped_binary += 1
+                elif error == 'unsupported':
+                    result.skipped_unsupported += 1
+                elif error is not None:
+                    result.skipped_errors += 1
+                else:
+                    result.files[path] = st
+        return result
+
+    def _scan_dir(self, location: str, directory: str) -> tuple[List[str], List[str]]:
+        files, dirs = [], []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    rel_path = os.path.relpath(entry.path, location)
+                    if self._exclude_paths and _matches_any(rel_path, self._exclude_paths):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        if entry.name in IGNORED_FILE_NAMES:
+                            continue
+                        if self._include_paths and not _matches_any(rel_path, self._include_paths):
+                            continue
+                        if self._include_patterns and not _matches_any(entry.name, self._include_patterns):
+                            continue
+                        if self._exclude_patterns and _matches_any(entry.name, self._exclude_patterns):
+                            continue
+                        files.append(entry.path)
+        except OSError as e:
+            print(f"Could not scan directory {directory}: {e}")
+        return files, dirs
+
+    def _check_file(self, path: str,
+                    known_files: Collection[str]) -> tuple[str, Optional[os.stat_result], Optional[str]]:
+        try:
+            st = os.stat(path)
+            if self._file_size_limit is not None and st.st_size > self._file_size_limit:
+                return path, st, 'too_large'
+            if path in known_files:
+                return path, st, None
+            if not can_decompress(compression_of(path)):
+                return path, st, 'unsupported'
+            if is_binary_file(path):
+                return path, st, 'binary'
+            return path, st, None
+        except DECOMPRESSION_ERRORS:
+            return path, None, 'error'
@@ -0,0 +1,308 @@
+import os
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from loguru.core.ann_index import AnnIndexManager, original_vectors
+from loguru.core.log_fields import SEVERITIES
+from loguru.core.metrics import METRICS
+from loguru.core.metadata_index import NO_SEVERITY, NO_TIMESTAMP
+from loguru.core.models.catalog import ShardEntry
+from loguru.core.models.config import VectorIndex
+from loguru.core.models.manifest import doc_file_id
+from loguru.core.shard_catalog import ShardCatalog, ShardKey, shard_key
+from loguru.core.sharded_store import open_shard
+from loguru.core.vector_store import LogVectorStore
+
+
+class IndexBuilder:
+    """
+    Builds the vector store in a single pass.
+
+    Documents are embedded in batches of `batch_size` and appended to one in-memory FAISS index, which is written to
+    disk once at the end (and optionally every `checkpoint_every_n_batches` batches along the way). Pass an existing
+    `vectorstore` to update it in place instead of starting from an empty index. With `ann_index`, the index is
+    converted to (or retrained as) the configured approximate index type before the final save.
+    """
+
+    def __init__(self, embedding_model: Embeddings, vector_store_directory: str, batch_size: int = 512,
+                 checkpoint_every_n_batches: Optional[int] = None, vectorstore: Optional[LogVectorStore] = None,
+                 ann_index: Optional[AnnIndexManager] = None):
+        self._embedding_model = embedding_model
+        self._vector_store_directory = vector_store_directory
+        self._batch_size = batch_size
+        self._checkpoint_every_n_batches = checkpoint_every_n_batches
+        self._vectorstore: Optional[LogVectorStore] = vectorstore
+        self._ann_index = ann_index
+        self._pending: List[Document] = []
+        self._pending_ids: List[Optional[str]] = []
+        self._num_deleted = 0
+        self._num_batches = 0
+        self._num_documents = 0
+        self._embedding_time = 0.0
+        self._start_time = time.time()
+
+    @property
+    def vectorstore(self) -> Optional[LogVectorStore]:
+        return self._vectorstore
+
+    @property
+    def num_documents(self) -> int:
+        return self._num_documents
+
+    @property
+    def num_deleted(self) -> int:
+        return self._num_deleted
+
+    def add_documents(self, documents: Iterable[Document], ids: Optional[Iterable[str]] = None) -> List[str]:
+        added_ids = []
+        ids = iter(ids) if ids is not None else None
+        for document in documents:
+            added_ids.extend(self.add_document(document, next(ids) if ids is not None else None))
+        return added_ids
+
+    def add_document(self, document: Document, doc_id: Optional[str] = None) -> List[str]:
+        """
+        Queues a document for embedding. Returns the IDs of the batch if adding the document filled one up.
+        """
+        self._pending.append(document)
+        self._pending_ids.append(doc_id)
+        if len(self._pending) >= self._batch_size:
+            return self._flush()
+        return []
+
+    def delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        # looking ids up maps all of them to positions, not worth it for nothing
+        if len(ids) == 0:
+            return
+        self._flush()
+        if self._vectorstore is None:
+            return
+        num_documents_before = self._vectorstore.index.ntotal
+        self._vectorstore.delete(ids)
+        self._num_deleted += num_documents_before - self._vectorstore.index.ntotal
+
+    def flush(self) -> List[str]:
+        return self._flush()
+
+    def _flush(self) -> List[str]:
+        if len(self._pending) == 0:
+            return []
+        batch, self._pending = self._pending, []
+        batch_ids, self._pending_ids = self._pending_ids, []
+        texts = [d.page_content for d in batch]
+        metadatas = [d.metadata for d in batch]
+        ids = None if any(i is None for i in batch_ids) else batch_ids
+
+        start_time = time.time()
+        embeddings = self._embedding_model.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas, ids, embedding_time=time.time() - start_time)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: List[dict],
+                       ids: Optional[List[str]] = None, embedding_time: float = 0.0) -> List[str]:
+        """
+        Adds a batch of already embedded log entries, e.g. computed by embedding worker processes.
+        """
+        self._embedding_time += embedding_time
+        METRICS.record_time('embed', embedding_time)
+        METRICS.incr('embedded_entries', len(texts))
+        ids = self._add(list(zip(texts, embeddings)), metadatas, ids)
+
+        self._num_batches += 1
+        self._num_documents += len(texts)
+        if self._checkpoint_every_n_batches and self._num_batches % self._checkpoint_every_n_batches == 0:
+            print(f"Checkpointing index after {self._num_documents} log entries...")
+            self._save()
+        return ids
+
+    def _add(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[dict],
+             ids: Optional[List[str]]) -> List[str]:
+        if self._vectorstore is None:
+            self._vectorstore = LogVectorStore.from_embeddings(text_embeddings, self._embedding_model,
+                                                               metadatas=metadatas, ids=ids)
+            return [self._vectorstore.docstore.id_at(p) for p in range(len(text_embeddings))]
+        return self._vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    def save(self):
+        self._flush()
+        if self._ann_index is not None and self._vectorstore is not None:
+            start_time = time.time()
+            if self._ann_index.ensure_index_type(self._vectorstore):
+                print(f"Vector index built in {round(time.time() - start_time, 2)} seconds.")
+        self._save()
+
+    def _save(self):
+        if self._vectorstore is None:
+            return
+        os.makedirs(self._vector_store_directory, exist_ok=True)
+        self._vectorstore.save_local(self._vector_store_directory)
+
+    def print_stats(self):
+        elapsed = time.time() - self._start_time
+        docs_per_sec = self._num_documents / elapsed if elapsed > 0 else 0.0
+        embed_docs_per_sec = self._num_documents / self._embedding_time if self._embedding_time > 0 else 0.0
+        print(f"Indexed {self._num_documents} log entries in {round(elapsed, 2)} seconds "
+              f"({round(docs_per_sec, 2)} docs/sec overall, {round(embed_docs_per_sec, 2)} docs/sec embedding).")
+        if self._num_deleted > 0:
+            print(f"Removed {self._num_deleted} stale log entries from the index.")
+
+
+class ShardedIndexBuilder(IndexBuilder):
+    """
+    Builds the index as immutable shards listed in a `ShardCatalog`.
+
+    Added log entries are routed by `shard_key` (data source, scan location and time bucket of their metadata) into
+    in-memory shards, which are written as new shards on save and on checkpoints, so the cost of an update grows with
+    what it adds rather than with the size of the index. Deleting entries rewrites the shards holding them without
+    those entries, and moved log files are recorded in the catalog instead of rewriting their shards. Once a shard key
+    has more than `max_shards_per_bucket` shards, the smaller half of them is merged into one shard.
+    """
+
+    def __init__(self, embedding_model: Embeddings, catalog: ShardCatalog, shard_key: Callable[[dict], ShardKey],
+                 vector_index: VectorIndex, batch_size: int = 512, checkpoint_every_n_batches: Optional[int] = None,
+                 max_shards_per_bucket: int = 8):
+        super().__init__(embedding_model, catalog.directory, batch_size=batch_size,
+                         checkpoint_every_n_batches=checkpoint_every_n_batches)
+        self._catalog = catalog
+        self._shard_key = shard_key
+        self._vector_index = vector_index
+        self._max_shards_per_bucket = max_shards_per_bucket
+        self._pending_shards: Dict[ShardKey, LogVectorStore] = {}
+        self._num_shards_written = 0
+        self._num_shards_merged = 0
+
+    @property
+    def catalog(self) -> ShardCatalog:
+        return self._catalog
+
+    def _add(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[dict],
+             ids: Optional[List[str]]) -> List[str]:
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in text_embeddings]
+        batches: Dict[ShardKey, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            batches.setdefault(self._shard_key(metadata), []).append(i)
+        for key, rows in batches.items():
+            batch = [text_embeddings[i] for i in rows]
+            batch_metadatas = [metadatas[i] for i in rows]
+            batch_ids = [ids[i] for i in rows]
+            vectorstore = self._pending_shards.get(key)
+            if vectorstore is None:
+                self._pending_shards[key] = LogVectorStore.from_embeddings(batch, self._embedding_model,
+                                                                           metadatas=batch_metadatas, ids=batch_ids)
+            else:
+                vectorstore.add_embeddings(batch, metadatas=batch_metadatas, ids=batch_ids)
+        return ids
+
+    def delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        if len(ids) == 0:
+            return
+        self._flush()
+        for vectorstore in self._pending_shards.values():
+            num_documents_before = len(vectorstore.docstore)
+            vectorstore.delete(ids)
+            self._num_deleted += num_documents_before - len(vectorstore.docstore)
+
+        file_ids = {doc_file_id(i) for i in ids}
+        for entry in self._catalog.shards:
+            if file_ids.isdisjoint(entry.files):
+                continue
+            vectorstore = open_shard(self._catalog, entry, self._embedding_model, mmap=False)
+            if not vectorstore.delete(ids):
+                continue
+            self._num_deleted += entry.num_entries - len(vectorstore.docstore)
+            self._catalog.retire([entry.shard_id])
+            if len(vectorstore.docstore) > 0:
+                self._write_shard(shard_key(entry), vectorstore)
+
+    def rename_files(self, moves: Iterable[Tuple[str, str, str]]):
+        """
+        Relabels the entries of log files that were moved (e.g. rotated from app.log to app.log.1).
+
+        :param moves: old path, new path and file ID (see `file_id`) of each moved file
+        """
+        moves = list(moves)
+        renames = {old_path: new_path for old_path, new_path, _ in moves}
+        for vectorstore in self._pending_shards.values():
+            vectorstore.docstore.rename_files(renames)
+        for entry in self._catalog.shards:
+            shard_renames = {old_path: new_path for old_path, new_path, moved_file_id in moves
+                             if moved_file_id in entry.files}
+            if len(shard_renames) > 0:
+                self._catalog.rename_files(entry.shard_id, shard_renames)
+
+    def save(self):
+        self._flush()
+        self._write_pending_shards()
+        self._merge_small_shards()
+        self._catalog.save()
+
+    def _save(self):
+        self._write_pending_shards()
+        self._catalog.save()
+
+    def _write_pending_shards(self):
+        pending, self._pending_shards = self._pending_shards, {}
+        for key, vectorstore in pending.items():
+            if len(vectorstore.docstore) > 0:
+                self._write_shard(key, vectorstore)
+
+    def _write_shard(self, key: ShardKey, vectorstore: LogVectorStore):
+        start_time = time.time()
+        shard_id = self._catalog.new_shard_id()
+        directory = self._catalog.shard_directory(shard_id)
+        AnnIndexManager(self._vector_index, directory).ensure_index_type(vectorstore)
+        vectorstore.save_local(directory)
+        METRICS.record_time('shard_write', time.time() - start_time)
+
+        docstore = vectorstore.docstore
+        timestamps = docstore.column('timestamp')
+        timestamps = timestamps[timestamps != NO_TIMESTAMP]
+        severities = np.unique(docstore.column('severity'))
+        self._catalog.add(ShardEntry(
+            shard_id=shard_id, source=key.source, location=key.location, bucket=key.bucket,
+            num_entries=len(docstore),
+            min_timestamp=int(timestamps.min()) if len(timestamps) > 0 else None,
+            max_timestamp=int(timestamps.max()) if len(timestamps) > 0 else None,
+            severities=[SEVERITIES[code] for code in severities if code != NO_SEVERITY],
+            files=sorted({doc_file_id(docstore.id_at(p)) for p in range(len(docstore))})
+        ))
+        self._num_shards_written += 1
+
+    def _merge_small_shards(self):
+        by_key: Dict[ShardKey, List[ShardEntry]] = {}
+        for entry in self._catalog.shards:
+            by_key.setdefault(shard_key(entry), []).append(entry)
+        for key, entries in by_key.items():
+            if len(entries) <= self._max_shards_per_bucket:
+                continue
+            # merging the smaller half keeps the number of shards logarithmic in the number of scans
+            entries = sorted(entries, key=lambda e: e.num_entries)[:max(2, len(entries) // 2)]
+            merged = None
+            for entry in entries:
+                vectorstore = open_shard(self._catalog, entry, self._embedding_model, mmap=False)
+                docstore = vectorstore.docstore
+                text_embeddings = list(zip((docstore.text_at(p) for p in range(len(docstore))),
+                                           original_vectors(vectorstore)))
+                metadatas = [docstore.metadata_at(p) for p in range(len(docstore))]
+                ids = [docstore.id_at(p) for p in range(len(docstore))]
+                if merged is None:
+                    merged = LogVectorStore.from_embeddings(text_embeddings, self._embedding_model,
+                                                            metadatas=metadatas, ids=ids)
+                else:
+                    merged.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self._catalog.retire([entry.shard_id for entry in entries])
+            self._write_shard(key, merged)
+            self._num_shards_merged += len(entries)
+
+    def print_stats(self):
+        super().print_stats()
+        if self._num_shards_written > 0:
+            print(f"Wrote {self._num_shards_written} shard(s), {self._num_shards_merged} merged, "
+                  f"{len(self._catalog.shards)} shard(s) in the index.")
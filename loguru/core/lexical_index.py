@@ -0,0 +1,362 @@
+import bisect
+import json
+import mmap
+import os
+import re
+from itertools import chain
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+SEGMENTS_FILE_NAME = 'segments.json'
+# number of documents tokenized at a time while building a segment
+BUILD_CHUNK_DOCS = 200000
+# segments are merged into one once there are more than this
+MAX_SEGMENTS = 8
+# vocabulary matches above this many tokens are too unselective to narrow a search down
+MAX_EXPANDED_TOKENS = 50000
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class CorpusStats(NamedTuple):
+    """
+    Collection statistics BM25 scores are computed with, summed over indexes to score them as one.
+    """
+    num_documents: int
+    total_length: int
+    document_frequencies: Dict[str, int]
+
+
+def merge_corpus_stats(stats: Iterable[Optional[CorpusStats]]) -> CorpusStats:
+    num_documents, total_length, document_frequencies = 0, 0, {}
+    for s in stats:
+        if s is None:
+            continue
+        num_documents += s.num_documents
+        total_length += s.total_length
+        for token, frequency in s.document_frequencies.items():
+            document_frequencies[token] = document_frequencies.get(token, 0) + frequency
+    return CorpusStats(num_documents, total_length, document_frequencies)
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Returns strings that any match of the regular expression `pattern` must contain, e.g. ['connection', 'refused']
+    for 'connection (to \\S+ )?refused'. Parts of the pattern that are optional or alternatives are skipped, so the
+    result may be empty.
+    """
+    literals = []
+    _collect_literals(sre_parse.parse(pattern), literals)
+    return [literal for literal in literals if literal != '']
+
+
+def _collect_literals(items, literals: List[str]):
+    current = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            current.append(chr(av))
+            continue
+        literals.append(''.join(current))
+        current = []
+        if op is sre_constants.SUBPATTERN:
+            _collect_literals(av[-1], literals)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            _collect_literals(av[2], literals)
+    literals.append(''.join(current))
+
+
+def _open_bytes(path: str):
+    if os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    """
+    Immutable part of the index: a sorted vocabulary and, for each token, the sorted positions of the documents that
+    contain it along with the number of occurrences.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vocab = _open_bytes(os.path.join(directory, 'vocab.bin'))
+        self.vocab_starts = np.load(os.path.join(directory, 'vocab.idx.npy'), mmap_mode='r')
+        self.starts = np.load(os.path.join(directory, 'starts.npy'), mmap_mode='r')
+        self.docs = np.load(os.path.join(directory, 'docs.npy'), mmap_mode='r')
+        self.tfs = np.load(os.path.join(directory, 'tfs.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.vocab_starts) - 1
+
+    def __getitem__(self, token_id: int) -> str:
+        # vocabulary entries are newline terminated
+        return self.vocab[self.vocab_starts[token_id]:self.vocab_starts[token_id + 1] - 1].decode('utf-8')
+
+    def find(self, token: str) -> Optional[int]:
+        token_id = bisect.bisect_left(self, token)
+        return token_id if token_id < len(self) and self[token_id] == token else None
+
+    def prefixed(self, prefix: str) -> np.ndarray:
+        return np.arange(bisect.bisect_left(self, prefix), bisect.bisect_left(self, prefix + '\U0010ffff'))
+
+    def containing(self, piece: str, as_suffix: bool = False) -> np.ndarray:
+        """
+        :return: ids of the tokens containing `piece`, or ending with it if `as_suffix`
+        """
+        encoded = piece.encode('utf-8')
+        starts = np.fromiter((m.start() for m in re.finditer(re.escape(encoded), self.vocab)), dtype=np.int64)
+        token_ids = np.searchsorted(self.vocab_starts, starts, side='right') - 1
+        if as_suffix:
+            # vocabulary entries are newline terminated
+            token_ids = token_ids[self.vocab_starts[token_ids + 1] - 1 == starts + len(encoded)]
+        return np.unique(token_ids)
+
+    def postings(self, token_id: int) -> (np.ndarray, np.ndarray):
+        start, end = self.starts[token_id], self.starts[token_id + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def token_ids(self) -> np.ndarray:
+        """
+        :return: the token id of every posting
+        """
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.starts))
+
+    def tokens(self) -> List[str]:
+        return bytes(self.vocab).decode('utf-8').split('\n')[:-1]
+
+
+def _write_segment(directory: str, tokens: List[str], token_ids: np.ndarray, docs: np.ndarray, tfs: np.ndarray):
+    """
+    :param tokens: sorted vocabulary
+    :param token_ids: token id of each posting, postings are sorted by token id and then by document
+    """
+    os.makedirs(directory)
+    encoded = [t.encode('utf-8') + b'\n' for t in tokens]
+    with open(os.path.join(directory, 'vocab.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    vocab_starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+    vocab_starts[1:] = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+    np.save(os.path.join(directory, 'vocab.idx.npy'), vocab_starts)
+    starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(np.bincount(token_ids, minlength=len(tokens)))
+    np.save(os.path.join(directory, 'starts.npy'), starts)
+    np.save(os.path.join(directory, 'docs.npy'), docs.astype(np.int32))
+    np.save(os.path.join(directory, 'tfs.npy'), tfs.astype(np.uint16))
+
+
+def _build_postings(positions: np.ndarray, texts: List[str]) -> (List[str], np.ndarray, np.ndarray, np.ndarray,
+                                                                  np.ndarray):
+    token_lists = list(map(tokenize, texts))
+    lengths = np.fromiter(map(len, token_lists), dtype=np.int32, count=len(token_lists))
+    all_tokens = list(chain.from_iterable(token_lists))
+    tokens = sorted(set(all_tokens))
+    vocab = {t: i for i, t in enumerate(tokens)}
+    token_ids = np.fromiter(map(vocab.__getitem__, all_tokens), dtype=np.int64, count=len(all_tokens))
+    num_docs = max(len(texts), 1)
+    keys, tfs = np.unique(token_ids * num_docs + np.repeat(np.arange(len(texts), dtype=np.int64), lengths),
+                          return_counts=True)
+    docs = positions[keys % num_docs]
+    return tokens, (keys // num_docs).astype(np.int32), docs, np.minimum(tfs, np.iinfo(np.uint16).max), lengths
+
+
+def _merge_segments(segments: List[_Segment], directory: str):
+    vocabularies = [segment.tokens() for segment in segments]
+    tokens = sorted(set().union(*vocabularies))
+    global_ids = {t: i for i, t in enumerate(tokens)}
+    token_ids = np.concatenate([np.array([global_ids[t] for t in vocabulary], dtype=np.int32)[segment.token_ids()]
+                                for segment, vocabulary in zip(segments, vocabularies)])
+    docs = np.concatenate([segment.docs for segment in segments])
+    tfs = np.concatenate([segment.tfs for segment in segments])
+    order = np.lexsort((docs, token_ids))
+    _write_segment(directory, tokens, token_ids[order], docs[order], tfs[order])
+
+
+class LexicalIndex:
+    """
+    Inverted index from (lower-cased) tokens to the docstore positions of the log entries that contain them, with
+    term frequencies and entry lengths for relevance scoring.
+
+    The index is made of immutable, memory-mapped segments: every save adds a segment for the new entries and
+    renumbers the positions of existing segments if entries were deleted. Segments are merged once there are more than
+    `MAX_SEGMENTS`.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+        self._segments: List[_Segment] = []
+        self._next_segment = 0
+        self.lengths = np.zeros(0, dtype=np.int32)
+        if directory is None or not os.path.exists(os.path.join(directory, SEGMENTS_FILE_NAME)):
+            return
+        with open(os.path.join(directory, SEGMENTS_FILE_NAME), 'r') as f:
+            meta = json.load(f)
+        self._segments = [_Segment(os.path.join(directory, name)) for name in meta['segments']]
+        self._next_segment = meta['next_segment']
+        self.lengths = np.load(os.path.join(directory, 'lengths.npy'), mmap_mode='r')
+
+    @property
+    def num_documents(self) -> int:
+        return len(self.lengths)
+
+    def postings(self, token: str) -> (np.ndarray, np.ndarray):
+        """
+        :return: positions of the documents containing `token` and the number of times it occurs in each of them
+        """
+        docs, tfs = [], []
+        for segment in self._segments:
+            token_id = segment.find(token)
+            if token_id is not None:
+                segment_docs, segment_tfs = segment.postings(token_id)
+                docs.append(segment_docs)
+                tfs.append(segment_tfs)
+        if len(docs) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def corpus_stats(self, tokens: List[str]) -> CorpusStats:
+        """
+        :return: the statistics of this index that BM25 scores for the query `tokens` depend on
+        """
+        return CorpusStats(self.num_documents, int(np.sum(self.lengths, dtype=np.int64)),
+                           {token: len(self.postings(token)[0]) for token in set(tokens)})
+
+    def bm25(self, tokens: List[str], k: int, mask: Optional[np.ndarray] = None,
+             corpus_stats: Optional[CorpusStats] = None) -> (np.ndarray, np.ndarray):
+        """
+        Ranks documents by their BM25 score for the query `tokens`.
+
+        :param mask: positions allowed in the result, all if not set
+        :param corpus_stats: statistics of all the indexes searched for the query (see `merge_corpus_stats`), so that
+            the scores compare across them. Those of this index if not set
+        :return: positions of the (up to) `k` best scoring documents that contain any of the tokens, and their scores
+        """
+        if self.num_documents == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if corpus_stats is None:
+            corpus_stats = self.corpus_stats(tokens)
+        num_documents = max(corpus_stats.num_documents, 1)
+        average_length = max(corpus_stats.total_length / num_documents, 1.0)
+        scores = np.zeros(self.num_documents, dtype=np.float32)
+        for token in set(tokens):
+            docs, tfs = self.postings(token)
+            if len(docs) == 0:
+                continue
+            frequency = corpus_stats.document_frequencies.get(token, len(docs))
+            idf = np.log(1 + (num_documents - frequency + 0.5) / (frequency + 0.5))
+            tfs = tfs.astype(np.float32)
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[docs] / average_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norms)
+        if mask is not None:
+            scores[~mask] = 0
+        matching = np.flatnonzero(scores > 0)
+        if len(matching) > k:
+            matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+        order = np.argsort(-scores[matching], kind='stable')
+        return matching[order], scores[matching[order]]
+
+    def candidates(self, literals: List[str]) -> Optional[np.ndarray]:
+        """
+        Narrows down the documents that may contain all of `literals` (case-insensitively).
+
+        :return: mask of candidate positions, None if the literals cannot narrow the search down
+        """
+        mask = None
+        for literal in literals:
+            literal = literal.lower()
+            for m in _TOKEN.finditer(literal):
+                # tokens cut by the start or end of the literal may be part of longer tokens in the documents
+                piece = m.group(0)
+                open_start, open_end = m.start() == 0, m.end() == len(literal)
+                piece_mask = self._piece_candidates(piece, open_start, open_end)
+                if piece_mask is not None:
+                    mask = piece_mask if mask is None else mask & piece_mask
+        return mask
+
+    def _piece_candidates(self, piece: str, open_start: bool, open_end: bool) -> Optional[np.ndarray]:
+        mask = np.zeros(self.num_documents, dtype=bool)
+        for segment in self._segments:
+            if open_start:
+                token_ids = segment.containing(piece, as_suffix=not open_end)
+            elif open_end:
+                token_ids = segment.prefixed(piece)
+            else:
+                token_id = segment.find(piece)
+                token_ids = [token_id] if token_id is not None else []
+            if len(token_ids) > MAX_EXPANDED_TOKENS:
+                return None
+            for token_id in token_ids:
+                mask[segment.postings(int(token_id))[0]] = True
+        return mask
+
+    def save(self, directory: str, num_positions: int, remap: Optional[np.ndarray], new_positions: np.ndarray,
+             new_texts: List[str]):
+        """
+        Writes the index for the next version of the docstore to `directory`.
+
+        :param num_positions: number of documents in the next version
+        :param remap: new position of each currently indexed document, -1 if it was deleted. None if no document moved
+        :param new_positions: positions of the added documents
+        :param new_texts: texts of the added documents
+        """
+        os.makedirs(directory)
+        lengths = np.zeros(num_positions, dtype=np.int32)
+        names = []
+        for segment in self._segments:
+            name = os.path.basename(segment.directory)
+            if remap is None:
+                # unchanged segments are shared with the previous version
+                os.makedirs(os.path.join(directory, name))
+                for file_name in os.listdir(segment.directory):
+                    os.link(os.path.join(segment.directory, file_name), os.path.join(directory, name, file_name))
+            else:
+                docs = remap[segment.docs]
+                kept = docs >= 0
+                if not kept.any():
+                    continue
+                _write_segment(os.path.join(directory, name), segment.tokens(), segment.token_ids()[kept], docs[kept],
+                               segment.tfs[kept])
+            names.append(name)
+        if len(self.lengths) > 0:
+            old_positions = np.arange(len(self.lengths)) if remap is None else remap
+            kept = old_positions >= 0
+            lengths[old_positions[kept]] = self.lengths[kept]
+
+        next_segment = self._next_segment
+        for chunk_start in range(0, len(new_texts), BUILD_CHUNK_DOCS):
+            positions = new_positions[chunk_start:chunk_start + BUILD_CHUNK_DOCS]
+            tokens, token_ids, docs, tfs, chunk_lengths = _build_postings(
+                positions, new_texts[chunk_start:chunk_start + BUILD_CHUNK_DOCS])
+            lengths[positions] = chunk_lengths
+            name = f"segment-{next_segment:06d}"
+            _write_segment(os.path.join(directory, name), tokens, token_ids, docs, tfs)
+            names.append(name)
+            next_segment += 1
+
+        if len(names) > MAX_SEGMENTS:
+            name = f"segment-{next_segment:06d}"
+            _merge_segments([_Segment(os.path.join(directory, n)) for n in names], os.path.join(directory, name))
+            for n in names:
+                for file_name in os.listdir(os.path.join(directory, n)):
+                    os.remove(os.path.join(directory, n, file_name))
+                os.rmdir(os.path.join(directory, n))
+            names = [name]
+            next_segment += 1
+
+        np.save(os.path.join(directory, 'lengths.npy'), lengths)
+        with open(os.path.join(directory, SEGMENTS_FILE_NAME), 'w') as f:
+            json.dump({'segments': names, 'next_segment': next_segment}, f)
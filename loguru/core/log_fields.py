@@ -0,0 +1,96 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# severities from least to most severe, the position is the code stored in the index
+SEVERITIES = ('TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL')
+_SEVERITY_ALIASES = {
+    'FINEST': 'TRACE',
+    'FINER': 'TRACE',
+    'FINE': 'DEBUG',
+    'NOTICE': 'INFO',
+    'WARNING': 'WARN',
+    'ERR': 'ERROR',
+    'SEVERE': 'ERROR',
+    'CRITICAL': 'FATAL',
+}
+# fields are only looked for in the first line of an entry, and only this much of it
+MAX_HEADER_LENGTH = 512
+
+_TIMESTAMP = re.compile(
+    r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:[.,](\d{1,9}))?\s?(Z|[+-]\d{2}:?\d{2}\b)?'
+)
+_SEVERITY = re.compile(r'\b(' + '|'.join(list(SEVERITIES) + list(_SEVERITY_ALIASES)) + r')\b')
+# separates the header (timestamp, severity, thread, logger) from the message, e.g. ' : ' in Spring Boot logs and
+# ' - ' in the default logback layout
+_MESSAGE_SEPARATOR = re.compile(r'\s[:-]\s')
+_THREAD = re.compile(r'\[\s*([^\[\]]+?)\s*\]')
+_LOGGER = re.compile(r'([A-Za-z_$][\w$]*(?:\.[\w$]+)*)\s*$')
+
+
+def normalize_severity(severity: str) -> Optional[str]:
+    severity = severity.strip().upper()
+    severity = _SEVERITY_ALIASES.get(severity, severity)
+    return severity if severity in SEVERITIES else None
+
+
+def parse_timestamp(text: str) -> Optional[int]:
+    """
+    Parses the first ISO-8601 like timestamp (e.g. 2024-06-14T11:05:48.406+05:30 or 2024-06-14 11:05:48,406) in `text`.
+    Timestamps without a UTC offset are taken to be in local time.
+
+    :return: milliseconds since the epoch
+    """
+    m = _TIMESTAMP.search(text)
+    if m is None:
+        return None
+    date, time_of_day, fraction, utc_offset = m.groups()
+    try:
+        dt = datetime.strptime(f"{date}T{time_of_day}", '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+    if fraction is not None:
+        dt = dt.replace(microsecond=int(fraction[:6].ljust(6, '0')))
+    if utc_offset == 'Z':
+        dt = dt.replace(tzinfo=timezone.utc)
+    elif utc_offset is not None:
+        sign = -1 if utc_offset[0] == '-' else 1
+        hours, minutes = int(utc_offset[1:3]), int(utc_offset[-2:])
+        dt = dt.replace(tzinfo=timezone(sign * timedelta(hours=hours, minutes=minutes)))
+    return int(dt.timestamp() * 1000)
+
+
+def format_timestamp(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp / 1000).astimezone().isoformat(timespec='milliseconds')
+
+
+def extract_log_fields(text: str) -> dict:
+    """
+    Extracts the timestamp, severity, thread and logger from the first line of a log entry, for example:
+
+        2024-06-14T11:05:48.408+05:30  INFO [app-service,,] 73331 --- [main] c.i.o.MyApplication : No active profile set
+
+    gives `timestamp` (milliseconds since the epoch), `severity` (one of `SEVERITIES`), `thread` ('main') and `logger`
+    ('c.i.o.MyApplication'). Fields that cannot be found are left out.
+    """
+    header = text.split('\n', 1)[0][:MAX_HEADER_LENGTH]
+    fields = {}
+    timestamp = parse_timestamp(header)
+    if timestamp is not None:
+        fields['timestamp'] = timestamp
+
+    separator = _MESSAGE_SEPARATOR.search(header)
+    prefix = header[:separator.start()] if separator is not None else header
+    severity = _SEVERITY.search(prefix) or _SEVERITY.search(header)
+    if severity is not None:
+        fields['severity'] = normalize_severity(severity.group(1))
+
+    threads = _THREAD.findall(prefix)
+    if len(threads) > 0:
+        # Spring Boot puts the application name in brackets before the thread
+        fields['thread'] = threads[-1]
+    if separator is not None:
+        logger = _LOGGER.search(prefix)
+        if logger is not None and normalize_severity(logger.group(1)) is None and not prefix.rstrip().endswith(']'):
+            fields['logger'] = logger.group(1)
+    return fields
@@ -0,0 +1,235 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from loguru.core.fs_log_rag import LoguruRAG
+from loguru.core.models.config import Config
+
+# inotify(7) flags
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE |
+               _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+# events after which the set of watched directories may have to change
+_RESYNC_MASK = _IN_Q_OVERFLOW | _IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF
+# wd, mask, cookie and name length, followed by the name
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class FollowBatch(NamedTuple):
+    files: int
+    entries_added: int
+    entries_removed: int
+    scan_time: float
+    # seconds from the first change of the batch being noticed to its log entries being searchable
+    lag: float
+
+
+class _Inotify:
+    """
+    Minimal ctypes binding of Linux inotify, only telling whether anything changed in the watched directories.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+    def watch(self, directory: str):
+        """
+        Watches `directory` (not its sub-directories). Watching a directory again is a no-op.
+
+        :raises OSError: e.g. ENOSPC once fs.inotify.max_user_watches is reached
+        """
+        if self._add_watch(self._fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Cannot watch {directory}: {os.strerror(errno)}")
+
+    def read(self, timeout: Optional[float]) -> List[int]:
+        """
+        Waits up to `timeout` seconds for changes.
+
+        :return: masks of the events that happened, empty if none did
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        masks = []
+        while len(ready) > 0:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_len = _EVENT.unpack_from(data, offset)
+                masks.append(mask)
+                offset += _EVENT.size + name_len
+        return masks
+
+    def close(self):
+        os.close(self._fd)
+
+
+class LogFollower:
+    """
+    Keeps the index up to date while logs are written (live tail), until `stop` is called.
+
+    Changes in the scan locations are noticed with inotify where available and by polling otherwise. They are indexed
+    in micro-batches by incremental scans: appended bytes are parsed with the scan location's pattern, embedded and
+    added to the index, rotated files are relabelled and deleted ones dropped. A batch collects the changes of
+    `batch_delay` seconds, or of as long as the last scan took if that is longer, so scanning takes at most about half
+    of the time and batches grow with the write rate instead of falling behind.
+
+    Each batch is saved atomically, as new shards of the index, so its cost does not grow with the size of the index.
+    Readers (e.g. a `LoguruRAG` answering questions in another thread or process) keep answering from the index they
+    have and pick up the new shards on their next question, they are never blocked.
+    """
+
+    def __init__(self, config: Config, embedding_model: Optional[Embeddings] = None,
+                 on_batch: Optional[Callable[[FollowBatch], None]] = None):
+        """
+        :param embedding_model: already loaded embedding model to share, e.g. with the engine answering questions
+        :param on_batch: called after each batch that changed the index
+        """
+        self._config = config
+        self._rag = LoguruRAG(config=config, embedding_model=embedding_model)
+        self._on_batch = on_batch
+        self._stopped = threading.Event()
+        self._batch_delay = config.follow.batch_delay
+        self._last_scan_time = 0.0
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        """
+        Follows the scan locations until `stop` is called.
+        """
+        inotify = self._open_inotify()
+        try:
+            if inotify is None:
+                self._poll()
+            else:
+                self._follow(inotify)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _open_inotify(self) -> Optional[_Inotify]:
+        if not self._config.follow.use_inotify or not sys.platform.startswith('linux'):
+            return None
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"Cannot use inotify ({e}), polling for changes instead.")
+            return None
+        try:
+            self._watch_directories(inotify)
+        except OSError as e:
+            print(f"{e}, polling for changes instead.")
+            inotify.close()
+            return None
+        return inotify
+
+    def _watch_directories(self, inotify: _Inotify):
+        # the same directories the scan walks: the scan location and its sub-directories up to the recursion depth
+        for ds in self._config.data_sources:
+            depth_limit = ds.ds_params.recursion_depth
+            for sl in ds.ds_params.scan_locations:
+                directories, depth = [sl.location], 0
+                while len(directories) > 0:
+                    sub_directories = []
+                    for directory in directories:
+                        try:
+                            inotify.watch(directory)
+                            with os.scandir(directory) as it:
+                                sub_directories.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+                        except (FileNotFoundError, PermissionError):
+                            # skipped by the scan as well, a directory created later is watched on the next resync
+                            continue
+                    depth += 1
+                    if depth_limit is not None and depth > depth_limit:
+                        break
+                    directories = sub_directories
+
+    def _follow(self, inotify: _Inotify):
+        first_change = time.time()
+        while not self._stopped.is_set():
+            # changes made before the directories were watched are picked up by the first scan
+            self._scan(first_change)
+            masks = self._wait_for_changes(inotify)
+            first_change = time.time()
+            if any(mask & (_RESYNC_MASK | _IN_ISDIR) for mask in masks):
+                try:
+                    self._watch_directories(inotify)
+                except OSError as e:
+                    print(f"{e}, polling for changes instead.")
+                    self._poll()
+                    return
+            if len(masks) > 0:
+                # what is written until the scan walks the scan locations is part of this batch
+                self._stopped.wait(max(self._batch_delay, self._last_scan_time))
+                inotify.read(timeout=0)
+
+    def _wait_for_changes(self, inotify: _Inotify) -> List[int]:
+        """
+        :return: masks of the events noticed, empty if there were none for rescan_interval seconds
+        """
+        deadline = time.time() + self._config.follow.rescan_interval
+        while not self._stopped.is_set() and time.time() < deadline:
+            # wakes up every second to notice stop()
+            masks = inotify.read(timeout=min(1.0, max(0.0, deadline - time.time())))
+            if len(masks) > 0:
+                return masks
+        return []
+
+    def _poll(self):
+        first_change = time.time()
+        while not self._stopped.is_set():
+            # what this scan finds was written after the previous one walked the scan locations
+            scan_start = time.time()
+            self._scan(first_change)
+            first_change = scan_start
+            self._stopped.wait(max(self._config.follow.poll_interval, self._last_scan_time))
+
+    def _scan(self, first_change: float):
+        if self._stopped.is_set():
+            return
+        start_time = time.time()
+        try:
+            self._rag.scan(verbose=False)
+        except Exception as e:
+            # e.g. a file rotated away while it was read, the next scan sees the rotation
+            print(f"Follow scan failed: {e}")
+            return
+        end_time = time.time()
+        self._last_scan_time = end_time - start_time
+        stats = self._rag.scan_stats
+        if len(stats) > 0 and self._on_batch is not None:
+            self._on_batch(FollowBatch(files=stats['files'], entries_added=stats['entries_added'],
+                                       entries_removed=stats['entries_removed'], scan_time=self._last_scan_time,
+                                       lag=end_time - first_change))
@@ -0,0 +1,184 @@
+import os
+import re
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+from loguru.core.compression import DECOMPRESSION_ERRORS, compression_of, open_log_file, seek_log_file
+from loguru.core.log_fields import extract_log_fields
+from loguru.core.templates import TemplateMiner, cluster_metadata, cluster_to_text
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_ENTRY_SIZE = 1024 * 1024
+
+
+class LogEntry(NamedTuple):
+    text: str
+    start: int  # byte offset of the first byte of the entry
+    end: int  # byte offset just past the last byte of the entry
+
+
+def log_entry_metadata(entry: LogEntry, log_file_path: str) -> dict:
+    return {
+        'log_dir': os.path.dirname(log_file_path),
+        'file_name': os.path.basename(log_file_path),
+        'offset': entry.start,
+        **extract_log_fields(entry.text)
+    }
+
+
+def iter_log_entries(file: BinaryIO, pattern_to_split_log_lines: str, start_offset: int = 0,
+                     buffer_size: int = DEFAULT_BUFFER_SIZE,
+                     max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE,
+                     include_incomplete_line: bool = False) -> Iterator[LogEntry]:
+    """
+    Lazily splits a log file opened in binary mode into log entries.
+
+    A new entry starts wherever `pattern_to_split_log_lines` matches, and the matched text (for example the timestamp)
+    stays attached to the entry it starts. The file is read in buffers of roughly `buffer_size` bytes that always end
+    on a line boundary, so entries spanning buffers are stitched back together and memory use is bounded by
+    `buffer_size` plus `max_entry_size`. Entries larger than `max_entry_size` are emitted in pieces.
+
+    Reading stops at the last complete line, a trailing line without a newline is left for the next scan. The end
+    offset of the last yielded entry is therefore where the next incremental read should start.
+
+    :param file: log file opened in binary mode
+    :param pattern_to_split_log_lines: pattern that marks the start of a log entry
+    :param start_offset: byte offset to start reading from
+    :param buffer_size: approximate number of bytes to read at a time
+    :param max_entry_size: maximum number of bytes of a single entry
+    :param include_incomplete_line: read the trailing line without a newline too, for files that do not grow anymore
+        (e.g. archives)
+    :return: iterator of log entries with surrounding whitespace stripped, empty entries are skipped
+    """
+    regex = re.compile(pattern_to_split_log_lines.encode('utf-8'))
+    seek_log_file(file, start_offset)
+    carry = b''
+    carry_offset = start_offset
+    while True:
+        chunk = file.read(buffer_size)
+        if chunk and not chunk.endswith(b'\n'):
+            chunk += file.readline()
+        at_eof = not chunk.endswith(b'\n')
+        if at_eof and not include_incomplete_line:
+            # leave an incomplete trailing line for the next scan
+            chunk = chunk[:chunk.rfind(b'\n') + 1]
+        text = carry + chunk
+        segment_start = 0
+        for m in regex.finditer(text):
+            if m.start() == 0 or m.end() == m.start():
+                continue
+            entry = _to_entry(text, segment_start, m.start(), carry_offset)
+            if entry is not None:
+                yield entry
+            segment_start = m.start()
+        carry = text[segment_start:]
+        carry_offset += segment_start
+        if at_eof:
+            break
+        while len(carry) > max_entry_size:
+            entry = _to_entry(carry, 0, max_entry_size, carry_offset)
+            if entry is not None:
+                yield entry
+            carry = carry[max_entry_size:]
+            carry_offset += max_entry_size
+    if carry:
+        entry = _to_entry(carry, 0, len(carry), carry_offset)
+        if entry is not None:
+            yield entry
+
+
+def _to_entry(text: bytes, start: int, end: int, base_offset: int):
+    entry_text = text[start:end].decode('utf-8', errors='replace').strip()
+    if entry_text == '':
+        return None
+    return LogEntry(text=entry_text, start=base_offset + start, end=base_offset + end)
+
+
+class LogDocumentParser:
+    """
+    Turns a log file into (text, metadata) pairs ready for embedding.
+
+    With a `miner`, entries are collapsed into one pair per log template instead. Templates are emitted once the file
+    is fully read, or whenever the miner holds more than `max_clusters` templates to keep memory bounded.
+    After iterating, `end_offset` is where the next incremental read of the file should start.
+
+    Compressed archives (.gz, .bz2, .xz, .zst) are decompressed on the fly and read to the end, trailing line
+    included, as they do not grow. Offsets are then offsets in the decompressed bytes.
+    """
+
+    def __init__(self, log_file_path: str, pattern_to_split_log_lines: str, start_offset: int = 0,
+                 miner: Optional[TemplateMiner] = None, max_clusters: int = 5000):
+        self._log_file_path = log_file_path
+        self._pattern = pattern_to_split_log_lines
+        self._start_offset = start_offset
+        self._miner = miner
+        self._max_clusters = max_clusters
+        self.end_offset = start_offset
+
+    def __iter__(self) -> Iterator[tuple[str, dict]]:
+        archive = compression_of(self._log_file_path) is not None
+        with open_log_file(self._log_file_path) as log_file:
+            entries = _until_truncated(iter_log_entries(log_file, self._pattern, start_offset=self._start_offset,
+                                                        include_incomplete_line=archive))
+            if self._miner is None:
+                for entry in entries:
+                    self.end_offset = entry.end
+                    yield entry.text, log_entry_metadata(entry, self._log_file_path)
+                return
+            timestamp_regex = re.compile(self._pattern)
+            for entry in entries:
+                self.end_offset = entry.end
+                timestamp, text = _split_timestamp(timestamp_regex, entry.text)
+                self._miner.add(text, offset=entry.start, timestamp=timestamp)
+                if self._miner.num_clusters > self._max_clusters:
+                    yield from self._drain_clusters()
+            yield from self._drain_clusters()
+
+    def _drain_clusters(self) -> Iterator[tuple[str, dict]]:
+        clusters = sorted(self._miner.clusters(), key=lambda c: c.first_offset)
+        self._miner.reset()
+        for cluster in clusters:
+            text = cluster_to_text(cluster)
+            metadata = {
+                'log_dir': os.path.dirname(self._log_file_path),
+                'file_name': os.path.basename(self._log_file_path),
+                **cluster_metadata(cluster),
+                **extract_log_fields(text)
+            }
+            yield text, metadata
+
+
+def _until_truncated(entries: Iterator[LogEntry]) -> Iterator[LogEntry]:
+    try:
+        yield from entries
+    except EOFError:
+        # an archive still being written (e.g. compressed by logrotate) ends early. It has grown by the next scan,
+        # which indexes it again from scratch
+        pass
+
+
+def _split_timestamp(timestamp_regex, text: str) -> tuple[Optional[str], str]:
+    m = timestamp_regex.match(text)
+    if m is None or m.end() == 0:
+        return None, text
+    timestamp = m.group(1) if m.groups() else m.group(0)
+    return timestamp.strip(), text[m.end():].strip()
+
+
+def expand_occurrences(metadata: dict, pattern_to_split_log_lines: str, limit: int) -> list[LogEntry]:
+    """
+    Reads back raw occurrences of a log template from the log file, using the offsets recorded at index time.
+    The first occurrence is skipped as it is already the representative entry of the template.
+    """
+    log_file_path = os.path.join(metadata['log_dir'], metadata['file_name'])
+    occurrences = []
+    try:
+        for offset in metadata.get('occurrence_offsets', [])[1:limit + 1]:
+            # reopened for every occurrence, as archive streams read ahead cannot seek back
+            with open_log_file(log_file_path) as log_file:
+                entry = next(iter_log_entries(log_file, pattern_to_split_log_lines, start_offset=offset,
+                                              buffer_size=64 * 1024), None)
+            if entry is not None:
+                occurrences.append(entry)
+    except DECOMPRESSION_ERRORS:
+        pass
+    return occurrences
@@ -0,0 +1,104 @@
+import re
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from loguru.core.docstore import ColumnarDocstore
+from loguru.core.lexical_index import required_literals
+from loguru.core.metadata_index import to_mask
+from loguru.core.models.log_filter import LogFilter
+
+# entries shown at a time before asking whether to continue
+PAGE_SIZE = 20
+GREP_USAGE = "/grep [-i] [-e] [-s SEVERITY] <text or, with -e, regular expression>"
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Converts a glob-like search pattern (`*` for any text, `?` for any character) to an unanchored regular expression.
+    """
+    return ''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern)
+
+
+def parse_grep_args(args: str) -> Tuple[str, bool, bool, Optional[str]]:
+    """
+    Parses the arguments of the /grep command.
+
+    :return: pattern, whether it is a regular expression, whether to ignore case and the severity to filter on
+    """
+    regex, ignore_case, severity = False, False, None
+    args = args.strip()
+    while True:
+        m = re.match(r'(-[ie])(?:\s+|$)|-s\s+(\S+)(?:\s+|$)', args)
+        if m is None:
+            break
+        if m.group(1) == '-i':
+            ignore_case = True
+        elif m.group(1) == '-e':
+            regex = True
+        else:
+            severity = m.group(2)
+        args = args[m.end():]
+    if args == '':
+        raise ValueError(f"Usage: {GREP_USAGE}")
+    return args, regex, ignore_case, severity
+
+
+class LogSearchEngine:
+    """
+    Substring and regular expression search over the indexed log entries.
+
+    The docstore's lexical index narrows a search down to the entries containing every literal the pattern requires,
+    and only those are matched against the pattern, so most searches read a small fraction of the logs. Results are
+    produced lazily, in index order.
+    """
+
+    def __init__(self, docstore: ColumnarDocstore):
+        self._docstore = docstore
+
+    def search(self, pattern: str, regex: bool = False, ignore_case: bool = False,
+               log_filter: Optional[LogFilter] = None) -> Iterator[Document]:
+        """
+        :param pattern: text to look for, or a regular expression if `regex`
+        :raises re.error: if `pattern` is not a valid regular expression
+        """
+        compiled = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE if ignore_case else 0)
+        for position in self._candidates(pattern if regex else None, pattern if not regex else None, log_filter):
+            if compiled.search(self._docstore.text_at(position)):
+                yield self._docstore.document(position)
+
+    def _candidates(self, regex: Optional[str], text: Optional[str],
+                    log_filter: Optional[LogFilter]) -> Iterable[int]:
+        mask = None
+        lexical_index = self._docstore.lexical_index()
+        if lexical_index is not None:
+            mask = lexical_index.candidates(required_literals(regex) if regex is not None else [text])
+        if log_filter is not None and not log_filter.is_empty():
+            bitmap = self._docstore.select(log_filter)
+            if bitmap is not None:
+                matching = to_mask(bitmap, len(self._docstore))
+                mask = matching if mask is None else mask & matching
+        if mask is None:
+            return range(len(self._docstore))
+        return (int(p) for p in np.flatnonzero(mask))
+
+
+def print_paginated(documents: Iterable[Document], page_size: int, interactive: bool = True) -> int:
+    """
+    Prints log entries as they are found, pausing after every `page_size` entries until the user asks for more.
+
+    :return: the number of entries printed
+    """
+    count = 0
+    for document in documents:
+        if interactive and count > 0 and count % page_size == 0:
+            answer = input(f"-- {count} entries shown, Enter for more, q to stop -- ")
+            if answer.strip().lower() == 'q':
+                return count
+        location = document.metadata.get('file_name', '')
+        if 'offset' in document.metadata:
+            location += f":{document.metadata['offset']}"
+        print(f"{location}: {document.page_content}")
+        count += 1
+    return count
@@ -0,0 +1,85 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from loguru.core.log_fields import SEVERITIES
+
+NO_TIMESTAMP = np.iinfo(np.int64).min
+NO_SEVERITY = -1
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def to_bitmap(mask: np.ndarray) -> np.ndarray:
+    """
+    Packs a boolean mask into the bitmap layout FAISS' `IDSelectorBitmap` expects (bit i of byte i // 8 is i % 8).
+    """
+    return np.packbits(mask, bitorder='little')
+
+
+def to_mask(bitmap: np.ndarray, num_positions: int) -> np.ndarray:
+    return np.unpackbits(bitmap, count=num_positions, bitorder='little').astype(bool)
+
+
+def bitmap_count(bitmap: np.ndarray) -> int:
+    return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+
+class MetadataIndex:
+    """
+    Secondary index over the timestamp and severity columns of a docstore: the positions of the entries sorted by
+    timestamp, and one bitmap of positions per severity, so filters such as "ERROR in the last hour" are resolved
+    without looking at the entries themselves.
+    """
+
+    def __init__(self, num_positions: int, sorted_timestamps: np.ndarray, timestamp_positions: np.ndarray,
+                 severity_bitmaps: np.ndarray):
+        self._num_positions = num_positions
+        self._sorted_timestamps = sorted_timestamps
+        self._timestamp_positions = timestamp_positions
+        self._severity_bitmaps = severity_bitmaps
+
+    @classmethod
+    def build(cls, timestamps: np.ndarray, severities: np.ndarray) -> 'MetadataIndex':
+        """
+        :param timestamps: timestamp of each position, `NO_TIMESTAMP` if unknown
+        :param severities: severity code (index in `SEVERITIES`) of each position, `NO_SEVERITY` if unknown
+        """
+        positions = np.flatnonzero(timestamps != NO_TIMESTAMP)
+        timestamp_positions = positions[np.argsort(timestamps[positions], kind='stable')]
+        severity_bitmaps = np.stack([to_bitmap(severities == code) for code in range(len(SEVERITIES))])
+        return cls(len(timestamps), np.asarray(timestamps[timestamp_positions]), timestamp_positions,
+                   severity_bitmaps)
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, 'timestamp.sorted.npy'), self._sorted_timestamps)
+        np.save(os.path.join(directory, 'timestamp.positions.npy'), self._timestamp_positions)
+        np.save(os.path.join(directory, 'severity.bitmaps.npy'), self._severity_bitmaps)
+
+    @classmethod
+    def load(cls, directory: str, num_positions: int) -> 'MetadataIndex':
+        return cls(num_positions,
+                   np.load(os.path.join(directory, 'timestamp.sorted.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'timestamp.positions.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'severity.bitmaps.npy'), mmap_mode='r'))
+
+    def select(self, severities: Optional[List[str]] = None, since: Optional[int] = None,
+               until: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        :return: bitmap of the positions matching all the given conditions, None if no condition is given
+        """
+        bitmap = None
+        if severities:
+            bitmap = np.zeros(self._severity_bitmaps.shape[1], dtype=np.uint8)
+            for severity in severities:
+                bitmap |= self._severity_bitmaps[SEVERITIES.index(severity)]
+        if since is not None or until is not None:
+            start = 0 if since is None else np.searchsorted(self._sorted_timestamps, since, side='left')
+            end = len(self._sorted_timestamps) if until is None else \
+                np.searchsorted(self._sorted_timestamps, until, side='right')
+            mask = np.zeros(self._num_positions, dtype=bool)
+            mask[self._timestamp_positions[start:end]] = True
+            in_range = to_bitmap(mask)
+            bitmap = in_range if bitmap is None else bitmap & in_range
+        return bitmap
@@ -0,0 +1,149 @@
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar('T')
+
+# latest observations of each timer and histogram kept for the percentiles
+SAMPLES = 1024
+
+
+class Histogram:
+    """
+    Count, sum, min and max of all observed values, and percentiles of the latest `SAMPLES` of them.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', '_samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._samples = deque(maxlen=SAMPLES)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._samples.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+
+        def _percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count, 'min': self.min,
+                'p50': _percentile(0.5), 'p95': _percentile(0.95), 'p99': _percentile(0.99), 'max': self.max}
+
+
+class MetricsRegistry:
+    """
+    Counters, timers (durations in seconds) and histograms of the hot paths, kept for the life of the process.
+
+    Recording takes a lock and a few arithmetic operations, so stages are timed per file, batch or question rather
+    than per log entry. Names are plain strings, e.g. `embed` or `ollama_requests[http://gpu-1:11434]`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timers: Dict[str, Histogram] = {}
+        self._histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def record_time(self, name: str, seconds: float):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = Histogram()
+            timer.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.record_time(name, time.time() - start_time)
+
+    def timed(self, items: Iterable[T], name: str) -> Iterator[T]:
+        """
+        Yields `items`, recording the time spent producing all of them (e.g. parsing a log file) as one observation,
+        without the time the consumer spends in between.
+        """
+        iterator = iter(items)
+        elapsed = 0.0
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.time() - start_time
+                yield item
+        finally:
+            self.record_time(name, elapsed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'timers': {name: timer.summary() for name, timer in self._timers.items()},
+                    'histograms': {name: histogram.summary() for name, histogram in self._histograms.items()}}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timers = {}
+            self._histograms = {}
+
+    def write_json(self, file_path: str):
+        """
+        Replaces `file_path` with a snapshot of the metrics, so readers never see a partly written file.
+        """
+        snapshot = {'time': time.time(), 'pid': os.getpid(), **self.snapshot()}
+        directory = os.path.dirname(file_path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        with self._write_lock:
+            with open(f"{file_path}.tmp", 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(f"{file_path}.tmp", file_path)
+
+
+def metrics_delta(before: dict, after: dict) -> dict:
+    """
+    :return: counters and number of calls and total time of the timers recorded between two snapshots, e.g. during
+        one question
+    """
+    counters = {name: value - before['counters'].get(name, 0) for name, value in after['counters'].items()
+                if value != before['counters'].get(name, 0)}
+    timers = {}
+    for name, timer in after['timers'].items():
+        previous: Optional[dict] = before['timers'].get(name)
+        count = timer['count'] - (previous['count'] if previous else 0)
+        if count > 0:
+            timers[name] = {'count': count, 'total': timer['total'] - (previous['total'] if previous else 0.0)}
+    return {'counters': counters, 'timers': timers}
+
+
+METRICS = MetricsRegistry()
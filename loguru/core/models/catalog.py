@@ -0,0 +1,34 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ShardEntry(BaseModel):
+    shard_id: str = Field(..., description="Name of the shard directory")
+    source: str = Field(..., description="Data source the log entries come from. Ex: filesystem-0")
+    location: str = Field(..., description="Scan location the log entries come from")
+    bucket: str = Field(..., description="Time bucket of the log entries. Ex: 2024-06-14, undated")
+    num_entries: int = Field(..., description="Number of log entries in the shard")
+    min_timestamp: Optional[int] = Field(None, description="Earliest entry time, in milliseconds since the epoch")
+    max_timestamp: Optional[int] = Field(None, description="Latest entry time, in milliseconds since the epoch")
+    severities: List[str] = Field(default_factory=list, description="Severities found among the log entries")
+    files: List[str] = Field(default_factory=list,
+                             description="File IDs (file_key:generation) of the log files the entries were indexed "
+                                         "from")
+    renames: List[Dict[str, str]] = Field(default_factory=list,
+                                          description="Log files moved since the shard was written (old path -> new "
+                                                      "path), applied in order when the shard is opened")
+
+
+class RetiredShard(BaseModel):
+    shard_id: str = Field(..., description="Name of the shard directory")
+    retired_at: float = Field(..., description="Time the shard was replaced, in seconds since the epoch")
+
+
+class Catalog(BaseModel):
+    version: int = Field(1, description="Catalog format version")
+    catalog_id: str = Field('', description="Random ID given to the catalog when the index is built from scratch")
+    next_shard: int = Field(0, description="Number of the next shard directory")
+    shards: List[ShardEntry] = Field(default_factory=list, description="Shards of the index")
+    retired: List[RetiredShard] = Field(default_factory=list,
+                                        description="Replaced shards, kept for readers that may still search them")
@@ -1,7 +1,7 @@
 import re
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field, conint, field_validator
+from pydantic import BaseModel, Field, confloat, conint, field_validator
 
 
 class Options(BaseModel):
@@ -13,13 +13,27 @@ class Ollama(BaseModel):
     llm_name: str = Field(..., description="Model name")
     embedding_model_name: str = Field(..., description="Embedding Model name")
     options: Options = Field(..., description="Options for the model")
+    num_ctx: conint(ge=512) = Field(3072, description="Size of the context window of the model, in tokens")
+    connect_timeout: confloat(gt=0) = Field(3.0, description="Seconds to wait for a host to accept a connection "
+                                                             "before failing over to another host")
+    request_timeout: Optional[confloat(gt=0)] = Field(300.0, description="Seconds to wait for a host to send the "
+                                                                         "next part of a response. No limit if not "
+                                                                         "set")
+    retry_delay: confloat(gt=0) = Field(10.0, description="Seconds a failing host is skipped before it is checked "
+                                                          "again, doubling with every further failure")
 
 
 class ScanLocations(BaseModel):
-    # include_paths: List[str] = Field(..., description="Paths to include in the scan")
-    # exclude_paths: List[str] = Field(..., description="Paths to exclude from the scan")
-    # include_patterns: List[str] = Field(..., description="Patterns to include in the scan")
-    # exclude_patterns: List[str] = Field(..., description="Patterns to exclude from the scan")
+    include_paths: Optional[List[str]] = Field(None,
+                                               description="Globs of file paths, relative to the location, to include "
+                                                           "in the scan. Ex: app/*.log")
+    exclude_paths: Optional[List[str]] = Field(None,
+                                               description="Globs of file or directory paths, relative to the "
+                                                           "location, to exclude from the scan. Ex: archive")
+    include_patterns: Optional[List[str]] = Field(None,
+                                                  description="Globs of file names to include in the scan. Ex: *.log")
+    exclude_patterns: Optional[List[str]] = Field(None,
+                                                  description="Globs of file names to exclude from the scan. Ex: *.tmp")
 
     location: str = Field(..., description="Paths to include in the scan")
     pattern: str = Field(..., description="Paths to include in the scan")
@@ -61,6 +75,143 @@ class Anthropic(BaseModel):
     llm_name: str = Field(..., description="Anthropic Model Name. Ex: claude-3-opus-20240229")
 
 
+class Indexing(BaseModel):
+    embedding_batch_size: conint(ge=1) = Field(512, description="Number of log entries to embed per batch")
+    checkpoint_every_n_batches: Optional[conint(ge=1)] = Field(
+        None,
+        description="Save the index to disk after every N batches while scanning. "
+                    "If not set, the index is saved once after the scan completes"
+    )
+    walker_threads: conint(ge=1) = Field(16, description="Number of threads used to list and stat log files")
+    parse_workers: conint(ge=1) = Field(1, description="Number of processes that split log files into entries")
+    embed_workers: conint(ge=1) = Field(1,
+                                        description="Number of processes that embed log entries. The scan runs "
+                                                    "in a single process if both parse_workers and embed_workers are 1")
+    pipeline_queue_size: conint(ge=1) = Field(8, description="Maximum number of batches buffered between the "
+                                                             "parse, embed and index stages")
+
+
+class EmbeddingCache(BaseModel):
+    enabled: bool = Field(True, description="Reuse the embeddings of log entries and questions seen before")
+    max_entries: conint(ge=1) = Field(1000000, description="Maximum number of cached embeddings, the least recently "
+                                                           "used ones are evicted first")
+
+
+class TemplateMining(BaseModel):
+    enabled: bool = Field(False, description="Collapse repetitive log entries into one indexed entry per log template")
+    similarity_threshold: confloat(ge=0.0, le=1.0) = Field(0.5,
+                                                           description="Share of matching tokens for an entry to "
+                                                                       "join an existing template")
+    tree_depth: conint(ge=3) = Field(4, description="Depth of the template parse tree")
+    max_clusters: conint(ge=1) = Field(5000, description="Maximum number of templates held in memory per log file "
+                                                         "before they are flushed to the index")
+    max_occurrence_offsets: conint(ge=0) = Field(100, description="Number of occurrence offsets kept per template")
+    max_sample_values: conint(ge=0) = Field(5, description="Number of sample variable values kept per template")
+    expand_occurrences: conint(ge=0) = Field(0, description="Number of raw occurrences of each retrieved template "
+                                                            "to add to the context of a question")
+
+
+class VectorIndex(BaseModel):
+    type: Literal['flat', 'ivf', 'ivfpq', 'hnsw', 'hnswpq'] = Field('flat',
+                                                                    description="Type of the vector index. Ex: flat "
+                                                                                "(exact), ivf, ivfpq, hnsw, hnswpq")
+    nlist: Optional[conint(ge=1)] = Field(None, description="Number of IVF lists. If not set, derived from the "
+                                                            "number of indexed log entries")
+    nprobe: conint(ge=1) = Field(8, description="Number of IVF lists visited per query")
+    hnsw_m: conint(ge=2) = Field(32, description="Number of neighbours per HNSW node")
+    ef_construction: conint(ge=1) = Field(200, description="HNSW candidate list size while building the index")
+    ef_search: conint(ge=1) = Field(64, description="HNSW candidate list size per query")
+    pq_m: conint(ge=1) = Field(16, description="Number of PQ sub-quantizers, must divide the embedding dimension")
+    pq_nbits: conint(ge=1, le=16) = Field(8, description="Bits per PQ code")
+    min_train_size: conint(ge=1) = Field(10000, description="Number of log entries below which the index stays flat")
+    retrain_growth_factor: confloat(gt=1.0) = Field(2.0, description="Retrain IVF/PQ indexes once the number of log "
+                                                                     "entries grows by this factor since the last "
+                                                                     "training")
+
+
+class Sharding(BaseModel):
+    time_bucket: Literal['hour', 'day', 'week', 'none'] = Field('day', description="Time span (UTC) of the log entries "
+                                                                                  "of a shard, next to their data "
+                                                                                  "source and scan location")
+    max_shards_per_bucket: conint(ge=2) = Field(8, description="Number of shards of one scan location and time bucket "
+                                                               "above which the smallest ones are merged")
+    query_threads: conint(ge=1) = Field(8, description="Number of threads searching shards in parallel")
+
+
+class Retrieval(BaseModel):
+    infer_filters: bool = Field(True, description="Restrict the search to the severities and time ranges mentioned in "
+                                                  "a question. Ex: ERRORs in the last hour")
+    hybrid: bool = Field(True, description="Combine keyword (BM25) and vector search, so exact identifiers such as "
+                                           "error codes, request IDs and class names are found")
+    vector_candidates: conint(ge=1) = Field(100, description="Number of entries taken from the vector search, at least "
+                                                             "num_chunks_to_return")
+    keyword_candidates: conint(ge=1) = Field(100, description="Number of entries taken from the keyword search")
+    rrf_k: conint(ge=1) = Field(60, description="Reciprocal rank fusion constant, higher values flatten the "
+                                                "advantage of top ranked entries")
+    rerank_model_name: Optional[str] = Field(None, description="Local cross-encoder model to rerank the fused "
+                                                               "entries with. Ex: cross-encoder/ms-marco-MiniLM-L-6-v2")
+    rerank_candidates: conint(ge=1) = Field(50, description="Number of top fused entries to rerank")
+
+
+class Context(BaseModel):
+    max_tokens: Optional[conint(ge=128)] = Field(None, description="Token budget for the log entries in a prompt. If "
+                                                                   "not set, the context window less room for the "
+                                                                   "instructions, question and answer")
+    context_window: Optional[conint(ge=512)] = Field(None, description="Size of the context window of the model, in "
+                                                                       "tokens. Defaults to ollama.num_ctx for Ollama "
+                                                                       "and a conservative size for other services")
+    answer_tokens: conint(ge=0) = Field(512, description="Tokens of the context window kept free for the answer")
+    dedupe: bool = Field(True, description="Collapse log entries that only differ in IDs, numbers or timestamps")
+    map_reduce_below_coverage: confloat(ge=0.0, le=1.0) = Field(0.5, description="Summarize the retrieved entries in "
+                                                                                 "parallel batches first when less "
+                                                                                 "than this share of them fits the "
+                                                                                 "budget, 0 to never")
+    map_reduce_max_batches: conint(ge=1) = Field(8, description="Maximum number of batches summarized per question")
+    map_reduce_concurrency: conint(ge=1) = Field(4, description="Number of batches summarized at the same time")
+
+
+class AnswerCache(BaseModel):
+    enabled: bool = Field(True, description="Answer questions asked before from the cache while the index and LLM are "
+                                            "unchanged")
+    similarity_threshold: confloat(ge=0.0, le=1.0) = Field(0.95, description="Minimum cosine similarity of a question "
+                                                                            "to one asked before to reuse its answer")
+    ttl_seconds: Optional[confloat(gt=0)] = Field(3600.0, description="Seconds an answer is reused for. No limit if "
+                                                                      "not set")
+    max_entries: conint(ge=1) = Field(1000, description="Maximum number of cached answers, the least recently used "
+                                                        "ones are evicted first")
+
+
+class Follow(BaseModel):
+    batch_delay: confloat(ge=0) = Field(0.5, description="Seconds changes are collected for before they are indexed "
+                                                         "together, raised while scans take longer")
+    use_inotify: bool = Field(True, description="Notice changes with inotify where available (Linux) instead of "
+                                                "polling")
+    poll_interval: confloat(gt=0) = Field(1.0, description="Seconds between checks for changes when polling")
+    rescan_interval: confloat(gt=0) = Field(60.0, description="Seconds between scans while inotify reports no "
+                                                              "changes, for changes it cannot see (e.g. on network "
+                                                              "file systems)")
+
+
+class Session(BaseModel):
+    rescan_interval: confloat(ge=0) = Field(60.0, description="Seconds after which the interactive session scans the "
+                                                              "logs again before a question or /grep. 0 to only scan "
+                                                              "when the session starts and on /scan")
+
+
+class BatchQuery(BaseModel):
+    concurrency: conint(ge=1) = Field(4, description="Number of questions `loguru query` answers at the same time")
+    questions_per_minute: Dict[str, conint(ge=1)] = Field(default_factory=dict,
+                                                          description="Maximum number of questions sent to an LLM "
+                                                                      "service per minute, by service. Ex: "
+                                                                      "{\"openai\": 60}")
+
+
+class Metrics(BaseModel):
+    file: Optional[str] = Field(None, description="Write the metrics (timers, counters and histograms of scans and "
+                                                  "questions) as JSON to this file after each scan and question, e.g. "
+                                                  "for a dashboard. Not written if not set")
+
+
 class Config(BaseModel):
     service: str = Field(..., description="LLM service type. Ex: ollama, gemini")
     ollama: Optional[Ollama] = Field(..., description="Ollama configuration")
@@ -69,3 +220,16 @@ class Config(BaseModel):
     anthropic: Optional[Anthropic] = Field(..., description="Anthropic configuration")
     data_sources: List[DataSource] = Field(..., description="List of data sources")
     num_chunks_to_return: int = Field(..., description="Number of chunks to return")
+    indexing: Indexing = Field(default_factory=Indexing, description="Index build configuration")
+    embedding_cache: EmbeddingCache = Field(default_factory=EmbeddingCache, description="Embedding cache configuration")
+    template_mining: TemplateMining = Field(default_factory=TemplateMining,
+                                            description="Log template mining configuration")
+    vector_index: VectorIndex = Field(default_factory=VectorIndex, description="Vector index configuration")
+    sharding: Sharding = Field(default_factory=Sharding, description="Index sharding configuration")
+    retrieval: Retrieval = Field(default_factory=Retrieval, description="Retrieval configuration")
+    context: Context = Field(default_factory=Context, description="Prompt context packing configuration")
+    answer_cache: AnswerCache = Field(default_factory=AnswerCache, description="Answer cache configuration")
+    follow: Follow = Field(default_factory=Follow, description="Live tail (--follow) configuration")
+    session: Session = Field(default_factory=Session, description="Interactive session (run) configuration")
+    query: BatchQuery = Field(default_factory=BatchQuery, description="Batch question answering (query) configuration")
+    metrics: Metrics = Field(default_factory=Metrics, description="Metrics configuration")
@@ -0,0 +1,48 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+from loguru.core.log_fields import format_timestamp, normalize_severity
+
+
+class LogFilter(BaseModel):
+    severities: Optional[List[str]] = Field(None, description="Severities to include. Ex: ERROR, WARN")
+    since: Optional[int] = Field(None, description="Earliest entry time, in milliseconds since the epoch")
+    until: Optional[int] = Field(None, description="Latest entry time, in milliseconds since the epoch")
+    loggers: Optional[List[str]] = Field(None, description="Globs of logger names to include. Ex: com.example.*")
+    threads: Optional[List[str]] = Field(None, description="Globs of thread names to include. Ex: http-nio-*")
+    locations: Optional[List[str]] = Field(None, description="Globs of scan locations to include. "
+                                                             "Ex: /var/log/payment*")
+
+    @field_validator('severities')
+    def validate_severities(cls, v):
+        if v is None:
+            return v
+        severities = []
+        for severity in v:
+            normalized = normalize_severity(severity)
+            if normalized is None:
+                raise ValueError(f"Unknown severity: {severity}")
+            if normalized not in severities:
+                severities.append(normalized)
+        return severities
+
+    def is_empty(self) -> bool:
+        return not (self.severities or self.since is not None or self.until is not None or self.loggers or
+                    self.threads or self.locations)
+
+    def describe(self) -> str:
+        parts = []
+        if self.severities:
+            parts.append('/'.join(self.severities))
+        if self.loggers:
+            parts.append(f"logger {', '.join(self.loggers)}")
+        if self.threads:
+            parts.append(f"thread {', '.join(self.threads)}")
+        if self.locations:
+            parts.append(f"in {', '.join(self.locations)}")
+        if self.since is not None:
+            parts.append(f"since {format_timestamp(self.since)}")
+        if self.until is not None:
+            parts.append(f"until {format_timestamp(self.until)}")
+        return ' '.join(parts)
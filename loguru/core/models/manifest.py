@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class FileEntry(BaseModel):
+    file_key: str = Field(..., description="Stable key derived from the file path, used to build document IDs")
+    size: int = Field(..., description="File size in bytes when it was last indexed")
+    mtime_ns: int = Field(..., description="File modification time (ns) when it was last indexed")
+    offset: int = Field(..., description="Byte offset up to which the file has been indexed, in the decompressed bytes "
+                                         "of archives")
+    head_len: int = Field(..., description="Number of leading (decompressed) bytes covered by head_hash")
+    head_hash: str = Field(..., description="SHA-1 of the first head_len bytes, used to detect rotation")
+    generation: int = Field(0, description="Incremented every time the file is re-indexed from scratch")
+    num_entries: int = Field(0, description="Number of log entries indexed for the current generation")
+    inode: Optional[int] = Field(None, description="Inode number of the file, used to recognize it once rotated")
+    device: Optional[int] = Field(None, description="Device of the file, used to recognize it once rotated")
+    compression: Optional[str] = Field(None, description="Compression of archives (gzip, bzip2, xz or zstd), which "
+                                                         "are indexed once and never read again unless replaced")
+
+    def doc_ids(self) -> List[str]:
+        return [doc_id(self.file_key, self.generation, seq) for seq in range(self.num_entries)]
+
+
+class LocationEntry(BaseModel):
+    pattern: str = Field(..., description="Pattern used to split the log entries of this location")
+    files: Dict[str, FileEntry] = Field(default_factory=dict, description="Indexed files keyed by path")
+
+
+class Manifest(BaseModel):
+    version: int = Field(1, description="Manifest format version")
+    template_mining: bool = Field(False, description="Whether log entries were collapsed into log templates")
+    index_id: str = Field('', description="Random ID given to the index when it is built from scratch")
+    index_generation: int = Field(0, description="Incremented every time a scan changes the index")
+    locations: Dict[str, LocationEntry] = Field(default_factory=dict, description="Scan locations keyed by path")
+
+
+def file_id(file_key: str, generation: int) -> str:
+    """
+    Identifies the log entries indexed from a file in one generation, as the prefix of their document IDs.
+    """
+    return f"{file_key}:{generation}"
+
+
+def doc_id(file_key: str, generation: int, seq: int) -> str:
+    return f"{file_id(file_key, generation)}:{seq}"
+
+
+def doc_file_id(document_id: str) -> str:
+    return document_id.rsplit(':', 1)[0]
@@ -0,0 +1,247 @@
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from langchain_community.chat_models import ChatOllama
+
+from loguru.core.metrics import METRICS
+
+# weight of the latest request in a host's moving average latency
+LATENCY_SMOOTHING = 0.3
+# longest time a failing host is skipped before it is checked again, in seconds
+MAX_RETRY_DELAY = 300.0
+
+
+class NoHealthyHostError(RuntimeError):
+    pass
+
+
+class _HostError(Exception):
+    pass
+
+
+class _Host:
+    __slots__ = ('url', 'session', 'in_flight', 'latency', 'failures', 'retry_at')
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        self.in_flight = 0
+        # moving average time to the first response line, None until a request completed
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.failures == 0
+
+
+class OllamaHostPool:
+    """
+    Spreads requests over a set of Ollama hosts.
+
+    Each request goes to the least loaded healthy host, the one whose requests in flight would take the least time at
+    its moving average latency, over a persistent session, so connections are reused across queries. A host that fails
+    to connect, times out or answers with a server error is marked unhealthy and the request fails over to the next
+    host.
+    Unhealthy hosts are skipped for `retry_delay` seconds, doubling with every further failure, then health checked
+    (`GET /api/version`) before being used again.
+    """
+
+    def __init__(self, hosts: List[str], connect_timeout: float = 3.0, request_timeout: Optional[float] = None,
+                 retry_delay: float = 10.0):
+        if len(hosts) == 0:
+            raise ValueError("No Ollama hosts configured")
+        self._hosts = [_Host(str(url)) for url in hosts]
+        self._connect_timeout = connect_timeout
+        self._request_timeout = request_timeout
+        self._retry_delay = retry_delay
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self) -> List[str]:
+        return [host.url for host in self._hosts]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{'url': h.url, 'healthy': h.healthy, 'in_flight': h.in_flight, 'latency': h.latency,
+                     'failures': h.failures} for h in self._hosts]
+
+    def check_health(self, host: _Host) -> bool:
+        try:
+            response = host.session.get(f"{host.url}/api/version", timeout=self._connect_timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        with self._lock:
+            if ok:
+                host.failures = 0
+            else:
+                self._mark_failed(host)
+        return ok
+
+    def best_url(self) -> str:
+        """
+        :return: the URL of the host the next request would go to, for clients that make their own requests
+        """
+        host = self._acquire(set())
+        self._release(host)
+        return host.url
+
+    def _mark_failed(self, host: _Host):
+        host.failures += 1
+        host.retry_at = time.time() + min(self._retry_delay * 2 ** (host.failures - 1), MAX_RETRY_DELAY)
+
+    def _acquire(self, tried: set) -> _Host:
+        while True:
+            now = time.time()
+            with self._lock:
+                candidates = [h for h in self._hosts if h.url not in tried]
+                healthy = [h for h in candidates if h.healthy]
+                due = [h for h in candidates if not h.healthy and h.retry_at <= now]
+                if len(healthy) > 0:
+                    # check the hosts whose retry delay is over in the background, they rejoin once healthy
+                    for host in due:
+                        host.retry_at = now + self._retry_delay
+                        threading.Thread(target=self.check_health, args=(host,), daemon=True).start()
+                    host = min(healthy, key=_expected_wait)
+                    host.in_flight += 1
+                    return host
+            if len(due) == 0:
+                raise NoHealthyHostError(f"No healthy Ollama host among {', '.join(self.urls)}")
+            # nothing healthy left: check the hosts whose retry delay is over and use the first one that recovered
+            for host in due:
+                if self.check_health(host):
+                    break
+            else:
+                tried.update(h.url for h in due)
+
+    def _release(self, host: _Host, latency: Optional[float] = None, failed: bool = False):
+        with self._lock:
+            host.in_flight -= 1
+            if failed:
+                self._mark_failed(host)
+            elif latency is not None:
+                host.failures = 0
+                host.latency = latency if host.latency is None else \
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * host.latency
+
+    def post_stream(self, path: str, payload: dict, headers: Optional[dict] = None) -> Iterator[str]:
+        """
+        POSTs `payload` to `path` and yields the lines of the streamed response. Fails over to another host until the
+        first line is received, errors after that are raised.
+
+        :raises NoHealthyHostError: if no host could answer
+        """
+        tried, last_error = set(), None
+        while True:
+            try:
+                host = self._acquire(tried)
+            except NoHealthyHostError as e:
+                raise e from last_error
+            tried.add(host.url)
+            METRICS.incr(f"ollama_requests[{host.url}]")
+            start_time = time.time()
+            try:
+                response = self._post(host, path, payload, headers)
+                lines = response.iter_lines(decode_unicode=True)
+                first_line = next(lines, '')
+                break
+            except (requests.ConnectionError, requests.Timeout, _HostError) as e:
+                last_error = e
+                METRICS.incr(f"ollama_failures[{host.url}]")
+                self._release(host, failed=True)
+            except BaseException:
+                self._release(host)
+                raise
+
+        latency = time.time() - start_time
+        failed = False
+        try:
+            yield first_line
+            yield from lines
+        except Exception:
+            failed = True
+            raise
+        finally:
+            response.close()
+            self._release(host, latency=None if failed else latency, failed=failed)
+
+    def _post(self, host: _Host, path: str, payload: dict, headers: Optional[dict]) -> requests.Response:
+        response = host.session.post(f"{host.url}{path}", json=payload, stream=True,
+                                     headers={'Content-Type': 'application/json', **(headers or {})},
+                                     timeout=(self._connect_timeout, self._request_timeout))
+        response.encoding = 'utf-8'
+        if response.status_code == 200:
+            return response
+        detail = response.text
+        response.close()
+        if response.status_code == 404:
+            # the model may only be missing on this host
+            raise _HostError(f"Ollama call to {host.url} failed with status code 404. Maybe your model is not found "
+                             f"and you should pull the model with `ollama pull {payload.get('model')}`.")
+        if response.status_code >= 500:
+            raise _HostError(f"Ollama call to {host.url} failed with status code {response.status_code}. Details: "
+                             f"{detail}")
+        raise ValueError(f"Ollama call failed with status code {response.status_code}. Details: {detail}")
+
+
+def _expected_wait(host: _Host) -> tuple:
+    # hosts without a measured latency yet are tried first, least busy first
+    if host.latency is None:
+        return 0.0, host.in_flight
+    return (host.in_flight + 1) * host.latency, host.in_flight
+
+
+_pools: Dict[tuple, OllamaHostPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(hosts: List[str], connect_timeout: float = 3.0, request_timeout: Optional[float] = None,
+             retry_delay: float = 10.0) -> OllamaHostPool:
+    """
+    Returns the pool for `hosts`, shared by everything in the process that talks to the same hosts.
+    """
+    key = (tuple(str(h) for h in hosts), connect_timeout, request_timeout, retry_delay)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = OllamaHostPool(list(key[0]), connect_timeout=connect_timeout,
+                                         request_timeout=request_timeout, retry_delay=retry_delay)
+        return _pools[key]
+
+
+class PooledChatOllama(ChatOllama):
+    """
+    `ChatOllama` whose requests go through an `OllamaHostPool` instead of to a single `base_url`. Only the synchronous
+    API is pooled, the async API uses `base_url`.
+    """
+    pool: OllamaHostPool
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _create_stream(self, api_url: str, payload: Any, stop: Optional[List[str]] = None,
+                       **kwargs: Any) -> Iterator[str]:
+        # same request as ChatOllama, see langchain_community.llms.ollama._OllamaCommon._create_stream
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+        params = self._default_params
+        for key in self._default_params:
+            if key in kwargs:
+                params[key] = kwargs[key]
+        if 'options' in kwargs:
+            params['options'] = kwargs['options']
+        else:
+            params['options'] = {**params['options'], 'stop': stop,
+                                 **{k: v for k, v in kwargs.items() if k not in self._default_params}}
+        if payload.get('messages'):
+            request_payload = {'messages': payload.get('messages', []), **params}
+        else:
+            request_payload = {'prompt': payload.get('prompt'), 'images': payload.get('images', []), **params}
+        path = api_url[len(self.base_url):]
+        return self.pool.post_stream(path, request_payload,
+                                     headers=self.headers if isinstance(self.headers, dict) else None)
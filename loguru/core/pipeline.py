@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, NamedTuple
+
+from langchain_core.embeddings import Embeddings
+
+from loguru.core.index_builder import IndexBuilder
+from loguru.core.log_parser import LogDocumentParser
+from loguru.core.models.config import TemplateMining
+from loguru.core.models.manifest import doc_id
+from loguru.core.templates import miner_from_config
+
+# message kinds passed between the stages
+_BATCH = 'batch'
+_FILE_DONE = 'file_done'
+_FILE_FAILED = 'file_failed'
+_WORKER_DONE = 'worker_done'
+
+
+class FileTask(NamedTuple):
+    path: str
+    pattern: str
+    start_offset: int
+    file_key: str
+    generation: int
+    first_seq: int
+
+
+class FileResult(NamedTuple):
+    task: FileTask
+    end_offset: int
+    num_entries: int  # number of entries of the current generation, including the ones indexed by earlier scans
+
+
+def _parse_worker(task_queue, batch_queue, batch_size: int, template_mining: TemplateMining):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        seq = task.first_seq
+        ids, texts, metadatas = [], [], []
+        try:
+            parser = LogDocumentParser(task.path, task.pattern, start_offset=task.start_offset,
+                                       miner=miner_from_config(template_mining),
+                                       max_clusters=template_mining.max_clusters)
+            for text, metadata in parser:
+                ids.append(doc_id(task.file_key, task.generation, seq))
+                texts.append(text)
+                metadatas.append(metadata)
+                seq += 1
+                if len(texts) >= batch_size:
+                    batch_queue.put((_BATCH, task.path, ids, texts, metadatas))
+                    ids, texts, metadatas = [], [], []
+            if len(texts) > 0:
+                batch_queue.put((_BATCH, task.path, ids, texts, metadatas))
+            batch_queue.put((_FILE_DONE, task.path, parser.end_offset, seq))
+        except Exception as e:
+            batch_queue.put((_FILE_FAILED, task.path, f"{type(e).__name__}: {e}"))
+
+
+def _embed_worker(embedding_factory: Callable[[], Embeddings], num_threads: int, batch_queue, result_queue):
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    embedding_model = embedding_factory()
+    while True:
+        message = batch_queue.get()
+        if message is None:
+            break
+        if message[0] == _BATCH:
+            _, path, ids, texts, metadatas = message
+            start_time = time.time()
+            try:
+                embeddings = embedding_model.embed_documents(texts)
+            except Exception as e:
+                result_queue.put((_FILE_FAILED, path, f"{type(e).__name__}: {e}"))
+                continue
+            result_queue.put((_BATCH, path, ids, texts, metadatas, embeddings, time.time() - start_time))
+        else:
+            result_queue.put(message)
+    result_queue.put((_WORKER_DONE,))
+
+
+class ScanPipeline:
+    """
+    Parses and embeds log files on multiple processes.
+
+    Files are split into log entries by `parse_workers` processes, the entries are embedded in batches by
+    `embed_workers` processes (each with its own copy of the embedding model) and the calling process is the single
+    writer that adds the embeddings to the index. The stages are connected by bounded queues so a fast stage cannot
+    run away from a slow one.
+    """
+
+    def __init__(self, embedding_factory: Callable[[], Embeddings], parse_workers: int, embed_workers: int,
+                 batch_size: int, queue_size: int, template_mining: TemplateMining):
+        """
+        :param embedding_factory: picklable callable that loads the embedding model in a worker process
+        """
+        self._embedding_factory = embedding_factory
+        self._template_mining = template_mining
+        self._parse_workers = parse_workers
+        self._embed_workers = embed_workers
+        self._batch_size = batch_size
+        self._queue_size = queue_size
+
+    def run(self, tasks: List[FileTask], builder: IndexBuilder,
+            on_file_done: Callable[[FileResult], None]) -> List[FileTask]:
+        """
+        Indexes the given files into `builder`. `on_file_done` is called once all the entries of a file were added.
+
+        :return: the tasks of the files that could not be indexed
+        """
+        if len(tasks) == 0:
+            return []
+        ctx = multiprocessing.get_context('spawn')
+        task_queue = ctx.Queue()
+        batch_queue = ctx.Queue(maxsize=self._queue_size)
+        result_queue = ctx.Queue(maxsize=self._queue_size)
+        for task in tasks:
+            task_queue.put(task)
+
+        num_parse_workers = min(self._parse_workers, len(tasks))
+        for _ in range(num_parse_workers):
+            task_queue.put(None)
+        threads_per_embed_worker = max(1, (os.cpu_count() or 1) // self._embed_workers)
+
+        parse_procs = [ctx.Process(target=_parse_worker,
+                                   args=(task_queue, batch_queue, self._batch_size, self._template_mining),
+                                   daemon=True)
+                       for _ in range(num_parse_workers)]
+        embed_procs = [ctx.Process(target=_embed_worker,
+                                   args=(self._embedding_factory, threads_per_embed_worker, batch_queue, result_queue),
+                                   daemon=True)
+                       for _ in range(self._embed_workers)]
+        for p in parse_procs + embed_procs:
+            p.start()
+
+        def _close_embed_stage():
+            # once every file is parsed, tell the embedding workers to finish
+            for proc in parse_procs:
+                proc.join()
+            for _ in embed_procs:
+                batch_queue.put(None)
+
+        closer = threading.Thread(target=_close_embed_stage, daemon=True)
+        closer.start()
+
+        tasks_by_path = {task.path: task for task in tasks}
+        written = {path: 0 for path in tasks_by_path}
+        seq_end = {path: task.first_seq for path, task in tasks_by_path.items()}
+        done = {}
+        failed = set()
+        completed = set()
+        workers_running = len(embed_procs)
+        try:
+            while workers_running > 0:
+                try:
+                    message = result_queue.get(timeout=1)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in embed_procs):
+                        print("Embedding workers exited unexpectedly.")
+                        break
+                    continue
+                kind = message[0]
+                if kind == _WORKER_DONE:
+                    workers_running -= 1
+                elif kind == _BATCH:
+                    _, path, ids, texts, metadatas, embeddings, embedding_time = message
+                    if path not in failed:
+                        builder.add_embeddings(texts, embeddings, metadatas, ids, embedding_time=embedding_time)
+                        written[path] += len(texts)
+                        seq_end[path] = max(seq_end[path], int(ids[-1].rsplit(':', 1)[1]) + 1)
+                elif kind == _FILE_DONE:
+                    _, path, end_offset, num_entries = message
+                    done[path] = (end_offset, num_entries)
+                elif kind == _FILE_FAILED:
+                    _, path, error = message
+                    print(f"Failed to index {path}: {error}")
+                    failed.add(path)
+                for path in [p for p in done if p not in failed]:
+                    end_offset, num_entries = done[path]
+                    task = tasks_by_path[path]
+                    if written[path] == num_entries - task.first_seq:
+                        on_file_done(FileResult(task=task, end_offset=end_offset, num_entries=num_entries))
+                        completed.add(path)
+                        del done[path]
+        finally:
+            for p in parse_procs + embed_procs:
+                if p.is_alive():
+                    p.terminate()
+            closer.join(timeout=1)
+
+        failed_tasks = [task for path, task in tasks_by_path.items() if path not in completed]
+        # drop whatever made it into the index for the failed files so they can be retried cleanly on the next scan
+        for task in failed_tasks:
+            builder.delete(doc_id(task.file_key, task.generation, seq)
+                           for seq in range(task.first_seq, seq_end[task.path]))
+        return failed_tasks
@@ -0,0 +1,77 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Collection, List, Optional
+
+from loguru.core.log_fields import normalize_severity, parse_timestamp
+from loguru.core.models.log_filter import LogFilter
+
+# severities spelled out in upper case, as they appear in logs
+_SEVERITY_NAME = re.compile(r'\b(TRACE|DEBUG|INFO|WARN|WARNING|ERROR|SEVERE|FATAL|CRITICAL)S?\b')
+# severities in plain English, only where they clearly ask for a kind of entry ("list the errors", "warning logs")
+_SEVERITY_WORD = re.compile(r'\b(?:(error|warning)s|(error|warning)\s+(?:logs?|entries|messages|lines))\b',
+                            re.IGNORECASE)
+_RELATIVE_TIME = re.compile(r'\b(?:last|past|previous)\s+(?:(\d+|an?|one)\s+)?(second|minute|hour|day|week)s?\b',
+                            re.IGNORECASE)
+_SINCE = re.compile(r'\b(?:since|after)\s+(\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?)', re.IGNORECASE)
+_TODAY = re.compile(r'\btoday\b', re.IGNORECASE)
+_YESTERDAY = re.compile(r'\byesterday\b', re.IGNORECASE)
+_UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+# directory names too common to tell a scan location by
+_GENERIC_DIR_NAMES = {'log', 'logs', 'var', 'tmp', 'data', 'app', 'apps', 'home', 'opt', 'srv', 'service', 'services'}
+
+
+def filter_from_question(question: str, now: Optional[int] = None, scan_locations: Collection[str] = ()) -> LogFilter:
+    """
+    Infers a log filter from a question, e.g. "What ERRORs happened in the last hour?" gives severity ERROR and a time
+    range starting one hour before `now`.
+
+    :param now: current time in milliseconds since the epoch, defaults to the system time
+    :param scan_locations: scan locations the question may be about, by path or directory name. Ex: "payment errors"
+        is about /var/log/payment
+    """
+    now = now if now is not None else int(time.time() * 1000)
+    severities = []
+    for m in _SEVERITY_NAME.finditer(question):
+        severities.append(normalize_severity(m.group(1)))
+    for m in _SEVERITY_WORD.finditer(question):
+        word = (m.group(1) or m.group(2)).lower()
+        severities.extend(['ERROR', 'FATAL'] if word == 'error' else ['WARN'])
+
+    since, until = None, None
+    relative = _RELATIVE_TIME.search(question)
+    if relative is not None:
+        amount = relative.group(1)
+        amount = int(amount) if amount is not None and amount.isdigit() else 1
+        since = now - amount * _UNIT_SECONDS[relative.group(2).lower()] * 1000
+    elif _SINCE.search(question):
+        since = parse_timestamp(_with_time(_SINCE.search(question).group(1)))
+    elif _TODAY.search(question) or _YESTERDAY.search(question):
+        midnight = datetime.fromtimestamp(now / 1000).replace(hour=0, minute=0, second=0, microsecond=0)
+        if _TODAY.search(question):
+            since = int(midnight.timestamp() * 1000)
+        else:
+            since = int((midnight - timedelta(days=1)).timestamp() * 1000)
+            until = int(midnight.timestamp() * 1000) - 1
+    return LogFilter(severities=severities or None, since=since, until=until,
+                     locations=_mentioned_locations(question, scan_locations) or None)
+
+
+def _mentioned_locations(question: str, scan_locations: Collection[str]) -> List[str]:
+    mentioned = []
+    for location in scan_locations:
+        path = location.rstrip('/') or location
+        name = os.path.basename(path)
+        names = [path] + ([name] if len(name) >= 3 and name.lower() not in _GENERIC_DIR_NAMES else [])
+        if any(re.search(rf'(?<![\w/.-]){re.escape(n)}(?![\w/-])', question, re.IGNORECASE) for n in names):
+            mentioned.append(location)
+    return mentioned
+
+
+def _with_time(date_time: str) -> str:
+    if len(date_time) == len('2024-06-14'):
+        return f"{date_time}T00:00:00"
+    if len(date_time) == len('2024-06-14T11:05'):
+        return f"{date_time}:00"
+    return date_time
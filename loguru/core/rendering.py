@@ -0,0 +1,43 @@
+from typing import Callable
+
+CODE_FENCE = '```'
+
+
+def render_markdown(text: str) -> str:
+    import mdv
+    mdv.term_columns = 60
+    return mdv.main(text, c_theme=...)
+
+
+class MarkdownStreamPrinter:
+    """
+    Prints markdown streamed in arbitrary chunks, rendering it one block at a time: text is held back until the
+    paragraph, list, table or fenced code block it belongs to is complete, then rendered and printed right away.
+    """
+
+    def __init__(self, render: Callable[[str], str] = render_markdown):
+        self._render = render
+        self._buffer = ''
+
+    def write(self, text: str):
+        self._buffer += text
+        start = 0
+        while True:
+            end = self._buffer.find('\n\n', start)
+            if end == -1:
+                break
+            # blank lines inside a fenced code block do not end it
+            if self._buffer[:end].count(CODE_FENCE) % 2 == 0:
+                self._print(self._buffer[:end])
+                self._buffer = self._buffer[end + 2:]
+                start = 0
+            else:
+                start = end + 2
+
+    def close(self):
+        self._print(self._buffer)
+        self._buffer = ''
+
+    def _print(self, block: str):
+        if block.strip() != '':
+            print(self._render(block), flush=True)
@@ -0,0 +1,24 @@
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from loguru import HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE
+
+
+class CrossEncoderReranker:
+    """
+    Reorders retrieved log entries by the relevance a local cross-encoder model assigns to each (question, entry) pair.
+    Slower per entry than the retrievers, so only applied to a few dozen candidates.
+    """
+
+    def __init__(self, model_name: str):
+        # imported here, loading torch is only worth it when reranking is configured
+        from sentence_transformers import CrossEncoder
+        self._model = CrossEncoder(model_name, device=HUGGING_FACE_EMBEDDINGS_DEVICE_TYPE)
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        if len(documents) == 0:
+            return documents
+        scores = self._model.predict([(query, d.page_content) for d in documents], show_progress_bar=False)
+        return [documents[i] for i in np.argsort(-np.asarray(scores), kind='stable')]
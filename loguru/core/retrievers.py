@@ -0,0 +1,141 @@
+import os
+from typing import Callable, List, Optional, Sequence, Union
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from loguru.core.context_packing import dedupe, pack, split_into_batches, total_tokens
+from loguru.core.log_parser import expand_occurrences, log_entry_metadata
+from loguru.core.metrics import METRICS
+from loguru.core.models.log_filter import LogFilter
+from loguru.core.query_filters import filter_from_question
+from loguru.core.rerankers import CrossEncoderReranker
+from loguru.core.sharded_store import ShardedVectorStore
+from loguru.core.vector_store import LogVectorStore
+
+
+class TemplateExpandingRetriever(BaseRetriever):
+    """
+    Adds up to `max_occurrences` raw occurrences of every retrieved log template to the retrieved documents.
+    """
+    base_retriever: BaseRetriever
+    max_occurrences: int
+    pattern_for_path: Callable[[str], Optional[str]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.base_retriever.invoke(query, config={'callbacks': run_manager.get_child()})
+        expanded = []
+        for document in documents:
+            expanded.append(document)
+            if document.metadata.get('occurrences', 1) <= 1:
+                continue
+            log_file_path = os.path.join(document.metadata['log_dir'], document.metadata['file_name'])
+            pattern = self.pattern_for_path(log_file_path)
+            if pattern is None:
+                continue
+            for entry in expand_occurrences(document.metadata, pattern, self.max_occurrences):
+                expanded.append(Document(page_content=entry.text, metadata=log_entry_metadata(entry, log_file_path)))
+        return expanded
+
+
+class LogFilterRetriever(BaseRetriever):
+    """
+    Retrieves the `k` log entries most similar to the query. With `infer_filters`, severities, time ranges and
+    `scan_locations` mentioned in the query (e.g. "payment ERRORs in the last hour") restrict the search to the
+    matching entries before ranking. `on_progress` is told which entries are searched.
+    """
+    vectorstore: Union[LogVectorStore, ShardedVectorStore]
+    k: int
+    infer_filters: bool = True
+    scan_locations: List[str] = []
+    on_progress: Optional[Callable[[str], None]] = None
+
+    def _log_filter(self, query: str) -> Optional[LogFilter]:
+        log_filter = filter_from_question(query, scan_locations=self.scan_locations) if self.infer_filters else None
+        if log_filter is not None and not log_filter.is_empty() and self.on_progress is not None:
+            self.on_progress(f"Searching {log_filter.describe()} log entries...")
+        return log_filter
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=self.k, log_filter=self._log_filter(query))
+
+
+def reciprocal_rank_fusion(rankings: List[Sequence[int]], k: int = 60) -> List[int]:
+    """
+    Merges rankings of the same items by summing 1 / (k + rank) over the rankings each item appears in.
+
+    :return: the items, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+class HybridRetriever(LogFilterRetriever):
+    """
+    Runs a vector search and a BM25 keyword search, which finds the exact identifiers (error codes, request IDs, class
+    names) embeddings tend to miss, and merges both with reciprocal rank fusion. The top fused entries are optionally
+    reordered by a cross-encoder `reranker`.
+    """
+    vector_candidates: int
+    keyword_candidates: int
+    rrf_k: int = 60
+    reranker: Optional[CrossEncoderReranker] = None
+    rerank_candidates: int = 50
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        log_filter = self._log_filter(query)
+        with METRICS.timer('embed_query'):
+            embedding = self.vectorstore.embeddings.embed_query(query)
+        vector_positions, _ = self.vectorstore.search_positions(embedding, max(self.k, self.vector_candidates),
+                                                                log_filter)
+        keyword_positions, _ = self.vectorstore.keyword_search_positions(query, self.keyword_candidates, log_filter)
+        positions = reciprocal_rank_fusion([vector_positions.tolist(), keyword_positions.tolist()], k=self.rrf_k)
+        if self.reranker is None:
+            return [self.vectorstore.document(p) for p in positions[:self.k]]
+        candidates = [self.vectorstore.document(p) for p in positions[:max(self.k, self.rerank_candidates)]]
+        num_reranked = min(self.rerank_candidates, len(candidates))
+        with METRICS.timer('rerank'):
+            reranked = self.reranker.rerank(query, candidates[:num_reranked]) + candidates[num_reranked:]
+        return reranked[:self.k]
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Fits the retrieved log entries into a prompt budget of `max_tokens`: near-identical entries are collapsed into one,
+    the best ranked entries that fit are kept and they are put in chronological order.
+
+    When less than `map_reduce_below_coverage` of the entries' tokens fit and `summarize` is set, all entries are
+    instead split into up to `max_map_batches` budget-sized batches, `summarize` condenses each batch (in parallel)
+    into the facts relevant to the question, and the summaries are returned in place of the entries. `on_progress` is
+    told when entries are summarized.
+    """
+    base_retriever: BaseRetriever
+    max_tokens: int
+    dedupe: bool = True
+    summarize: Optional[Callable[[str, List[List[Document]]], List[str]]] = None
+    map_reduce_below_coverage: float = 0.5
+    max_map_batches: int = 8
+    on_progress: Optional[Callable[[str], None]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.base_retriever.invoke(query, config={'callbacks': run_manager.get_child()})
+        with METRICS.timer('context_packing'):
+            if self.dedupe:
+                documents = dedupe(documents)
+            packed, left_out = pack(documents, self.max_tokens)
+        if len(left_out) == 0 or self.summarize is None:
+            return packed
+        coverage = total_tokens(packed) / max(total_tokens(documents), 1)
+        if coverage >= self.map_reduce_below_coverage:
+            return packed
+
+        batches = split_into_batches(documents, self.max_tokens)[:self.max_map_batches]
+        if self.on_progress is not None:
+            self.on_progress(f"Summarizing {sum(len(b) for b in batches)} log entries in {len(batches)} batches...")
+        summaries = self.summarize(query, batches)
+        return pack([Document(page_content=summary, metadata={'summarized_entries': len(batch)})
+                     for summary, batch in zip(summaries, batches)], self.max_tokens)[0]
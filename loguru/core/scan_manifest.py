@@ -0,0 +1,300 @@
+import hashlib
+import os
+import uuid
+from typing import Dict, List, Mapping, Optional, Set
+
+from loguru.core.compression import (DECOMPRESSION_ERRORS, compression_of, decompressing_reader, detect_compression,
+                                     open_log_file)
+from loguru.core.models.manifest import FileEntry, LocationEntry, Manifest
+
+MANIFEST_FILE_NAME = 'manifest.json'
+HEAD_BYTES = 4096
+
+
+class FileChange:
+    NEW = 'new'
+    APPENDED = 'appended'
+    REPLACED = 'replaced'  # rotated, truncated or re-split with a different pattern
+    MOVED = 'moved'  # renamed by a rotation, `entry` is the entry of `old_path`
+    DELETED = 'deleted'
+
+    def __init__(self, kind: str, location: str, pattern: str, path: str, entry: Optional[FileEntry] = None,
+                 old_path: Optional[str] = None, stat: Optional[os.stat_result] = None):
+        """
+        :param stat: stat result of the file when the scan found it, taken before it is read
+        """
+        self.kind = kind
+        self.location = location
+        self.pattern = pattern
+        self.path = path
+        self.entry = entry
+        self.old_path = old_path
+        self.stat = stat
+
+    def __repr__(self):
+        if self.kind == FileChange.MOVED:
+            return f"FileChange({self.kind}, {self.old_path} -> {self.path})"
+        return f"FileChange({self.kind}, {self.path})"
+
+
+def file_key(path: str) -> str:
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+
+
+def _head_hash(path: str, head_len: int) -> str:
+    with open_log_file(path) as f:
+        return hashlib.sha1(f.read(head_len)).hexdigest()
+
+
+def _head(path: str, st: os.stat_result) -> tuple[int, str, Optional[str]]:
+    """
+    :return: length and hash of the head of the file at `path`, if it still is the file `st` was taken of, and its
+        compression. Nothing (the hash of no bytes) otherwise, the inode alone then recognizes the file. The head of an
+        archive is that of its decompressed bytes, so that a rotated log file is recognized once compressed
+    """
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_ino == st.st_ino:
+                compression = detect_compression(f)
+                if compression is None:
+                    head_len = min(st.st_size, HEAD_BYTES)
+                    return head_len, hashlib.sha1(f.read(head_len)).hexdigest(), None
+                with decompressing_reader(f, compression) as reader:
+                    head = reader.read(HEAD_BYTES)
+                return len(head), hashlib.sha1(head).hexdigest(), compression
+    except FileNotFoundError:
+        pass
+    return 0, hashlib.sha1(b'').hexdigest(), None
+
+
+def _is_same_file(path: str, st: os.stat_result, entry: FileEntry) -> bool:
+    """
+    :return: True if the file at `path` is the one `entry` was recorded for, possibly with bytes appended since, or
+        compressed since (e.g. app.log.1 to app.log.2.gz)
+    """
+    try:
+        compression = compression_of(path)
+    except FileNotFoundError:
+        return False
+    compressed_since = compression is not None and entry.compression is None
+    if entry.inode is not None:
+        # compressing a file writes a new one, only the head then recognizes it
+        if (st.st_ino, st.st_dev) != (entry.inode, entry.device) and not compressed_since:
+            return False
+    elif entry.head_len == 0:
+        # recorded without an inode (older manifests) and nothing to compare
+        return False
+    if compressed_since and entry.head_len == 0:
+        return False
+    if entry.compression is not None:
+        if st.st_size != entry.size:
+            return False
+    elif compression is None and st.st_size < entry.offset:
+        return False
+    try:
+        return _head_hash(path, entry.head_len) == entry.head_hash
+    except DECOMPRESSION_ERRORS:
+        return False
+
+
+class ScanManifest:
+    """
+    Persistent record of what has been indexed for every file of every scan location.
+
+    Comparing the recorded size, mtime, byte offset and head hash of a file against its current state tells whether it
+    is unchanged, has new bytes appended, or was rotated/truncated and needs to be re-indexed from scratch. A file
+    renamed by a rotation (e.g. app.log to app.log.1) is recognized by its inode and head hash and keeps its entries.
+
+    Compressed archives (.gz, .bz2, .xz, .zst) are not appended to: once indexed, they are never read again unless
+    replaced. A rotated file compressed since (app.log.1 to app.log.2.gz) is recognized by its decompressed head hash.
+    """
+
+    def __init__(self, manifest_file_path: str, manifest: Optional[Manifest] = None):
+        self._manifest_file_path = manifest_file_path
+        self._manifest = manifest if manifest is not None else Manifest(index_id=uuid.uuid4().hex)
+
+    @classmethod
+    def load(cls, manifest_file_path: str) -> 'ScanManifest':
+        with open(manifest_file_path, 'r') as f:
+            return cls(manifest_file_path, Manifest.model_validate_json(f.read()))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self._manifest_file_path), exist_ok=True)
+        tmp_path = f"{self._manifest_file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self._manifest.model_dump_json())
+        os.replace(tmp_path, self._manifest_file_path)
+
+    @property
+    def template_mining(self) -> bool:
+        return self._manifest.template_mining
+
+    @template_mining.setter
+    def template_mining(self, enabled: bool):
+        self._manifest.template_mining = enabled
+
+    @property
+    def index_version(self) -> str:
+        """
+        Identifies the contents of the index: changes whenever a scan changes the index or it is rebuilt.
+        """
+        return f"{self._manifest.index_id}:{self._manifest.index_generation}"
+
+    def bump_index_generation(self):
+        self._manifest.index_generation += 1
+
+    def indexed_files(self) -> Set[str]:
+        return {path for loc_entry in self._manifest.locations.values() for path in loc_entry.files}
+
+    def plan(self, scan_locations: Dict[str, tuple[str, Mapping[str, os.stat_result]]]) -> List[FileChange]:
+        """
+        Work out what needs to be (re-)indexed.
+
+        :param scan_locations: {location: (pattern, {path: stat result} of the log files currently in the location)}
+        :return: the changes to apply, unchanged files are left out
+        """
+        changes = []
+        for location in list(self._manifest.locations.keys()):
+            if location not in scan_locations:
+                loc_entry = self._manifest.locations[location]
+                for path, entry in loc_entry.files.items():
+                    changes.append(FileChange(FileChange.DELETED, location, loc_entry.pattern, path, entry))
+
+        for location, (pattern, paths) in scan_locations.items():
+            loc_entry = self._manifest.locations.get(location)
+            known_files = {} if loc_entry is None else loc_entry.files
+            pattern_changed = loc_entry is not None and loc_entry.pattern != pattern
+            seen = set()
+            location_changes = []
+            for path, st in paths.items():
+                seen.add(path)
+                entry = known_files.get(path)
+                if entry is None:
+                    location_changes.append(FileChange(FileChange.NEW, location, pattern, path, stat=st))
+                    continue
+                if pattern_changed:
+                    location_changes.append(FileChange(FileChange.REPLACED, location, pattern, path, entry, stat=st))
+                    continue
+                kind = self._classify(path, entry, st)
+                if kind is not None:
+                    location_changes.append(FileChange(kind, location, pattern, path, entry, stat=st))
+            for path, entry in known_files.items():
+                if path not in seen:
+                    location_changes.append(FileChange(FileChange.DELETED, location, pattern, path, entry))
+            # files re-split with another pattern are re-indexed from scratch even if they were moved
+            changes.extend(location_changes if pattern_changed else self._detect_moves(location_changes, paths))
+        return changes
+
+    def _detect_moves(self, changes: List[FileChange], paths: Mapping[str, os.stat_result]) -> List[FileChange]:
+        """
+        Turns the files indexed before under another path, since deleted or replaced, into moves (e.g. app.log renamed
+        to app.log.1 by a rotation, and app.log.1 to app.log.2). A new file at the old path is indexed from scratch.
+        """
+        gone = {c.path: c.entry for c in changes if c.kind in (FileChange.DELETED, FileChange.REPLACED)}
+        if len(gone) == 0:
+            return changes
+        entries = dict(gone)
+        moves = {}
+        for change in changes:
+            if change.kind not in (FileChange.NEW, FileChange.REPLACED):
+                continue
+            source = next((path for path, entry in gone.items()
+                           if path != change.path and _is_same_file(change.path, paths[change.path], entry)), None)
+            if source is not None:
+                moves[change.path] = source
+                del gone[source]
+        if len(moves) == 0:
+            return changes
+
+        sources = set(moves.values())
+        result = []
+        for change in changes:
+            if change.path in moves:
+                source = moves[change.path]
+                result.append(FileChange(FileChange.MOVED, change.location, change.pattern, change.path,
+                                         entries[source], old_path=source, stat=change.stat))
+                if change.kind == FileChange.REPLACED and change.path not in sources:
+                    # the file that was here is gone, its entries are stale
+                    result.append(FileChange(FileChange.DELETED, change.location, change.pattern, change.path,
+                                             change.entry))
+            elif change.path in sources:
+                # the entries moved along, a file now at the old path is new
+                if change.kind == FileChange.REPLACED:
+                    result.append(FileChange(FileChange.NEW, change.location, change.pattern, change.path,
+                                             stat=change.stat))
+            else:
+                result.append(change)
+        return result
+
+    # noinspection PyMethodMayBeStatic
+    def _classify(self, path: str, entry: FileEntry, st: os.stat_result) -> Optional[str]:
+        if entry.inode is not None and (st.st_ino, st.st_dev) != (entry.inode, entry.device):
+            return FileChange.REPLACED
+        if entry.compression is not None:
+            # archives are indexed once, their mtime may still be touched (e.g. by copies or backups)
+            return None if st.st_size == entry.size else FileChange.REPLACED
+        if st.st_size == entry.size and st.st_mtime_ns == entry.mtime_ns:
+            return None
+        if st.st_size < entry.offset:
+            return FileChange.REPLACED
+        try:
+            if _head_hash(path, entry.head_len) != entry.head_hash:
+                return FileChange.REPLACED
+        except FileNotFoundError:
+            return FileChange.DELETED
+        return FileChange.APPENDED
+
+    def record(self, change: FileChange, offset: int, generation: int, num_entries: int) -> FileEntry:
+        # the file may grow or be rotated while it is read: what is recorded is the state it was read from, so that
+        # the next scan picks up the rest
+        st = change.stat if change.stat is not None else os.stat(change.path)
+        head_len, head_hash, compression = _head(change.path, st)
+        entry = FileEntry(
+            # moved files keep the key their entries were indexed under
+            file_key=change.entry.file_key if change.kind == FileChange.MOVED else file_key(change.path),
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            offset=offset,
+            head_len=head_len,
+            head_hash=head_hash,
+            generation=generation,
+            num_entries=num_entries,
+            inode=st.st_ino,
+            device=st.st_dev,
+            compression=compression
+        )
+        loc_entry = self._manifest.locations.get(change.location)
+        if loc_entry is None or loc_entry.pattern != change.pattern:
+            files = {} if loc_entry is None else loc_entry.files
+            loc_entry = LocationEntry(pattern=change.pattern, files=files)
+            self._manifest.locations[change.location] = loc_entry
+        loc_entry.files[change.path] = entry
+        return entry
+
+    def move(self, changes: List[FileChange]):
+        """
+        Records the entries of moved files under their new paths.
+        """
+        for change in changes:
+            loc_entry = self._manifest.locations.get(change.location)
+            if loc_entry is not None:
+                loc_entry.files.pop(change.old_path, None)
+        for change in changes:
+            loc_entry = self._manifest.locations.setdefault(change.location, LocationEntry(pattern=change.pattern))
+            loc_entry.files[change.path] = change.entry
+
+    def next_generation(self, key: str) -> int:
+        """
+        :return: generation for a file (re-)indexed from scratch under `key`, newer than that of any file indexed under
+            it, moved ones included, so that their document IDs never collide
+        """
+        return max((entry.generation + 1 for loc_entry in self._manifest.locations.values()
+                    for entry in loc_entry.files.values() if entry.file_key == key), default=0)
+
+    def forget(self, change: FileChange):
+        loc_entry = self._manifest.locations.get(change.location)
+        if loc_entry is None:
+            return
+        loc_entry.files.pop(change.path, None)
+        if len(loc_entry.files) == 0:
+            del self._manifest.locations[change.location]
@@ -0,0 +1,166 @@
+import fnmatch
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Collection, Dict, List, NamedTuple, Optional
+
+from loguru.core.models.catalog import Catalog, RetiredShard, ShardEntry
+from loguru.core.models.log_filter import LogFilter
+
+CATALOG_FILE_NAME = 'catalog.json'
+SHARDS_DIR_NAME = 'shards'
+CATALOG_VERSION = 1
+UNDATED_BUCKET = 'undated'
+# a reader opens the shards of the catalog it loaded while it searches, so for a moment after the catalog is replaced
+RETIRED_SHARD_GRACE_SECONDS = 60.0
+
+
+class ShardKey(NamedTuple):
+    source: str
+    location: str
+    bucket: str
+
+
+def shard_key(entry: ShardEntry) -> ShardKey:
+    return ShardKey(source=entry.source, location=entry.location, bucket=entry.bucket)
+
+
+def time_bucket(timestamp: Optional[int], span: str) -> str:
+    """
+    :param timestamp: time of a log entry, in milliseconds since the epoch
+    :param span: hour, day, week or none
+    :return: the time bucket of the shards the log entry goes to. Buckets are in UTC, so that they do not move with
+        the time zone
+    """
+    if span == 'none':
+        return 'all'
+    if timestamp is None:
+        return UNDATED_BUCKET
+    try:
+        t = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return UNDATED_BUCKET
+    if span == 'hour':
+        return t.strftime('%Y-%m-%dT%H')
+    if span == 'week':
+        year, week, _ = t.isocalendar()
+        return f"{year}-W{week:02d}"
+    return t.strftime('%Y-%m-%d')
+
+
+def _may_match(entry: ShardEntry, log_filter: LogFilter) -> bool:
+    if log_filter.locations and not any(entry.location == p or fnmatch.fnmatch(entry.location, p)
+                                        for p in log_filter.locations):
+        return False
+    if log_filter.severities and set(log_filter.severities).isdisjoint(entry.severities):
+        return False
+    if log_filter.since is not None or log_filter.until is not None:
+        # entries without a timestamp never match a time range
+        if entry.min_timestamp is None:
+            return False
+        if log_filter.since is not None and entry.max_timestamp < log_filter.since:
+            return False
+        if log_filter.until is not None and entry.min_timestamp > log_filter.until:
+            return False
+    return True
+
+
+class ShardCatalog:
+    """
+    Catalog of the shards the index is partitioned into, by data source, scan location and time bucket of the log
+    entries, with what each shard holds: its time range, severities and log files.
+
+    Shards are immutable: new log entries are written to new shards, shards are merged, or rewritten without deleted
+    entries, into new shards, and log files moved since a shard was written are recorded here and relabelled when it
+    is opened. The catalog file is replaced atomically, so readers see the shards either from before or from after a
+    scan. Replaced shards are removed `RETIRED_SHARD_GRACE_SECONDS` later, readers still searching them are not
+    disturbed.
+    """
+
+    def __init__(self, directory: str, catalog: Optional[Catalog] = None):
+        self.directory = directory
+        self._catalog = catalog if catalog is not None else Catalog(version=CATALOG_VERSION,
+                                                                    catalog_id=uuid.uuid4().hex)
+
+    @classmethod
+    def load(cls, directory: str) -> 'ShardCatalog':
+        with open(os.path.join(directory, CATALOG_FILE_NAME), 'r') as f:
+            return cls(directory, Catalog.model_validate_json(f.read()))
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        try:
+            with open(os.path.join(directory, CATALOG_FILE_NAME), 'r') as f:
+                return json.load(f).get('version') == CATALOG_VERSION
+        except FileNotFoundError:
+            return False
+
+    def save(self):
+        """
+        Publishes the catalog, then removes the shards retired more than `RETIRED_SHARD_GRACE_SECONDS` ago and any
+        left behind by an interrupted scan.
+        """
+        now = time.time()
+        self._catalog.retired = [r for r in self._catalog.retired
+                                 if now - r.retired_at < RETIRED_SHARD_GRACE_SECONDS]
+        os.makedirs(self.directory, exist_ok=True)
+        catalog_file_path = os.path.join(self.directory, CATALOG_FILE_NAME)
+        with open(f"{catalog_file_path}.tmp", 'w') as f:
+            f.write(self._catalog.model_dump_json())
+        os.replace(f"{catalog_file_path}.tmp", catalog_file_path)
+
+        shards_directory = os.path.join(self.directory, SHARDS_DIR_NAME)
+        if not os.path.exists(shards_directory):
+            return
+        in_use = {e.shard_id for e in self._catalog.shards} | {r.shard_id for r in self._catalog.retired}
+        for name in os.listdir(shards_directory):
+            if name not in in_use:
+                shutil.rmtree(os.path.join(shards_directory, name), ignore_errors=True)
+
+    @property
+    def catalog_id(self) -> str:
+        return self._catalog.catalog_id
+
+    @property
+    def shards(self) -> List[ShardEntry]:
+        """
+        The shards, grouped by data source and scan location and in time order within each.
+        """
+        return list(self._catalog.shards)
+
+    def shard_directory(self, shard_id: str) -> str:
+        return os.path.join(self.directory, SHARDS_DIR_NAME, shard_id)
+
+    def new_shard_id(self) -> str:
+        shard_id = f"shard-{self._catalog.next_shard:06d}"
+        self._catalog.next_shard += 1
+        return shard_id
+
+    def add(self, entry: ShardEntry):
+        self._catalog.shards.append(entry)
+        self._catalog.shards.sort(key=lambda e: (e.source, e.location, e.bucket, e.shard_id))
+
+    def retire(self, shard_ids: Collection[str]):
+        retired_at = time.time()
+        self._catalog.shards = [e for e in self._catalog.shards if e.shard_id not in shard_ids]
+        self._catalog.retired.extend(RetiredShard(shard_id=shard_id, retired_at=retired_at) for shard_id in shard_ids)
+
+    def rename_files(self, shard_id: str, renames: Dict[str, str]):
+        """
+        Records log files of a shard that were moved (old path -> new path), relabelled when the shard is opened.
+        """
+        for entry in self._catalog.shards:
+            if entry.shard_id == shard_id:
+                entry.renames.append(dict(renames))
+
+    def select(self, log_filter: Optional[LogFilter] = None) -> List[ShardEntry]:
+        """
+        :return: the shards that may hold log entries matching `log_filter`, judging by their scan location, time
+            range and severities
+        """
+        if log_filter is None or log_filter.is_empty():
+            return self.shards
+        return [entry for entry in self._catalog.shards if _may_match(entry, log_filter)]
@@ -0,0 +1,161 @@
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from loguru.core.ann_index import apply_search_params
+from loguru.core.lexical_index import merge_corpus_stats
+from loguru.core.metrics import METRICS
+from loguru.core.models.catalog import ShardEntry
+from loguru.core.models.config import VectorIndex
+from loguru.core.models.log_filter import LogFilter
+from loguru.core.shard_catalog import ShardCatalog
+from loguru.core.vector_store import LogVectorStore
+
+
+def open_shard(catalog: ShardCatalog, entry: ShardEntry, embeddings: Embeddings, mmap: bool = True) -> LogVectorStore:
+    """
+    Opens a shard, with the log files moved since it was written relabelled.
+    """
+    vectorstore = LogVectorStore.load_local(catalog.shard_directory(entry.shard_id), embeddings, mmap=mmap)
+    for renames in entry.renames:
+        vectorstore.docstore.rename_files(renames)
+    return vectorstore
+
+
+def _top_k(results: List[Tuple[np.ndarray, np.ndarray]], k: int,
+           smallest: bool) -> Tuple[np.ndarray, np.ndarray]:
+    if len(results) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    positions = np.concatenate([positions for positions, _ in results]).astype(np.int64)
+    scores = np.concatenate([scores for _, scores in results])
+    order = np.argsort(scores if smallest else -scores, kind='stable')[:k]
+    return positions[order], scores[order]
+
+
+class ShardedVectorStore:
+    """
+    Searches the shards listed in a `ShardCatalog` as one vector store.
+
+    A search only goes to the shards whose scan location, time range and severities can match its log filter. They are
+    searched in parallel on `executor` and their top-k merged: by distance for vector searches, and by BM25 score
+    computed with the statistics of all the searched shards together for keyword searches, so that scores compare.
+    Shards are opened (memory-mapped) on first use. Being immutable, the open shards are handed on to the store of the
+    next catalog version, so a scan that adds a shard costs readers one more shard to open instead of a reload.
+
+    Positions are numbered across the shards in catalog order, they are only valid for the store that returned them.
+    """
+
+    def __init__(self, catalog: ShardCatalog, embeddings: Embeddings, vector_index: VectorIndex,
+                 executor: Optional[Executor] = None):
+        self._catalog = catalog
+        self.embeddings = embeddings
+        self._vector_index = vector_index
+        self._executor = executor
+        self._entries = catalog.shards
+        self._ordinals = {entry.shard_id: ordinal for ordinal, entry in enumerate(self._entries)}
+        self._offsets = np.cumsum([0] + [entry.num_entries for entry in self._entries], dtype=np.int64)
+        # shard id -> number of renames applied and the open shard
+        self._open_shards: Dict[str, Tuple[int, LogVectorStore]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings: Embeddings, vector_index: VectorIndex,
+                   executor: Optional[Executor] = None,
+                   previous: Optional['ShardedVectorStore'] = None) -> 'ShardedVectorStore':
+        """
+        :param previous: store of an earlier version of the catalog, whose open shards are reused
+        """
+        store = cls(ShardCatalog.load(folder_path), embeddings, vector_index, executor=executor)
+        if previous is not None and previous._catalog.catalog_id == store._catalog.catalog_id:
+            with previous._lock:
+                store._open_shards = {shard_id: opened for shard_id, opened in previous._open_shards.items()
+                                      if shard_id in store._ordinals}
+        return store
+
+    @staticmethod
+    def exists(folder_path: str) -> bool:
+        return ShardCatalog.exists(folder_path)
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def shards(self, log_filter: Optional[LogFilter] = None) -> List[ShardEntry]:
+        """
+        :return: the shards that may hold log entries matching `log_filter`
+        """
+        return self._catalog.select(log_filter)
+
+    def shard(self, entry: ShardEntry) -> LogVectorStore:
+        with self._lock:
+            opened = self._open_shards.get(entry.shard_id)
+        if opened is not None and opened[0] == len(entry.renames):
+            return opened[1]
+        with METRICS.timer('shard_open'):
+            vectorstore = open_shard(self._catalog, entry, self.embeddings)
+        apply_search_params(vectorstore.index, self._vector_index)
+        with self._lock:
+            self._open_shards[entry.shard_id] = (len(entry.renames), vectorstore)
+        return vectorstore
+
+    def preload(self):
+        """
+        Opens all the shards, so that the first searches do not wait for them.
+        """
+        self._map(self.shard, self._entries)
+
+    def _map(self, fn: Callable[[ShardEntry], Any], entries: List[ShardEntry]) -> list:
+        if self._executor is None or len(entries) <= 1:
+            return [fn(entry) for entry in entries]
+        return list(self._executor.map(fn, entries))
+
+    def _offset(self, entry: ShardEntry) -> int:
+        return int(self._offsets[self._ordinals[entry.shard_id]])
+
+    def search_positions(self, embedding: List[float], k: int,
+                         log_filter: Optional[LogFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: positions of the (up to) `k` entries nearest to `embedding` among those matching `log_filter`, and
+            their distances
+        """
+        def _search(entry: ShardEntry) -> Tuple[np.ndarray, np.ndarray]:
+            positions, scores = self.shard(entry).search_positions(embedding, k, log_filter=log_filter)
+            return positions + self._offset(entry), scores
+
+        with METRICS.timer('vector_search'):
+            entries = self.shards(log_filter)
+            METRICS.observe('shards_searched', len(entries))
+            return _top_k(self._map(_search, entries), k, smallest=True)
+
+    def keyword_search_positions(self, query: str, k: int,
+                                 log_filter: Optional[LogFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks the entries matching `log_filter` by the BM25 score of their text for `query`.
+
+        :return: positions of the (up to) `k` best scoring entries and their scores
+        """
+        def _search(entry: ShardEntry) -> Tuple[np.ndarray, np.ndarray]:
+            positions, scores = self.shard(entry).keyword_search_positions(query, k, log_filter=log_filter,
+                                                                           corpus_stats=corpus_stats)
+            return positions + self._offset(entry), scores
+
+        with METRICS.timer('keyword_search'):
+            entries = self.shards(log_filter)
+            corpus_stats = merge_corpus_stats(self._map(lambda entry: self.shard(entry).corpus_stats(query), entries))
+            return _top_k(self._map(_search, entries), k, smallest=False)
+
+    def similarity_search(self, query: str, k: int = 4, log_filter: Optional[LogFilter] = None,
+                          **kwargs: Any) -> List[Document]:
+        with METRICS.timer('embed_query'):
+            embedding = self.embeddings.embed_query(query)
+        positions, _ = self.search_positions(embedding, k, log_filter=log_filter)
+        return [self.document(int(position)) for position in positions]
+
+    def document(self, position: int) -> Document:
+        ordinal = int(np.searchsorted(self._offsets, position, side='right')) - 1
+        if ordinal < 0 or ordinal >= len(self._entries):
+            raise IndexError(f"Position {position} out of range")
+        return self.shard(self._entries[ordinal]).docstore.document(position - int(self._offsets[ordinal]))
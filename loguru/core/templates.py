@@ -0,0 +1,162 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from loguru.core.models.config import TemplateMining
+
+WILDCARD = '<*>'
+MAX_TOKENS = 100
+
+# tokens that are almost always variables: numbers, durations/sizes, hex values, IPs, UUIDs
+_VARIABLE_TOKEN = re.compile(
+    r'^[\[(\'"]?(?:'
+    r'[+-]?\d+(?:[.:,/-]\d+)*[a-zA-Z%]*'
+    r'|0x[0-9a-fA-F]+'
+    r'|[0-9a-fA-F]{8,}'
+    r'|[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}'
+    r')[\])\'",;:]?$'
+)
+_HAS_DIGIT = re.compile(r'\d')
+
+
+def _mask(token: str) -> str:
+    return WILDCARD if _VARIABLE_TOKEN.match(token) else token
+
+
+def mask_variables(text: str) -> str:
+    """
+    Replaces the tokens of `text` that look like variables with `WILDCARD`, so entries that only differ in IDs, numbers
+    or timestamps mask to the same text.
+    """
+    return ' '.join(_mask(token) for token in text.split())
+
+
+class LogCluster:
+    __slots__ = ('template', 'representative', 'count', 'first_offset', 'first_timestamp', 'last_timestamp',
+                 'offsets', 'samples')
+
+    def __init__(self, template: List[str], representative: str, offset: int, timestamp: Optional[str]):
+        self.template = template
+        self.representative = representative
+        self.count = 0
+        self.first_offset = offset
+        self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.offsets: List[int] = []
+        self.samples: List[List[str]] = []
+
+    def template_text(self) -> str:
+        return ' '.join(self.template)
+
+
+class TemplateMiner:
+    """
+    Drain-style online log template miner.
+
+    Entries are tokenized on whitespace with obvious variables (numbers, hex, UUIDs...) masked, routed through a fixed
+    depth prefix tree keyed by token count and leading tokens, and merged into the most similar cluster of the leaf if
+    the share of matching tokens reaches `similarity_threshold`. Positions that differ between merged entries become
+    wildcards in the cluster template.
+
+    See: P. He, J. Zhu, Z. Zheng and M. R. Lyu, "Drain: An Online Log Parsing Approach with Fixed Depth Tree",
+    ICWS 2017.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.5, depth: int = 4, max_offsets: int = 100,
+                 max_samples: int = 5):
+        self._similarity_threshold = similarity_threshold
+        self._prefix_len = max(1, depth - 2)
+        self._max_offsets = max_offsets
+        self._max_samples = max_samples
+        self._tree: Dict[Tuple, List[LogCluster]] = {}
+        self._num_clusters = 0
+
+    @property
+    def num_clusters(self) -> int:
+        return self._num_clusters
+
+    def add(self, text: str, offset: int, timestamp: Optional[str] = None) -> LogCluster:
+        """
+        :param text: log entry, without its timestamp
+        :param offset: byte offset of the entry in the log file
+        :param timestamp: timestamp of the entry, if known
+        """
+        tokens = text.split()[:MAX_TOKENS]
+        masked = [_mask(t) for t in tokens]
+        prefix = tuple(WILDCARD if _HAS_DIGIT.search(t) else t for t in masked[:self._prefix_len])
+        leaf = self._tree.setdefault((len(masked), prefix), [])
+
+        cluster = self._best_match(leaf, masked)
+        if cluster is None:
+            cluster = LogCluster(template=masked, representative=text, offset=offset, timestamp=timestamp)
+            leaf.append(cluster)
+            self._num_clusters += 1
+        else:
+            cluster.template = [t if t == m else WILDCARD for t, m in zip(cluster.template, masked)]
+            if timestamp is not None:
+                cluster.first_timestamp = cluster.first_timestamp or timestamp
+                cluster.last_timestamp = timestamp
+
+        cluster.count += 1
+        if len(cluster.offsets) < self._max_offsets:
+            cluster.offsets.append(offset)
+        if len(cluster.samples) < self._max_samples:
+            values = [tok for tok, t in zip(tokens, cluster.template) if t == WILDCARD]
+            if len(values) > 0 and values not in cluster.samples:
+                cluster.samples.append(values)
+        return cluster
+
+    def _best_match(self, leaf: List[LogCluster], masked: List[str]) -> Optional[LogCluster]:
+        best, best_similarity = None, -1.0
+        for cluster in leaf:
+            if len(masked) == 0:
+                return cluster
+            same = sum(1 for t, m in zip(cluster.template, masked) if t == m and t != WILDCARD)
+            wildcards = sum(1 for t in cluster.template if t == WILDCARD)
+            similarity = (same + wildcards) / len(masked)
+            if similarity > best_similarity:
+                best, best_similarity = cluster, similarity
+        if best is not None and best_similarity >= self._similarity_threshold:
+            return best
+        return None
+
+    def clusters(self) -> List[LogCluster]:
+        return [c for leaf in self._tree.values() for c in leaf]
+
+    def reset(self):
+        self._tree = {}
+        self._num_clusters = 0
+
+
+def cluster_to_text(cluster: LogCluster) -> str:
+    text = cluster.representative
+    if cluster.first_timestamp is not None:
+        text = f"{cluster.first_timestamp} {text}"
+    if cluster.count > 1:
+        span = ''
+        if cluster.first_timestamp is not None:
+            span = f" between {cluster.first_timestamp} and {cluster.last_timestamp}"
+        text += f"\n[similar entry repeated {cluster.count} times{span}, template: {cluster.template_text()}]"
+    return text
+
+
+def cluster_metadata(cluster: LogCluster) -> dict:
+    return {
+        'offset': cluster.first_offset,
+        'template': cluster.template_text(),
+        'occurrences': cluster.count,
+        'first_timestamp': cluster.first_timestamp,
+        'last_timestamp': cluster.last_timestamp,
+        'occurrence_offsets': list(cluster.offsets),
+        'sample_values': [list(s) for s in cluster.samples]
+    }
+
+
+def miner_from_config(template_mining: TemplateMining) -> Optional[TemplateMiner]:
+    if not template_mining.enabled:
+        return None
+    return TemplateMiner(
+        similarity_threshold=template_mining.similarity_threshold,
+        depth=template_mining.tree_depth,
+        max_offsets=template_mining.max_occurrence_offsets,
+        max_samples=template_mining.max_sample_values
+    )
@@ -1,7 +1,15 @@
+import re
+import sys
+
 from langchain_core.pydantic_v1 import BaseModel, Field
 from prettytable import PrettyTable
 
+from loguru.core.fs_log_rag import LoguruRAG
+from loguru.core.log_fields import normalize_severity
+from loguru.core.log_search import PAGE_SIZE, glob_to_regex, print_paginated
 from loguru.core.models.config import Config
+from loguru.core.models.log_filter import LogFilter
+from loguru.core.query_filters import filter_from_question
 
 
 def print_dict(dict_to_print: dict, column_names=None):
@@ -22,3 +30,19 @@ class LogSearchTool(BaseModel):
     def run(self, config: dict, user_query: str):
         config = Config(**config)
         print(f"Finding logs with severity: {self.severity}, pattern: {self.pattern}. User query: {user_query}")
+        # time ranges come from the query, the severity picked by the model takes precedence over the one in the query
+        log_filter = filter_from_question(user_query, scan_locations=[sl.location for ds in config.data_sources
+                                                                      for sl in ds.ds_params.scan_locations])
+        if self.severity is not None:
+            # the model may name several levels (e.g. ERROR,WARN) or ones no log uses, which are left out
+            severities = [s for s in re.split(r'[,|]', self.severity) if normalize_severity(s) is not None]
+            if self.severity.strip().upper() == 'ALL' or len(severities) > 0:
+                log_filter = LogFilter(**{**log_filter.model_dump(), 'severities': severities or None})
+        rag = LoguruRAG(config=config)
+        rag.scan()
+        if self.pattern is not None and self.pattern.strip('* ') != '':
+            documents = rag.grep(glob_to_regex(self.pattern), regex=True, ignore_case=True, log_filter=log_filter)
+        else:
+            documents = rag.search(user_query, log_filter=log_filter)
+        if print_paginated(documents, PAGE_SIZE, interactive=sys.stdout.isatty()) == 0:
+            print("No matching log entries found.")
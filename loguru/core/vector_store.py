@@ -0,0 +1,174 @@
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from loguru.core.ann_index import is_flat, remove_positions, search_parameters
+from loguru.core.docstore import FORMAT_VERSION, ColumnarDocstore, PositionIds, saved_format_version
+from loguru.core.lexical_index import CorpusStats, tokenize
+from loguru.core.metadata_index import bitmap_count, to_mask
+from loguru.core.models.log_filter import LogFilter
+
+INDEX_FILE_NAME = 'index.faiss'
+DOCSTORE_DIR_NAME = 'docstore'
+
+
+class LogVectorStore(FAISS):
+    """
+    FAISS vector store backed by a `ColumnarDocstore` instead of a pickled in-memory docstore.
+
+    Docstore rows are kept aligned with the index positions, so a search maps the top-k positions straight to rows and
+    materializes only those as `Document`s. `load_local` memory-maps both the docstore and (where FAISS supports it)
+    the index, which makes opening even a large index near-instant. Memory-mapped indexes are read-only, load with
+    `mmap=False` to update one.
+
+    Searches accept a `log_filter` (e.g. severity and time range), resolved against the docstore's metadata index and
+    applied inside the FAISS search, so only matching entries are ranked. `keyword_search_positions` ranks entries by
+    BM25 over the docstore's lexical index instead.
+    """
+
+    def __init__(self, embedding_function: Embeddings, index: Any, docstore: ColumnarDocstore,
+                 read_only: bool = False):
+        super().__init__(embedding_function, index, docstore, PositionIds(docstore))
+        self.read_only = read_only
+
+    @classmethod
+    def from_embeddings(cls, text_embeddings: Iterable[Tuple[str, List[float]]], embedding: Embeddings,
+                        metadatas: Optional[Iterable[dict]] = None, ids: Optional[List[str]] = None,
+                        **kwargs: Any) -> 'LogVectorStore':
+        text_embeddings = list(text_embeddings)
+        vectorstore = cls(embedding, faiss.IndexFlatL2(len(text_embeddings[0][1])), ColumnarDocstore())
+        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return vectorstore
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self._embed_documents(texts)), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]], metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        if self.read_only:
+            raise ValueError("Cannot add to a memory-mapped vector store, load it with mmap=False")
+        texts, embeddings = zip(*text_embeddings)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        self.index.add(np.array(embeddings, dtype=np.float32))
+        self.docstore.append(ids, list(texts), metadatas)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Deletes by id. Unlike `FAISS.delete`, ids that are not in the store are ignored.
+
+        :return: True if anything was deleted
+        """
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        if self.read_only:
+            raise ValueError("Cannot delete from a memory-mapped vector store, load it with mmap=False")
+        positions = self.docstore.positions(ids)
+        if len(positions) == 0:
+            return False
+        if is_flat(self.index):
+            self.index.remove_ids(np.array(positions, dtype=np.int64))
+        else:
+            # IVF and HNSW indexes do not compact positions on remove_ids the way the docstore expects
+            self.index = remove_positions(self.index, positions)
+        self.docstore.delete_positions(positions)
+        return True
+
+    def _filter_bitmap(self, log_filter: Optional[LogFilter]) -> Optional[np.ndarray]:
+        if log_filter is None or log_filter.is_empty():
+            return None
+        return self.docstore.select(log_filter)
+
+    def search_positions(self, embedding: List[float], k: int,
+                         log_filter: Optional[LogFilter] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: positions of the (up to) `k` entries nearest to `embedding` among those matching `log_filter`, and
+            their distances
+        """
+        query = np.array([embedding], dtype=np.float32)
+        bitmap = self._filter_bitmap(log_filter)
+        if bitmap is None:
+            scores, positions = self.index.search(query, k)
+        elif bitmap_count(bitmap) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        else:
+            # FAISS only keeps pointers, the bitmap and selector have to stay referenced until the search is done
+            selector = faiss.IDSelectorBitmap(len(self.docstore), faiss.swig_ptr(bitmap))
+            scores, positions = self.index.search(query, k, params=search_parameters(self.index, selector))
+        found = positions[0] != -1
+        return positions[0][found], scores[0][found]
+
+    def keyword_search_positions(self, query: str, k: int, log_filter: Optional[LogFilter] = None,
+                                 corpus_stats: Optional[CorpusStats] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks the entries matching `log_filter` by the BM25 score of their text for `query`. Needs a saved docstore,
+        nothing is found while entries are added or deleted.
+
+        :param corpus_stats: BM25 statistics of all the stores searched for `query`, those of this store if not set
+        :return: positions of the (up to) `k` best scoring entries and their scores
+        """
+        lexical_index = self.docstore.lexical_index()
+        if lexical_index is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        bitmap = self._filter_bitmap(log_filter)
+        mask = to_mask(bitmap, len(self.docstore)) if bitmap is not None else None
+        return lexical_index.bm25(tokenize(query), k, mask=mask, corpus_stats=corpus_stats)
+
+    def corpus_stats(self, query: str) -> Optional[CorpusStats]:
+        """
+        :return: the BM25 statistics of this store for `query`, None if there is no lexical index to search
+        """
+        lexical_index = self.docstore.lexical_index()
+        return lexical_index.corpus_stats(tokenize(query)) if lexical_index is not None else None
+
+    def document(self, position: int) -> Document:
+        return self.docstore.document(position)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+                                               fetch_k: int = 20, log_filter: Optional[LogFilter] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        positions, scores = self.search_positions(embedding, k if filter is None else fetch_k, log_filter=log_filter)
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        docs = []
+        for score, position in zip(scores, positions):
+            if filter_func is not None and not filter_func(self.docstore.metadata_at(int(position))):
+                continue
+            docs.append((self.docstore.document(int(position)), score))
+
+        score_threshold = kwargs.get('score_threshold')
+        if score_threshold is not None:
+            docs = [(doc, score) for doc, score in docs if score <= score_threshold]
+        return docs[:k]
+
+    def save_local(self, folder_path: str, index_name: str = 'index') -> None:
+        os.makedirs(folder_path, exist_ok=True)
+        self.docstore.save(os.path.join(folder_path, DOCSTORE_DIR_NAME))
+        index_file_path = os.path.join(folder_path, f"{index_name}.faiss")
+        faiss.write_index(self.index, index_file_path + '.tmp')
+        os.replace(index_file_path + '.tmp', index_file_path)
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings: Embeddings, index_name: str = 'index', mmap: bool = True,
+                   **kwargs: Any) -> 'LogVectorStore':
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(folder_path, f"{index_name}.faiss"), io_flags)
+        docstore = ColumnarDocstore(os.path.join(folder_path, DOCSTORE_DIR_NAME))
+        if index.ntotal != len(docstore):
+            raise ValueError(f"Vector index ({index.ntotal} entries) and docstore ({len(docstore)} entries) in "
+                             f"{folder_path} are out of sync, rebuild the index")
+        return cls(embeddings, index, docstore, read_only=mmap)
+
+    @staticmethod
+    def exists(folder_path: str) -> bool:
+        return os.path.exists(os.path.join(folder_path, INDEX_FILE_NAME)) and \
+            saved_format_version(os.path.join(folder_path, DOCSTORE_DIR_NAME)) == FORMAT_VERSION